@@ -5,6 +5,7 @@ import os
 # --- NEW IMPORTS FOR STEP 4 ---
 from docxtpl import DocxTemplate, RichText
 from docx.shared import Pt # Not strictly needed, but good to know for styling
+from app.utils.filenames import FilenameAllocator, release_unused
 
 # --- Configuration ---
 BASE_DIR = Path(__file__).parent.parent 
@@ -60,34 +61,22 @@ def validate_sicap_id(sicap_id):
     return 5 < len(cleaned_id) < 12
 
 # --- NEW HELPER FUNCTION FOR STEP 5 ---
-def get_unique_filepath(directory, filename):
+def get_unique_filepath(directory, filename, allocator=None):
     """
     Checks if a file exists. If so, appends a version number (_v1, _v2).
     
     Args:
         directory (Path): The folder to save the file in.
         filename (str): The desired base filename (e.g., "DA12345.docx").
+        allocator (FilenameAllocator): Optional allocator for 'directory',
+            re-used across calls so the folder is only listed once.
         
     Returns:
-        Path: A unique file path.
+        Path: A unique file path (already created empty, so it is ours).
     """
-    # Create the full path: directory / filename
-    # .stem gets the name without extension ("DA12345")
-    # .suffix gets the extension (".docx")
-    base_name = Path(filename).stem
-    extension = Path(filename).suffix
-    
-    full_path = directory / filename
-    version = 1
-    
-    # Loop as long as the file already exists
-    while full_path.exists():
-        # Create a new versioned filename
-        new_filename = f"{base_name}_v{version}{extension}"
-        full_path = directory / new_filename
-        version += 1
-        
-    return full_path
+    if allocator is None:
+        allocator = FilenameAllocator(directory, suffix_format="{stem}_v{n}{suffix}")
+    return allocator.claim(filename)
 
 def load_and_filter_data():
     # (This function is the same as Step 3)
@@ -310,6 +299,7 @@ if __name__ == "__main__":
         
         success_count = 0
         fail_count = 0
+        allocator = FilenameAllocator(PROCESSED_DIR, suffix_format="{stem}_v{n}{suffix}")
         
         # Loop through every valid row
         for index, row in enumerate(valid_rows_list):
@@ -323,13 +313,15 @@ if __name__ == "__main__":
             # --- 2. Process Template 1 ---
             try:
                 output_name_1 = f"{base_filename}.docx"
-                unique_path_1 = get_unique_filepath(PROCESSED_DIR, output_name_1)
+                unique_path_1 = get_unique_filepath(PROCESSED_DIR, output_name_1, allocator)
                 
                 print(f"  > Generating {unique_path_1.name}...")
                 success1 = generate_doc_from_template(row, TEMPLATE_1_FILE, unique_path_1)
                 
                 if success1: success_count += 1
-                else: fail_count += 1
+                else:
+                    fail_count += 1
+                    release_unused(unique_path_1)
                     
             except Exception as e:
                 print(f"  > UNEXPECTED ERROR for template 1: {e}")
@@ -338,13 +330,15 @@ if __name__ == "__main__":
             # --- 3. Process Template 2 ---
             try:
                 output_name_2 = f"{base_filename}_T2.docx"
-                unique_path_2 = get_unique_filepath(PROCESSED_DIR, output_name_2)
+                unique_path_2 = get_unique_filepath(PROCESSED_DIR, output_name_2, allocator)
                 
                 print(f"  > Generating {unique_path_2.name}...")
                 success2 = generate_doc_from_template(row, TEMPLATE_2_FILE, unique_path_2)
                 
                 if success2: success_count += 1
-                else: fail_count += 1
+                else:
+                    fail_count += 1
+                    release_unused(unique_path_2)
                     
             except Exception as e:
                 print(f"  > UNEXPECTED ERROR for template 2: {e}")
@@ -1,6 +1,8 @@
 import pandas as pd
-import re
 import os
+from app.cleaning import parse_sicap_codes
+
+# Run as a module so the app package is found: python -m app.clean_achizitii
 
 # Option 1: Look for the file in the same directory as the script
 file = 'export_achizitii_2025-10-20T12_03_21.815970182_2012.xlsx'
@@ -21,40 +23,21 @@ df = pd.read_excel(file, header=0)
 # Target column C (index 2)
 col_c = df.columns[2]
 
-# Pattern: DA, DAN, CN, SCN, or ADV followed by digits
-# This pattern will extract the valid code from anywhere in the text
-pattern = re.compile(r'(DA|DAN|CN|SCN|ADV)\d+')
-
-def extract_valid_code(value):
-    """
-    Extract valid SICAP code from a string.
-    Returns the cleaned code if found, otherwise None.
-    """
-    if pd.isna(value):
-        return None
-    
-    # Convert to string and remove all spaces
-    clean_value = str(value).replace(' ', '')
-    
-    # Try to find a valid pattern
-    match = pattern.search(clean_value)
-    if match:
-        return match.group(0)  # Return the matched valid code
-    return None
-
-# Apply extraction to column C
-df['extracted_code'] = df[col_c].apply(extract_valid_code)
+# Extract the code from column C, classify its type (DA, DAN, CN, SCN, ADV)
+# and flag repeated codes, with the same function as the workflow's
+# cleaning step (app/cleaning.py), so the two cannot drift apart.
+parsed = parse_sicap_codes(df[col_c])
+parsed.index = df.index
 
 # Separate valid (where we found a code) and invalid (no code found)
-valid_df = df[df['extracted_code'].notna()].copy()
-invalid_df = df[df['extracted_code'].isna()].copy()
-
-# Update column C in valid_df with the cleaned extracted code
-valid_df[col_c] = valid_df['extracted_code']
+found = parsed['code'].notna()
+valid_df = df[found].copy()
+invalid_df = df[~found].copy()
 
-# Drop the temporary extraction column from both dataframes
-valid_df = valid_df.drop(columns=['extracted_code'])
-invalid_df = invalid_df.drop(columns=['extracted_code'])
+# Update column C in valid_df with the cleaned extracted code, and add its type
+valid_df[col_c] = parsed.loc[found, 'code']
+valid_df['id_type'] = parsed.loc[found, 'id_type'].astype(str)
+valid_df['duplicate'] = parsed.loc[found, 'duplicate']
 
 # Save results
 valid_df.to_excel('valid_codes.xlsx', index=False)
@@ -62,4 +45,6 @@ invalid_df.to_excel('invalid_codes.xlsx', index=False)
 
 print(f"Processing complete!")
 print(f"Valid entries (cleaned): {len(valid_df)}")
+print(f"  by type: {valid_df['id_type'].value_counts().to_dict()}")
+print(f"  repeating an earlier code: {int(valid_df['duplicate'].sum())}")
 print(f"Invalid entries (no valid code found): {len(invalid_df)}")
@@ -1,7 +1,8 @@
 # app/cleaning.py
 import pandas as pd
-import re
-import os
+from openpyxl import Workbook, load_workbook
+from app.database.db_manager import AcquisitionStore
+from app.database.models import SICAP_ID_TYPES
 from app.utils.config import (
     INPUT_FILE_PATH, 
     VALID_FILE_PATH, 
@@ -9,14 +10,70 @@ from app.utils.config import (
     PROCESSED_DIR,
     SICAP_ID_HEADER,
     VALID_CODES_WITH_CUI_PATH,
-    VALID_CODES_NO_CUI_PATH
+    VALID_CODES_NO_CUI_PATH,
+    ACQUISITION_DB_PATH,
+    INTERMEDIATE_FORMAT,
+    EXPORT_EXCEL,
 )
+from app.utils.tables import table_path, write_table
+
+# Pattern: DA, DAN, CN, SCN, or ADV followed by digits ('code' is the whole match, 'id_type' its prefix)
+SICAP_CODE_PATTERN = r'(?P<code>(?P<id_type>DA|DAN|CN|SCN|ADV)\d+)'
+
+# Rows are read and cleaned in chunks of this size
+CLEAN_CHUNK_SIZE = 5000
+
+
+def parse_sicap_codes(values, seen=None):
+    """
+    Vectorized extraction and classification for a list/Series of raw cell values.
+    Returns a DataFrame with, per value:
+      - 'code': the valid code, or NaN where none was found
+      - 'id_type': its type (categorical, one of SICAP_ID_TYPES)
+      - 'duplicate': True if the code already appeared earlier
+    'seen' (a set) carries the codes of the previous chunks; it is updated.
+    """
+    series = pd.Series(values, dtype=object)
+    text = series.where(series.notna(), "").astype(str).str.replace(' ', '', regex=False)
+    parsed = text.str.extract(SICAP_CODE_PATTERN)
+    parsed['id_type'] = pd.Categorical(parsed['id_type'], categories=SICAP_ID_TYPES)
+    found = parsed['code'].notna()
+    duplicate = parsed['code'].duplicated() & found
+    if seen is not None:
+        duplicate |= parsed['code'].isin(seen) & found
+        seen.update(parsed.loc[found, 'code'])
+    parsed['duplicate'] = duplicate
+    return parsed
+
+
+def extract_sicap_codes(values):
+    """
+    Vectorized code extraction for a list/Series of raw cell values.
+    Returns a Series with the valid code, or NaN where none was found.
+    """
+    return parse_sicap_codes(values)['code']
+
+
+def _iter_chunks(rows, size):
+    """Groups an iterator of rows into lists of 'size' rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 def clean_excel_file():
     """
     Reads the raw Excel file, cleans the SICAP ID column,
-    and saves the results into 'valid_codes.xlsx' and 'invalid_codes.xlsx'
-    inside the 'processed' folder.
+    and imports the valid rows into the acquisition store (replacing the
+    previous run). Invalid rows are saved to 'invalid_codes.xlsx' inside
+    the 'processed' folder.
+    The file is streamed (openpyxl read-only / write-only mode), so large
+    yearly exports never have to fit in memory as a DataFrame.
     """
     print("--- Step 1: Cleaning Raw Excel File ---")
     
@@ -30,61 +87,84 @@ def clean_excel_file():
         return False
     
     try:
-        df = pd.read_excel(INPUT_FILE_PATH, header=0)
-        print(f"Successfully loaded {INPUT_FILE_PATH.name}")
+        source_wb = load_workbook(INPUT_FILE_PATH, read_only=True, data_only=True)
+        rows = source_wb.active.iter_rows(values_only=True)
+        header = list(next(rows, []))
+        print(f"Successfully opened {INPUT_FILE_PATH.name}")
     except Exception as e:
         print(f"Error loading Excel file: {e}")
         return False
         
     # 3. Find the target column ('Nr. anunt SICAP')
-    if SICAP_ID_HEADER not in df.columns:
+    if SICAP_ID_HEADER not in header:
         # Fallback to Column C (index 2) if header is not found
-        if len(df.columns) > 2:
-            col_target = df.columns[2]
-            print(f"Warning: '{SICAP_ID_HEADER}' not found. Using Column C ('{col_target}') instead.")
+        if len(header) > 2:
+            col_index = 2
+            print(f"Warning: '{SICAP_ID_HEADER}' not found. Using Column C ('{header[col_index]}') instead.")
         else:
             print(f"Error: Column '{SICAP_ID_HEADER}' not found and file has < 3 columns.")
+            source_wb.close()
             return False
     else:
-        col_target = SICAP_ID_HEADER
-
-    # 4. Define the cleaning regex pattern
-    pattern = re.compile(r'(DA|DAN|CN|SCN|ADV)\d+')
-
-    def extract_valid_code(value):
-        if pd.isna(value):
-            return None
-        
-        # Convert to string and remove all spaces
-        clean_value = str(value).replace(' ', '')
-        
-        match = pattern.search(clean_value)
-        if match:
-            return match.group(0) # Return the matched valid code
-        return None
+        col_index = header.index(SICAP_ID_HEADER)
 
-    # 5. Apply cleaning logic
-    df['extracted_code'] = df[col_target].apply(extract_valid_code)
+    # 4. Prepare the store and the invalid rows workbook (rows are added as we go).
+    # The import is one transaction, committed only once every row was read.
+    store = AcquisitionStore()
+    store.start_import(header)
+    columns = [str(column) for column in header]
+    invalid_wb = Workbook(write_only=True)
+    invalid_ws = invalid_wb.create_sheet()
+    invalid_ws.append(header)
 
-    # 6. Separate valid and invalid rows
-    valid_df = df[df['extracted_code'].notna()].copy()
-    invalid_df = df[df['extracted_code'].isna()].copy()
-    
-    if not valid_df.empty:
-        # Update target column with the cleaned code
-        valid_df[col_target] = valid_df['extracted_code']
-    
-    # Drop the temporary column
-    valid_df = valid_df.drop(columns=['extracted_code'])
-    invalid_df = invalid_df.drop(columns=['extracted_code'])
+    # 5. Clean the rows chunk by chunk
+    valid_count = 0
+    invalid_count = 0
+    duplicate_count = 0
+    type_counts = pd.Series(0, index=SICAP_ID_TYPES)
+    seen_codes = set()
+    try:
+        # Skip completely empty rows (same as pd.read_excel)
+        data_rows = (row for row in rows if any(value is not None for value in row))
+        for chunk in _iter_chunks(data_rows, CLEAN_CHUNK_SIZE):
+            parsed = parse_sicap_codes(
+                [row[col_index] if col_index < len(row) else None for row in chunk],
+                seen=seen_codes,
+            )
+            valid_records = []
+            for row, code, id_type, duplicate in zip(
+                chunk, parsed['code'], parsed['id_type'], parsed['duplicate']
+            ):
+                if pd.isna(code):
+                    invalid_ws.append(row)
+                    invalid_count += 1
+                else:
+                    # Update target column with the cleaned code
+                    row = list(row) + [None] * (len(columns) - len(row))
+                    row[col_index] = code
+                    valid_records.append((code, id_type, bool(duplicate), dict(zip(columns, row))))
+            store.add_acquisitions(valid_records)
+            valid_count += len(valid_records)
+            duplicate_count += int(parsed['duplicate'].sum())
+            type_counts += parsed['id_type'].value_counts().reindex(SICAP_ID_TYPES, fill_value=0)
+        store.finish_import()
+    except Exception as e:
+        store.cancel_import()
+        print(f"Error reading Excel file: {e}")
+        print("  > The acquisition store was left as it was before this import.")
+        return False
+    finally:
+        source_wb.close()
+        store.close()
 
-    # 7. Save results to the 'processed' folder
+    # 6. Save the invalid rows to the 'processed' folder
     try:
-        valid_df.to_excel(VALID_FILE_PATH, index=False)
-        print(f"  > Saved {len(valid_df)} valid rows to: {VALID_FILE_PATH}")
+        print(f"  > Imported {valid_count} valid rows into: {ACQUISITION_DB_PATH}")
+        types = ", ".join(f"{id_type}={count}" for id_type, count in type_counts.items() if count)
+        print(f"  > Code types: {types or 'none'}; {duplicate_count} rows repeat an earlier code")
         
-        invalid_df.to_excel(INVALID_FILE_PATH, index=False)
-        print(f"  > Saved {len(invalid_df)} invalid rows to: {INVALID_FILE_PATH}")
+        invalid_wb.save(INVALID_FILE_PATH)
+        print(f"  > Saved {invalid_count} invalid rows to: {INVALID_FILE_PATH}")
         
         print("--- Cleaning Step Complete ---")
         return True
@@ -96,55 +176,73 @@ def clean_excel_file():
 
 def split_valid_codes_by_cui():
     """
-    Reads the 'valid_codes.xlsx' file (after SICAP scraping).
-    Splits it into two new files:
-    1. 'valid_codes_with_cui.xlsx': A new file with rows that have a CUI.
-    2. 'valid_codes_no_cui.xlsx': A new file with rows that DO NOT have a CUI.
+    Splits the scraped rows into rows that have a supplier CUI (these go to
+    the PNRR step) and rows that DO NOT have one.
+    The split is a query on the acquisition store, so nothing is written
+    here; export_reports() writes the two files at the end.
     """
     print("--- Step 3: Splitting Valid Codes by CUI ---")
-    
-    # --- FIX 1: Check for the INPUT file (VALID_FILE_PATH) ---
-    if not VALID_FILE_PATH.exists():
-        print(f"Error: Input file not found at: {VALID_FILE_PATH}")
-        print("Please ensure Step 1 (Cleaning) and Step 2 (Scraping) ran successfully.")
-        return False
 
+    store = AcquisitionStore()
     try:
-        # --- FIX 2: Read from the INPUT file (VALID_FILE_PATH) ---
-        df = pd.read_excel(VALID_FILE_PATH, header=0)
-        print(f"Successfully loaded {VALID_FILE_PATH.name}")
-    except Exception as e:
-        print(f"Error loading Excel file: {e}")
-        return False
+        if store.count_acquisitions() == 0:
+            print("Error: The acquisition store is empty.")
+            print("Please ensure Step 1 (Cleaning) and Step 2 (Scraping) ran successfully.")
+            return False
+
+        pending = len(store.sicap_ids_to_scrape())
+        if pending:
+            print(f"  > Warning: {pending} SICAP IDs have no (final) scraping result yet.")
 
-    # 2. Check for the 'Ofertant CUI' column
+        df = store.load_rows()
+    finally:
+        store.close()
+
+    # 'Ofertant CUI' is created during the scraping step
     if 'Ofertant CUI' not in df.columns:
-         # --- FIX 3: Refer to the correct file in the error message ---
-        print(f"Error: Column 'Ofertant CUI' not found in {VALID_FILE_PATH}.")
+        print("Error: Column 'Ofertant CUI' not found.")
         print("This column should have been created during the scraping step.")
         return False
-        
-    # 3. Create boolean masks for splitting
-    # pd.isna() correctly handles both None and np.nan
-    mask_no_cui = df['Ofertant CUI'].isna()
-    mask_with_cui = df['Ofertant CUI'].notna()
 
-    df_no_cui = df[mask_no_cui].copy()
-    df_with_cui = df[mask_with_cui].copy()
+    with_cui_count = int(df['Ofertant CUI'].notna().sum())
+    print(f"  > {with_cui_count} rows WITH CUI (sent to the PNRR step).")
+    print(f"  > {len(df) - with_cui_count} rows WITH NO CUI.")
+    print("--- CUI Splitting Step Complete ---")
+    return True
 
-    # 4. Save the two new files
+
+def export_reports(excel=EXPORT_EXCEL):
+    """
+    Writes the reports from the acquisition store:
+    1. 'valid_codes': every valid row with the scraped SICAP data.
+    2. 'valid_codes_with_cui': rows with a CUI, plus the PNRR data.
+    3. 'valid_codes_no_cui': rows that DO NOT have a CUI.
+    Each one is always written as a typed INTERMEDIATE_FORMAT table; the
+    .xlsx files only if 'excel' is True (EXPORT_EXCEL=1).
+    """
+    print("--- Exporting Reports ---")
+
+    store = AcquisitionStore()
     try:
-        # --- FIX 4: Save to the correct OUTPUT file (VALID_CODES_WITH_CUI_PATH) ---
-        df_with_cui.to_excel(VALID_CODES_WITH_CUI_PATH, index=False)
-        print(f"  > Saved {len(df_with_cui)} rows WITH CUI to: {VALID_CODES_WITH_CUI_PATH}")
-        
-        # Save the file WITH NO CUI (to the new path)
-        df_no_cui.to_excel(VALID_CODES_NO_CUI_PATH, index=False)
-        print(f"  > Saved {len(df_no_cui)} rows WITH NO CUI to: {VALID_CODES_NO_CUI_PATH}")
-        
-        print("--- CUI Splitting Step Complete ---")
+        reports = [
+            (VALID_FILE_PATH, store.load_rows()),
+            (VALID_CODES_WITH_CUI_PATH, store.load_rows(with_cui=True)),
+            (VALID_CODES_NO_CUI_PATH, store.load_rows(with_cui=False)),
+        ]
+    finally:
+        store.close()
+
+    try:
+        for path, df in reports:
+            table = table_path(path, INTERMEDIATE_FORMAT)
+            write_table(df, table)
+            print(f"  > Saved {len(df)} rows to: {table}")
+            if excel:
+                df.to_excel(path, index=False)
+                print(f"  > Saved {len(df)} rows to: {path}")
+        if not excel:
+            print("  > Excel reports skipped (set EXPORT_EXCEL=1 in .env to write them).")
         return True
-        
     except Exception as e:
-        print(f"Error saving split files: {e}")
-        return False
\ No newline at end of file
+        print(f"Error saving reports: {e}")
+        return False
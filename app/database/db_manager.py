@@ -0,0 +1,490 @@
+# app/database/db_manager.py
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+
+from app.database.models import ACQUISITION_SCHEMA, RUN_TABLES, PNRR_COLUMNS, ROW_DTYPES, SICAP_ID_TYPES
+from app.utils.tables import apply_schema
+from app.utils.config import (
+    ACQUISITION_DB_PATH,
+    SICAP_CACHE_PATH,
+    SICAP_CACHE_TTL_DAYS,
+    SICAP_CACHE_NEGATIVE_TTL_DAYS,
+    COMPANY_CACHE_PATH,
+    COMPANY_CACHE_TTL_DAYS,
+    DOC_MANIFEST_PATH,
+)
+
+
+def _to_json(data):
+    """Converts a scraped dict to JSON (pd.NA / NaN become null)."""
+    clean = {key: (None if pd.isna(value) else value) for key, value in data.items()}
+    return json.dumps(clean, ensure_ascii=False, default=str)
+
+
+def _from_json(text):
+    """Converts JSON back to a scraped dict (null becomes pd.NA)."""
+    return {key: (pd.NA if value is None else value) for key, value in json.loads(text).items()}
+
+
+def is_negative_result(data):
+    """A result is 'negative' if it has no SEAP URL (e.g. '0 results found')."""
+    return not str(data.get('seap_url', '')).startswith('http')
+
+
+class LookupCache:
+    """
+    Persistent cache of SICAP lookup results, keyed by SICAP ID.
+
+    Entries expire after a TTL that depends on the ID type (see
+    SICAP_CACHE_TTL_DAYS); negative results get a much shorter TTL and can
+    be ignored completely with 'refresh_negative=True'.
+    Hit/miss counters are kept in 'self.stats'.
+    """
+    def __init__(self, db_path=SICAP_CACHE_PATH, ttl_days=None,
+                 negative_ttl_days=SICAP_CACHE_NEGATIVE_TTL_DAYS, refresh_negative=False):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(exist_ok=True)
+        self.ttl_days = ttl_days if ttl_days is not None else SICAP_CACHE_TTL_DAYS
+        self.negative_ttl_days = negative_ttl_days
+        self.refresh_negative = refresh_negative
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'negative_refreshed': 0, 'stored': 0}
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sicap_cache (
+                sicap_id   TEXT PRIMARY KEY,
+                id_type    TEXT,
+                data       TEXT NOT NULL,
+                negative   INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _ttl_seconds(self, id_type, negative):
+        days = self.negative_ttl_days if negative else self.ttl_days.get(id_type, 0)
+        return days * 24 * 3600
+
+    def get(self, sicap_id, id_type):
+        """Returns the cached dict for a SICAP ID, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, negative, fetched_at FROM sicap_cache WHERE sicap_id = ?", (sicap_id,)
+            ).fetchone()
+
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+
+            data, negative, fetched_at = row
+            if negative and self.refresh_negative:
+                self.stats['negative_refreshed'] += 1
+                self.stats['misses'] += 1
+                return None
+            if time.time() - fetched_at > self._ttl_seconds(id_type, negative):
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+
+            self.stats['hits'] += 1
+        return _from_json(data)
+
+    def put(self, sicap_id, id_type, data):
+        """Stores (or refreshes) the result for one SICAP ID."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sicap_cache (sicap_id, id_type, data, negative, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sicap_id, id_type, _to_json(data), int(is_negative_result(data)), time.time()),
+            )
+            self.conn.commit()
+            self.stats['stored'] += 1
+
+    def invalidate(self, sicap_id=None, negative_only=False):
+        """
+        Removes cache entries: one ID, all negative results, or everything.
+        Returns the number of removed entries.
+        """
+        with self.lock:
+            if sicap_id is not None:
+                cursor = self.conn.execute("DELETE FROM sicap_cache WHERE sicap_id = ?", (sicap_id,))
+            elif negative_only:
+                cursor = self.conn.execute("DELETE FROM sicap_cache WHERE negative = 1")
+            else:
+                cursor = self.conn.execute("DELETE FROM sicap_cache")
+            self.conn.commit()
+            return cursor.rowcount
+
+    def print_stats(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = (100.0 * self.stats['hits'] / lookups) if lookups else 0.0
+        print(f"  > SICAP cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+              f"({hit_rate:.1f}% hit rate), {self.stats['expired']} expired, "
+              f"{self.stats['negative_refreshed']} negative refreshed, {self.stats['stored']} stored.")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CompanyStore:
+    """
+    Persistent store of PNRR company pages, keyed by the cleaned CUI.
+    Holds (beneficiaries, url, denumire) so a supplier that appears on many
+    acquisitions - in this run or a later one - is only scraped once.
+    """
+    def __init__(self, db_path=COMPANY_CACHE_PATH, ttl_days=COMPANY_CACHE_TTL_DAYS):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(exist_ok=True)
+        self.ttl_days = ttl_days
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS companies (
+                cui           TEXT PRIMARY KEY,
+                beneficiaries TEXT,
+                url           TEXT,
+                denumire      TEXT,
+                fetched_at    REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get(self, cui):
+        """Returns (beneficiaries, url, denumire) or None if missing/expired."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT beneficiaries, url, denumire, fetched_at FROM companies WHERE cui = ?", (cui,)
+            ).fetchone()
+        if row is None:
+            return None
+        beneficiaries, url, denumire, fetched_at = row
+        if time.time() - fetched_at > self.ttl_days * 24 * 3600:
+            return None
+        return (pd.NA if beneficiaries is None else beneficiaries), url, denumire
+
+    def put(self, cui, beneficiaries, url, denumire):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO companies (cui, beneficiaries, url, denumire, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cui, None if pd.isna(beneficiaries) else beneficiaries, url, denumire, time.time()),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class DocumentManifest:
+    """
+    Records every generated document: the hash of the row context it was
+    rendered from, the hash of its template and where it was saved.
+    Keyed by a stable document key (see doc_generator.document_key()), so
+    the next run can skip documents whose inputs did not change.
+    """
+    def __init__(self, db_path=DOC_MANIFEST_PATH):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_key       TEXT PRIMARY KEY,
+                template      TEXT,
+                context_hash  TEXT NOT NULL,
+                template_hash TEXT NOT NULL,
+                output_path   TEXT NOT NULL,
+                rendered_at   TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get(self, doc_key):
+        """Returns (context_hash, template_hash, output_path) or None."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT context_hash, template_hash, output_path FROM documents WHERE doc_key = ?", (doc_key,)
+            ).fetchone()
+
+    def put_many(self, entries):
+        """Stores (doc_key, template, context_hash, template_hash, output_path) tuples in one commit."""
+        rendered_at = datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO documents "
+                "(doc_key, template, context_hash, template_hash, output_path, rendered_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(*entry, rendered_at) for entry in entries],
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class AcquisitionStore:
+    """
+    Local SQLite store of the current run: the valid acquisitions of the
+    export and everything the workflow steps find out about them (schema
+    in app/database/models.py).
+
+    Each step asks only for the rows it still has to process and saves
+    every result as soon as it has it, so a crashed step resumes where it
+    stopped. Excel is only used to import the export (step 1) and for the
+    reports (load_rows()).
+    Safe to use from several threads (driver pool, API worker threads).
+    """
+    def __init__(self, db_path=ACQUISITION_DB_PATH):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(ACQUISITION_SCHEMA)
+        self._migrate()
+        self.conn.commit()
+
+    def _migrate(self):
+        """Adds the columns of newer versions to a store created by an older one."""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(acquisitions)")}
+        if 'id_type' not in columns:
+            self.conn.execute("ALTER TABLE acquisitions ADD COLUMN id_type TEXT")
+            # Longest types first, so a DAN code is not taken for a DA one
+            for id_type in sorted(SICAP_ID_TYPES, key=len, reverse=True):
+                self.conn.execute(
+                    "UPDATE acquisitions SET id_type = ? WHERE id_type IS NULL AND sicap_id LIKE ?",
+                    (id_type, id_type + '%'),
+                )
+        if 'duplicate' not in columns:
+            self.conn.execute("ALTER TABLE acquisitions ADD COLUMN duplicate INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute(
+                "UPDATE acquisitions SET duplicate = 1 "
+                "WHERE row_id NOT IN (SELECT MIN(row_id) FROM acquisitions GROUP BY sicap_id)"
+            )
+
+    # --- Step 1: import ---
+
+    def start_import(self, header):
+        """
+        Empties the store for a new export with the given column names.
+        The import is one transaction: nothing changes for the other steps
+        until finish_import(), and cancel_import() keeps the previous run.
+        """
+        with self.lock:
+            for table in RUN_TABLES:
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute(
+                "INSERT INTO import_info (key, value) VALUES ('header', ?)",
+                (json.dumps([str(column) for column in header], ensure_ascii=False),),
+            )
+
+    def add_acquisitions(self, records):
+        """Appends (sicap_id, id_type, duplicate, {column: value}) records, in export order."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO acquisitions (sicap_id, id_type, duplicate, data) VALUES (?, ?, ?, ?)",
+                [(sicap_id, id_type, int(duplicate), _to_json(data))
+                 for sicap_id, id_type, duplicate, data in records],
+            )
+
+    def finish_import(self):
+        """Commits the import started by start_import()."""
+        with self.lock:
+            self.conn.commit()
+
+    def cancel_import(self):
+        """Rolls back the import started by start_import() (the previous run stays)."""
+        with self.lock:
+            self.conn.rollback()
+
+    def count_acquisitions(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM acquisitions").fetchone()[0]
+
+    # --- Step 2: SICAP scraping ---
+
+    def acquisitions_to_scrape(self):
+        """
+        (sicap_id, id_type) of the SICAP IDs (in export order) with no result
+        yet, or only a temporary failure. The type comes from the cleaning step.
+        """
+        with self.lock:
+            return self.conn.execute(
+                """
+                SELECT a.sicap_id, MIN(a.id_type) FROM acquisitions a
+                LEFT JOIN scrape_results s ON s.sicap_id = a.sicap_id
+                WHERE s.sicap_id IS NULL OR s.retryable = 1
+                GROUP BY a.sicap_id
+                ORDER BY MIN(a.row_id)
+                """
+            ).fetchall()
+
+    def sicap_ids_to_scrape(self):
+        """SICAP IDs (in export order) with no result yet, or only a temporary failure."""
+        return [sicap_id for sicap_id, _ in self.acquisitions_to_scrape()]
+
+    def save_scrape_result(self, sicap_id, id_type, data, retryable=False):
+        """Stores (or replaces) the scraped data of one SICAP ID and commits it."""
+        raw_cui = data.get('Ofertant CUI')
+        cui = re.sub(r'[^0-9]', '', str(raw_cui)) if not pd.isna(raw_cui) else ''
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scrape_results "
+                "(sicap_id, id_type, ofertant_cui, retryable, data, scraped_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (sicap_id, id_type, cui or None, int(retryable), _to_json(data), _now()),
+            )
+            self.conn.commit()
+
+    # --- Step 4: PNRR beneficiaries ---
+
+    def companies_to_scrape(self):
+        """
+        Supplier CUIs whose company page is missing or failed. A page that
+        loaded without beneficiaries (beneficiari_reali NULL) is finished.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT DISTINCT s.ofertant_cui FROM scrape_results s
+                LEFT JOIN companies c ON c.cui = s.ofertant_cui
+                WHERE s.ofertant_cui IS NOT NULL
+                  AND (c.cui IS NULL OR c.beneficiari_reali = 'SCRAPE FAILED' OR c.url IS NULL)
+                ORDER BY s.ofertant_cui
+                """
+            ).fetchall()
+        return [cui for (cui,) in rows]
+
+    def acquisitions_to_search(self):
+        """SICAP IDs with a supplier CUI and no PNRR acquisition URL yet."""
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT s.sicap_id FROM scrape_results s
+                LEFT JOIN acquisition_urls u ON u.sicap_id = s.sicap_id
+                WHERE s.ofertant_cui IS NOT NULL AND u.sicap_id IS NULL
+                ORDER BY s.sicap_id
+                """
+            ).fetchall()
+        return [sicap_id for (sicap_id,) in rows]
+
+    def ofertant_names(self, cui):
+        """The distinct 'Ofertant' names SICAP gave for a supplier CUI."""
+        with self.lock:
+            rows = self.conn.execute("SELECT data FROM scrape_results WHERE ofertant_cui = ?", (cui,)).fetchall()
+        names = {_from_json(data).get('Ofertant') for (data,) in rows}
+        return sorted(str(name) for name in names if not pd.isna(name))
+
+    def save_company(self, cui, beneficiari_reali, url, denumire):
+        """Stores a company page; the beneficiary names are also stored one per row."""
+        beneficiari_reali = None if pd.isna(beneficiari_reali) else beneficiari_reali
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO companies (cui, denumire, beneficiari_reali, url, scraped_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cui, denumire or None, beneficiari_reali, url, _now()),
+            )
+            self.conn.execute("DELETE FROM beneficiaries WHERE cui = ?", (cui,))
+            if beneficiari_reali and beneficiari_reali != 'SCRAPE FAILED':
+                names = {name.strip() for name in beneficiari_reali.split(',') if name.strip()}
+                self.conn.executemany(
+                    "INSERT INTO beneficiaries (cui, name) VALUES (?, ?)", [(cui, name) for name in names]
+                )
+            self.conn.commit()
+
+    def save_acquisition_url(self, sicap_id, url):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO acquisition_urls (sicap_id, url, scraped_at) VALUES (?, ?, ?)",
+                (sicap_id, url, _now()),
+            )
+            self.conn.commit()
+
+    def progress(self):
+        """Counters of what the steps have done so far (for the web API)."""
+        queries = {
+            'rows': "SELECT COUNT(*) FROM acquisitions",
+            'sicap_ids': "SELECT COUNT(DISTINCT sicap_id) FROM acquisitions",
+            'duplicates': "SELECT COUNT(*) FROM acquisitions WHERE duplicate = 1",
+            'scraped': "SELECT COUNT(*) FROM scrape_results WHERE retryable = 0",
+            'companies': "SELECT COUNT(DISTINCT ofertant_cui) FROM scrape_results WHERE ofertant_cui IS NOT NULL",
+            'companies_scraped': "SELECT COUNT(*) FROM companies WHERE beneficiari_reali IS NOT 'SCRAPE FAILED'",
+            'acquisitions_with_cui': "SELECT COUNT(*) FROM scrape_results WHERE ofertant_cui IS NOT NULL",
+            'acquisition_urls': "SELECT COUNT(*) FROM acquisition_urls",
+        }
+        with self.lock:
+            return {name: self.conn.execute(query).fetchone()[0] for name, query in queries.items()}
+
+    # --- Reports ---
+
+    def load_rows(self, with_cui=None):
+        """
+        Returns the rows as a DataFrame, laid out like the old Excel files:
+        the export's columns, then the scraped columns, with the column
+        types of ROW_DTYPES (identifiers such as CUIs are text).
+        with_cui=None: every row (valid_codes.xlsx).
+        with_cui=True: rows with a supplier CUI, plus the PNRR columns
+                       (valid_codes_with_cui.xlsx).
+        with_cui=False: rows without a supplier CUI (valid_codes_no_cui.xlsx).
+        """
+        with self.lock:
+            header = self.conn.execute("SELECT value FROM import_info WHERE key = 'header'").fetchone()
+            rows = self.conn.execute(
+                """
+                SELECT a.data, s.data, c.denumire, c.beneficiari_reali, c.url, u.url
+                FROM acquisitions a
+                LEFT JOIN scrape_results s ON s.sicap_id = a.sicap_id
+                LEFT JOIN companies c ON c.cui = s.ofertant_cui
+                LEFT JOIN acquisition_urls u ON u.sicap_id = a.sicap_id
+                ORDER BY a.row_id
+                """
+            ).fetchall()
+
+        records = []
+        for data, scraped, denumire, beneficiari_reali, company_url, acquisition_url in rows:
+            record = _from_json(data)
+            if scraped is not None:
+                record.update(_from_json(scraped))
+            has_cui = not pd.isna(record.get('Ofertant CUI', pd.NA))
+            if with_cui is not None and has_cui != with_cui:
+                continue
+            if with_cui:
+                # The PNRR company name replaces a different 'Ofertant' from SICAP
+                if denumire:
+                    record['Ofertant'] = denumire
+                record[PNRR_COLUMNS[0]] = pd.NA if beneficiari_reali is None else beneficiari_reali
+                record[PNRR_COLUMNS[1]] = pd.NA if company_url is None else company_url
+                record[PNRR_COLUMNS[2]] = pd.NA if acquisition_url is None else acquisition_url
+            records.append(record)
+
+        columns = json.loads(header[0]) if header else []
+        for record in records:
+            for key in record:
+                if key not in columns:
+                    columns.append(key)
+        return apply_schema(pd.DataFrame(records, columns=columns), ROW_DTYPES)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,88 @@
+# app/database/models.py
+
+# Schema of the acquisition store (see AcquisitionStore in db_manager.py).
+# It holds the data of the current run between the workflow steps; the
+# Excel files are only the input export and the final reports.
+#
+#   acquisitions     one row per valid row of the export (step 1)
+#   scrape_results   SICAP data per SICAP ID (step 2)
+#   companies        PNRR company page per supplier CUI (step 4)
+#   beneficiaries    real beneficiaries of every company (step 4)
+#   acquisition_urls PNRR acquisition details URL per SICAP ID (step 4)
+#
+# The cross-run caches (sicap_cache.sqlite, pnrr_companies.sqlite) are
+# separate and survive a new import.
+
+ACQUISITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS acquisitions (
+    row_id    INTEGER PRIMARY KEY,  -- order of the row in the export
+    sicap_id  TEXT NOT NULL,
+    id_type   TEXT,                 -- DA, DAN, CN, SCN or ADV (set by the cleaning step)
+    duplicate INTEGER NOT NULL DEFAULT 0,  -- 1 = the code is on an earlier row too
+    data      TEXT NOT NULL         -- the export's columns, as JSON
+);
+CREATE INDEX IF NOT EXISTS idx_acquisitions_sicap_id ON acquisitions (sicap_id);
+
+CREATE TABLE IF NOT EXISTS scrape_results (
+    sicap_id     TEXT PRIMARY KEY,
+    id_type      TEXT,
+    ofertant_cui TEXT,             -- supplier CUI, digits only (NULL if none)
+    retryable    INTEGER NOT NULL, -- 1 = temporary failure, scrape again
+    data         TEXT NOT NULL,    -- scraped columns (seap_url, Ofertant...), as JSON
+    scraped_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scrape_results_cui ON scrape_results (ofertant_cui);
+
+CREATE TABLE IF NOT EXISTS companies (
+    cui               TEXT PRIMARY KEY,
+    denumire          TEXT,
+    beneficiari_reali TEXT,        -- as shown in the documents ("A, B"), NULL if none, or 'SCRAPE FAILED'
+    url               TEXT,
+    scraped_at        TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS beneficiaries (
+    cui  TEXT NOT NULL REFERENCES companies (cui) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    PRIMARY KEY (cui, name)
+);
+CREATE INDEX IF NOT EXISTS idx_beneficiaries_name ON beneficiaries (name);
+
+CREATE TABLE IF NOT EXISTS acquisition_urls (
+    sicap_id   TEXT PRIMARY KEY,
+    url        TEXT NOT NULL,
+    scraped_at TEXT NOT NULL
+);
+"""
+
+# Types of SICAP codes (the letters before the number), see cleaning.parse_sicap_codes()
+SICAP_ID_TYPES = ['DA', 'DAN', 'CN', 'SCN', 'ADV']
+
+# Tables emptied when a new export is imported
+RUN_TABLES = ['beneficiaries', 'companies', 'acquisition_urls', 'scrape_results', 'acquisitions', 'import_info']
+
+# Columns added to the export by the PNRR step (in the with-CUI report)
+PNRR_COLUMNS = ['Beneficiari reali', 'Beneficiari reali URL', 'Detalii achizitie URL PNRR']
+
+# --- Column types of the intermediate tables (see app/utils/tables.py) ---
+# Columns not listed here are stored as text. Identifiers (SICAP IDs,
+# CUIs, contract numbers) are always text, so e.g. a CUI never comes back
+# as the float 4305849.0.
+ROW_DTYPES = {
+    'Nr. crt': 'Int64',
+    'Valoare integrală contract': 'Float64',
+}
+
+GENERATION_REPORT_DTYPES = {
+    'sicap_id': 'string',
+    'template': 'string',
+    'output_path': 'string',
+    'unchanged': 'boolean',
+    'success': 'boolean',
+    'error': 'string',
+}
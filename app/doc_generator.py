@@ -1,14 +1,37 @@
 # app/doc_generator.py - REFACTORED to use docxtpl
 import pandas as pd
+import numpy as np
 import re
+import os
+import io
+import json
+import hashlib
+import time
 from pathlib import Path
-from docxtpl import DocxTemplate, RichText
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from docxtpl import RichText
 from docx.shared import Pt
 from docx.enum.text import WD_COLOR_INDEX
+from app.template_cache import get_template, get_template_hash
+from app.database.db_manager import DocumentManifest, AcquisitionStore
+from app.utils.filenames import FilenameAllocator, release_unused
+from app.processing.archive_handler import DocumentArchiver
+from app.database.models import ROW_DTYPES, GENERATION_REPORT_DTYPES
+from app.utils.tables import apply_schema, read_table, write_table
+from app.utils.metrics import metrics
 from app.utils.config import (
     TEMPLATE_1_FILE,
     TEMPLATE_2_FILE,
-    GENERATED_DOCS_DIR
+    GENERATED_DOCS_DIR,
+    GENERATED_ARCHIVES_DIR,
+    PROCESSED_DIR,
+    DOC_WORKERS,
+    GENERATION_REPORT_PATH,
+    GENERATION_REPORT_XLSX_PATH,
+    EXPORT_EXCEL,
+    DOC_FORCE_REGENERATE,
+    DOC_OUTPUT_MODE,
+    DOC_ARCHIVE_GROUP_COLUMN,
 )
 
 # --- Configuration ---
@@ -30,86 +53,102 @@ PLACEHOLDER_MAP = {
 
 EMPTY_VALUE_REPLACEMENT = "[A SE COMPLETA DE OFITER]"
 
+# Jalon / Țintă number for each investment ('I-number') in the 'Apel' text
+JALON_MAP = {
+    'I5': '281',
+    'I8': '284',
+    'I9': '285',
+    'I10': '287',
+}
+
+# Legal article text for direct acquisitions, by contract value (lei, fără TVA)
+ALIN_ACHIZITIE_DIRECTA = "Alin (7) În cazul achiziţiei directe, autoritatea contractantă:"
+LITERA_ACHIZITIE_DIRECTA = {
+    'd': " d) are dreptul de a plăti direct, pe baza angajamentului legal, fără acceptarea prealabilă a unei oferte, dacă valoarea estimată a achiziţiei este mai mică de 9.000 lei, fără TVA.",
+    'c': " c) are dreptul de a achiziţiona pe baza unei singure oferte dacă valoarea estimată a achiziţiei este mai mică sau egală cu 140.000 lei, fără TVA, pentru produse şi servicii, respectiv 300.000 lei, fără TVA, pentru lucrări;",
+    'b': " b) are obligaţia de a consulta minimum trei operatori economici pentru achiziţiile a căror valoare estimată este mai mare de 140.000 lei, fără TVA, pentru produse şi servicii, respectiv 300.000 lei, fără TVA, pentru lucrări, dar mai mică sau egală cu valoarea menţionată la lit. a); dacă în urma consultării autoritatea contractantă primeşte doar o ofertă valabilă din punctul de vedere al cerinţelor solicitate, achiziţia poate fi realizată;",
+    'a': " a) are obligaţia de a utiliza catalogul electronic pus la dispoziţie de SEAP sau de a publica un anunţ într-o secţiune dedicată a website-ului propriu sau al SEAP, însoţit de descrierea produselor, serviciilor sau a lucrărilor care urmează a fi achiziţionate, pentru achiziţiile a căror valoare estimată este mai mare de 200.000 lei, fără TVA, pentru produse şi servicii, respectiv 560.000 lei, fără TVA, pentru lucrări;",
+}
+
+# Placeholders rendered as clickable links -> Excel column
+URL_PLACEHOLDERS = {
+    'beneficiari_reali_url_pnrr': 'Beneficiari reali URL',
+    'seap_url': 'seap_url',
+    'detalii_achizitie_url_pnrr': 'Detalii achizitie URL PNRR',
+}
+
 # --- Helper Functions ---
+# The context of every row is computed for the whole DataFrame at once
+# (column operations instead of per-row regexes), so rendering is the only
+# per-row work left.
 
-def get_jalon_tinta(row):
+def _column(df, col_name):
+    """The column 'col_name' as object values, or all-NA if it is missing."""
+    if col_name in df.columns:
+        return df[col_name].astype(object)
+    return pd.Series(pd.NA, index=df.index, dtype=object)
+
+
+def _text_or_empty(values):
+    """str(value) for every value; missing or "" become EMPTY_VALUE_REPLACEMENT."""
+    empty = values.isna() | (values == "")
+    return values.map(str).mask(empty, EMPTY_VALUE_REPLACEMENT)
+
+
+def parse_ron_values(values):
     """
-    Finds the 'I-number' in the 'Apel' string and maps it
-    to the corresponding Jalon / Țintă number.
+    Converts raw values like '140.000,50' (or numbers) to floats
+    (e.g., 140000.50). Empty or invalid values become 0.0.
     """
-    JALON_MAP = {
-        'I5': '281',
-        'I8': '284',
-        'I9': '285',
-        'I10': '287',
-    }
-    
-    apel_text = row.get('Apel')
-    if pd.isna(apel_text):
-        return None
-    
-    match = re.search(r'\b(I5|I8|I9|I10)\b', str(apel_text))
-    if match:
-        i_code = match.group(1)
-        return JALON_MAP[i_code]
-    else:
-        return None
+    is_number = values.map(lambda value: isinstance(value, (int, float)))
+    numbers = pd.to_numeric(values.where(is_number), errors='coerce')
 
+    text = values.where(~is_number).dropna().astype(str)
+    text = (
+        text.str.replace('.', '', regex=False)
+        .str.replace(',', '.', regex=False)
+        .str.replace(r"[^0-9.]", "", regex=True)
+    )
+    parsed = pd.to_numeric(text, errors='coerce').reindex(values.index)
 
-def _clean_value_to_float(raw_text):
+    return numbers.fillna(parsed).fillna(0.0).astype(float)
+
+
+def get_jalon_tinta(df):
     """
-    Converts a raw string value like '140.000,50' or None
-    into a float (e.g., 140000.50).
-    Returns 0.0 if the value is empty or invalid.
+    Finds the 'I-number' in the 'Apel' column and maps it to the
+    corresponding Jalon / Țintă number (NA if there is none).
     """
-    if pd.isna(raw_text):
-        return 0.0
-    if isinstance(raw_text, (int, float)):
-        return float(raw_text)
-    try:
-        text = str(raw_text)
-        text = text.replace('.', '')
-        text = text.replace(',', '.')
-        text = re.sub(r"[^0-9.]", "", text)
-        if not text:
-            return 0.0
-        return float(text)
-    except (ValueError, TypeError):
-        return 0.0
+    apel = _column(df, 'Apel').fillna('').astype(str)
+    i_code = apel.str.extract(r'\b(I5|I8|I9|I10)\b', expand=False)
+    return i_code.map(JALON_MAP)
 
 
-def get_articol_de_lege(row):
+def get_articol_de_lege(df):
     """
-    Determines the correct legal article text based on the SICAP ID
-    and the contract value.
+    Determines the legal article text of every row based on the SICAP ID
+    and the contract value (NA if the ID type has no article).
     """
-    sicap_id = str(row.get('Nr. anunt SICAP', '')).strip().upper()
-    alin_text = ""
-    litera_text = ""
-    
-    if sicap_id.startswith(('DA', 'DAN', 'ADV')):
-        alin_text = "Alin (7) În cazul achiziţiei directe, autoritatea contractantă:"
-        valoare = _clean_value_to_float(row.get('Valoare cumparare directa'))
-        
-        if valoare <= 9000:
-            litera_text = " d) are dreptul de a plăti direct, pe baza angajamentului legal, fără acceptarea prealabilă a unei oferte, dacă valoarea estimată a achiziţiei este mai mică de 9.000 lei, fără TVA."
-        elif 9000 < valoare <= 140000:
-            litera_text = " c) are dreptul de a achiziţiona pe baza unei singure oferte dacă valoarea estimată a achiziţiei este mai mică sau egală cu 140.000 lei, fără TVA, pentru produse şi servicii, respectiv 300.000 lei, fără TVA, pentru lucrări;"
-        elif 140000 < valoare <= 200000:
-            litera_text = " b) are obligaţia de a consulta minimum trei operatori economici pentru achiziţiile a căror valoare estimată este mai mare de 140.000 lei, fără TVA, pentru produse şi servicii, respectiv 300.000 lei, fără TVA, pentru lucrări, dar mai mică sau egală cu valoarea menţionată la lit. a); dacă în urma consultării autoritatea contractantă primeşte doar o ofertă valabilă din punctul de vedere al cerinţelor solicitate, achiziţia poate fi realizată;"
-        elif valoare > 200000:
-            litera_text = " a) are obligaţia de a utiliza catalogul electronic pus la dispoziţie de SEAP sau de a publica un anunţ într-o secţiune dedicată a website-ului propriu sau al SEAP, însoţit de descrierea produselor, serviciilor sau a lucrărilor care urmează a fi achiziţionate, pentru achiziţiile a căror valoare estimată este mai mare de 200.000 lei, fără TVA, pentru produse şi servicii, respectiv 560.000 lei, fără TVA, pentru lucrări;"
-    
-    elif sicap_id.startswith(('CN', 'CAN')):
-        alin_text = " alin. (1)"
-    
-    elif sicap_id.startswith(('SCN', 'SCNA')):
-        alin_text = " alin. (2)"
-    
-    else:
-        return None
-    
-    return (alin_text + "\n" + litera_text)
+    sicap_ids = _column(df, 'Nr. anunt SICAP').fillna('').astype(str).str.strip().str.upper()
+    is_direct = sicap_ids.str.startswith(('DA', 'DAN', 'ADV'))
+    is_cn = ~is_direct & sicap_ids.str.startswith(('CN', 'CAN'))
+    is_scn = ~is_direct & ~is_cn & sicap_ids.str.startswith(('SCN', 'SCNA'))
+
+    valoare = parse_ron_values(_column(df, 'Valoare cumparare directa'))
+    litera = pd.Series(
+        np.select(
+            [valoare <= 9000, valoare <= 140000, valoare <= 200000],
+            [LITERA_ACHIZITIE_DIRECTA['d'], LITERA_ACHIZITIE_DIRECTA['c'], LITERA_ACHIZITIE_DIRECTA['b']],
+            default=LITERA_ACHIZITIE_DIRECTA['a'],
+        ),
+        index=df.index,
+    )
+
+    articol = pd.Series(pd.NA, index=df.index, dtype=object)
+    articol[is_direct] = ALIN_ACHIZITIE_DIRECTA + "\n" + litera[is_direct]
+    articol[is_cn] = " alin. (1)\n"
+    articol[is_scn] = " alin. (2)\n"
+    return articol
 
 
 def sanitize_filename(text):
@@ -119,21 +158,21 @@ def sanitize_filename(text):
     return re.sub(r'[\\/*?:"<>|]', '_', str(text).strip())
 
 
-def get_unique_filename(row, template_type, output_dir):
-    """Generate a unique filename for the output document."""
+def document_base_name(row, template_type):
+    """The output filename of a row's document, without extension or counter."""
     sicap_id = sanitize_filename(row.get('Nr. anunt SICAP'))
     numar_contract = sanitize_filename(row.get('Număr contract'))
     nume_autoritate = sanitize_filename(row.get('Denumire autoritate contractantă'))
-    
-    base_name = f"{sicap_id}_{template_type}_{numar_contract}_{nume_autoritate}"
-    final_path = output_dir / f"{base_name}.docx"
-    
-    counter = 1
-    while final_path.exists():
-        final_path = output_dir / f"{base_name}_{counter}.docx"
-        counter += 1
-    
-    return final_path
+    return f"{sicap_id}_{template_type}_{numar_contract}_{nume_autoritate}"
+
+
+def get_unique_filename(row, template_type, allocator):
+    """
+    Generate a unique filename for the output document.
+    The name is claimed through 'allocator' (a FilenameAllocator for the
+    output folder), which creates it empty so no other worker can take it.
+    """
+    return allocator.claim(f"{document_base_name(row, template_type)}.docx")
 
 def create_url_richtext(doc, url_str):
     """
@@ -148,154 +187,415 @@ def create_url_richtext(doc, url_str):
            font='Trebuchet MS', size=22)
     return rt
 
-def add_custom_placeholders(row, context):
+
+def build_contexts(df):
     """
-    Add custom computed placeholders to the context dictionary.
-    This includes logic-derived values like articol_de_lege and nr_jalon_tinta.
+    Build the context dictionary of every row of 'df' in one pass.
+    Maps Excel columns to template placeholders and adds the computed
+    placeholders (articol_de_lege, nr_jalon_tinta). All values are plain
+    strings; URLs become links only at render time (see render_context()).
     """
-    doc = context.get('_docx')
-    
-    # Add the legal article text
-    article_text = get_articol_de_lege(row)
-    context['articol_de_lege'] = article_text if article_text else EMPTY_VALUE_REPLACEMENT
+    columns = {}
     
-    # Add the jalon/tinta number
-    jalon_text = get_jalon_tinta(row)
-    context['nr_jalon_tinta'] = jalon_text if jalon_text else EMPTY_VALUE_REPLACEMENT
-    
-    # Handle URLs with RichText for clickable links
-    url_pnrr = row.get('Beneficiari reali URL')
-    context['beneficiari_reali_url_pnrr'] = (
-        create_url_richtext(doc, str(url_pnrr).strip()) 
-        if pd.notna(url_pnrr) and str(url_pnrr).strip() 
-        else EMPTY_VALUE_REPLACEMENT
-    )
+    # Map standard placeholders
+    for placeholder, col_name in PLACEHOLDER_MAP.items():
+        columns[placeholder] = _text_or_empty(_column(df, col_name))
     
-    seap_url = row.get('seap_url')
-    context['seap_url'] = (
-        create_url_richtext(doc, str(seap_url).strip())
-        if pd.notna(seap_url) and str(seap_url).strip()
-        else EMPTY_VALUE_REPLACEMENT
-    )
+    # Add custom computed placeholders
+    columns['articol_de_lege'] = get_articol_de_lege(df).fillna(EMPTY_VALUE_REPLACEMENT)
+    columns['nr_jalon_tinta'] = get_jalon_tinta(df).fillna(EMPTY_VALUE_REPLACEMENT)
     
-    detalii_url = row.get('Detalii achizitie URL PNRR')
-    context['detalii_achizitie_url_pnrr'] = (
-        create_url_richtext(doc, str(detalii_url).strip())
-        if pd.notna(detalii_url) and str(detalii_url).strip()
-        else EMPTY_VALUE_REPLACEMENT
-    )
+    for placeholder, col_name in URL_PLACEHOLDERS.items():
+        urls = _column(df, col_name).fillna('').astype(str).str.strip()
+        columns[placeholder] = urls.mask(urls == "", EMPTY_VALUE_REPLACEMENT)
     
+    return pd.DataFrame(columns, index=df.index).to_dict('records')
+
+
+def render_context(context, template_doc):
+    """Returns a copy of 'context' with the URLs turned into clickable links of 'template_doc'."""
+    context = dict(context)
+    for placeholder in URL_PLACEHOLDERS:
+        if context[placeholder] != EMPTY_VALUE_REPLACEMENT:
+            context[placeholder] = create_url_richtext(template_doc, context[placeholder])
     return context
 
 
 def build_context_from_row(row, template_doc):
     """
-    Build the context dictionary from a DataFrame row.
-    Maps Excel columns to template placeholders.
+    Build the context dictionary from a single DataFrame row.
+    (Prefer build_contexts() for many rows.)
     """
-    context = {'_docx': template_doc}  # Store doc reference for URL building
-    
-    # Map standard placeholders
-    for placeholder, col_name in PLACEHOLDER_MAP.items():
-        value = row.get(col_name)
-        if pd.isna(value) or value == "":
-            context[placeholder] = EMPTY_VALUE_REPLACEMENT
-        else:
-            context[placeholder] = str(value)
-    
-    # Add custom computed placeholders
-    context = add_custom_placeholders(row, context)
-    
-    # Remove the _docx helper from context before rendering
-    context.pop('_docx', None)
-    
-    return context
+    context = build_contexts(pd.DataFrame([row]))[0]
+    return render_context(context, template_doc)
+
+
+def hash_context(context):
+    """
+    SHA-256 of a context from build_contexts() (URLs as plain text).
+    Two rows with the same hash produce the same document text.
+    """
+    payload = json.dumps(context, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
 
-def generate_document_from_template(template_path, row, output_path):
+def generate_document_from_template(template_path, context, output_path, timings=None):
     """
-    Generate a single document from a template and row data.
-    Uses docxtpl for robust placeholder replacement.
+    Generate a single document from a template and a row's context
+    (from build_contexts()). Uses docxtpl for robust placeholder replacement.
+    'output_path' can also be a file-like object (e.g. io.BytesIO).
+    The template is parsed once and cached (see app/template_cache.py).
+    If 'timings' is a dict, the seconds spent rendering and saving are
+    added to it as 'render' and 'io'.
     """
+    timings = timings if timings is not None else {}
     try:
-        # Load the template
-        doc = DocxTemplate(template_path)
-        
-        # Build context dictionary
-        context = build_context_from_row(row, doc)
+        started = time.perf_counter()
+        # Get a fresh copy of the (cached) template
+        doc = get_template(template_path)
         
         # Render the template with the context
-        doc.render(context)
+        doc.render(render_context(context, doc))
+        rendered = time.perf_counter()
+        timings['render'] = rendered - started
         
         # Save the document
         doc.save(output_path)
+        timings['io'] = time.perf_counter() - rendered
         return True, None
     
     except Exception as e:
         return False, str(e)
 
 
-# --- Main Orchestrator Function ---
+# --- Parallel rendering ---
+
+TEMPLATES = (('LV', TEMPLATE_1_FILE), ('RV', TEMPLATE_2_FILE))
+
+
+def _job_result(job):
+    """The result dict of a job, before rendering."""
+    return {
+        'position': job['position'],
+        'sicap_id': job['sicap_id'],
+        'template': job['template_type'],
+        'output_path': str(job['output_path']),
+        'unchanged': False,
+        # For the DocumentManifest (documents in an archive have none)
+        'doc_key': job.get('doc_key'),
+        'context_hash': job.get('context_hash'),
+    }
+
+
+def _failed_shard_results(shard, error):
+    """Results for the jobs of a shard whose worker process crashed."""
+    results = []
+    for job in shard:
+        if not job.get('in_archive'):
+            release_unused(job['output_path'])
+        result = _job_result(job)
+        result.update({'success': False, 'error': error, 'seconds': 0.0, 'timings': {}})
+        if job.get('in_archive'):
+            result['data'] = None
+        results.append(result)
+    return results
 
-def run_document_generation(excel_files: list):
+
+def _render_job(job):
     """
-    Main function to run the entire document generation process.
-    'excel_files' is a list of Path objects to process.
+    Renders one planned document. 'job' is a dict with the row context,
+    template and output path. Returns the job dict with 'success' and 'error'.
+    Documents that go into an archive are rendered in memory and returned
+    as 'data'.
+    Runs in a worker process in parallel mode; each process keeps its own
+    template cache, so the render and save times are returned as 'timings'
+    and recorded by the parent process.
     """
-    print("--- Step 5: Generating Documents (with docxtpl) ---")
+    started = time.perf_counter()
+    timings = {}
+    result = _job_result(job)
+    if job.get('in_archive'):
+        buffer = io.BytesIO()
+        success, error = generate_document_from_template(job['template_path'], job['context'], buffer, timings)
+        result['data'] = buffer.getvalue() if success else None
+    else:
+        success, error = generate_document_from_template(
+            job['template_path'], job['context'], job['output_path'], timings
+        )
+        if not success:
+            release_unused(job['output_path'])
+    result['success'] = success
+    result['error'] = error
+    result['seconds'] = time.perf_counter() - started
+    result['timings'] = timings
+    return result
+
+
+def _render_shard(shard):
+    """Renders a list of jobs in one worker process."""
+    return [_render_job(job) for job in shard]
+
+
+def render_jobs_in_processes(jobs, workers, on_result=None):
+    """
+    Shards the jobs across 'workers' processes.
+    'on_result(job, result)' is called in this process as each shard finishes.
+    Returns the results in the same order as 'jobs'.
+    """
+    # A few shards per process keeps all cores busy until the end
+    shard_count = min(len(jobs), workers * 4)
+    shards = [jobs[i::shard_count] for i in range(shard_count)]
+
+    order = {(job['position'], job['template_type']): i for i, job in enumerate(jobs)}
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_shard, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            try:
+                shard_results = future.result()
+            except Exception as e:
+                # e.g. BrokenProcessPool: only this shard's documents fail,
+                # the shards that already finished are kept
+                print(f" > A rendering process failed ({type(e).__name__}: {e})")
+                shard_results = _failed_shard_results(futures[future], str(e) or type(e).__name__)
+            if on_result is not None:
+                for result in shard_results:
+                    on_result(jobs[order[(result['position'], result['template'])]], result)
+            results.extend(shard_results)
+            print(f" > Rendered {len(results)}/{len(jobs)} documents")
+
+    results.sort(key=lambda result: order[(result['position'], result['template'])])
+    return results
+
+
+def save_generation_report(results, excel=EXPORT_EXCEL):
+    """
+    Writes the combined success/failure report to GENERATION_REPORT_PATH
+    (read by the PDF step), and to GENERATION_REPORT_XLSX_PATH if 'excel'.
+    """
+    try:
+        PROCESSED_DIR.mkdir(exist_ok=True)
+        report = pd.DataFrame(results, columns=list(GENERATION_REPORT_DTYPES) + ['position'])
+        report = apply_schema(report.drop(columns=['position']), GENERATION_REPORT_DTYPES)
+        write_table(report, GENERATION_REPORT_PATH)
+        print(f" > Report saved to: {GENERATION_REPORT_PATH}")
+        if excel:
+            report.to_excel(GENERATION_REPORT_XLSX_PATH, index=False)
+            print(f" > Report saved to: {GENERATION_REPORT_XLSX_PATH}")
+    except Exception as e:
+        print(f" > Warning: Could not save the generation report: {e}")
+
+
+def save_generation_results(results, unchanged, template_hashes, update_manifest=True):
+    """
+    Remembers the rendered documents in the DocumentManifest (so the next
+    run can skip them; 'update_manifest=False' if that is already done),
+    prints the summary and writes the generation report.
+    Returns the number of documents that failed.
+    """
+    if update_manifest:
+        manifest = DocumentManifest()
+        manifest.put_many([
+            (result['doc_key'], result['template'], result['context_hash'],
+             template_hashes[result['template']], result['output_path'])
+            for result in results if result['success'] and result.get('doc_key')
+        ])
+        manifest.close()
+
+    success_count = sum(1 for result in results if result['success'])
+    failed_count = len(results) - success_count
     
+    print(f"\n--- Document Generation Complete ---")
+    print(f" > Successfully generated: {success_count} documents")
+    print(f" > Unchanged (skipped): {len(unchanged)} documents")
+    print(f" > Failed: {failed_count} documents")
+    report = results + unchanged
+    report.sort(key=lambda result: (result['position'], result['template']))
+    save_generation_report(report)
+    return failed_count
+
+
+# --- Main Orchestrator Function ---
+
+def plan_documents(df, template_hashes, archiver=None, force=False):
+    """
+    Plans every document (LV + RV per row) with its output path.
+    Paths are claimed here, in row order, so they are the same whether the
+    documents are rendered serially, by a process pool or by Celery workers.
+    Returns (jobs to render, report rows of the unchanged documents).
+    """
+    manifest = DocumentManifest()
+    jobs = []
+    unchanged = []
+    occurrences = {}
+    allocator = FilenameAllocator(GENERATED_DOCS_DIR)
+    contexts = build_contexts(df)
+    rows = df.to_dict('records')
+    for position, (row, context) in enumerate(zip(rows, contexts)):
+        sicap_id = row.get('Nr. anunt SICAP', f'Row {position+1}')
+        context_hash = hash_context(context)
+        for template_type, template_path in TEMPLATES:
+            # Rows with the same name are told apart by their order in the file
+            base_name = document_base_name(row, template_type)
+            occurrence = occurrences.get(base_name, 0)
+            occurrences[base_name] = occurrence + 1
+            doc_key = f"{base_name}#{occurrence}"
+
+            if archiver is not None:
+                group = row.get(DOC_ARCHIVE_GROUP_COLUMN) if DOC_ARCHIVE_GROUP_COLUMN else None
+                group = sanitize_filename(group) if group is not None else None
+                jobs.append({
+                    'position': position,
+                    'sicap_id': sicap_id,
+                    'template_type': template_type,
+                    'template_path': template_path,
+                    'context': context,
+                    'output_path': archiver.reserve(group, f"{base_name}.docx"),
+                    'in_archive': True,
+                })
+                continue
+
+            previous = manifest.get(doc_key)
+            if previous is not None and Path(previous[2]).exists():
+                if not force and previous[:2] == (context_hash, template_hashes[template_type]):
+                    unchanged.append({
+                        'position': position,
+                        'sicap_id': sicap_id,
+                        'template': template_type,
+                        'output_path': previous[2],
+                        'success': True,
+                        'error': None,
+                        'unchanged': True,
+                    })
+                    continue
+                output_path = Path(previous[2])  # Changed (or forced): replace the old document
+            else:
+                output_path = get_unique_filename(row, template_type, allocator)
+
+            jobs.append({
+                'position': position,
+                'sicap_id': sicap_id,
+                'template_type': template_type,
+                'template_path': template_path,
+                'context': context,
+                'output_path': output_path,
+                'doc_key': doc_key,
+                'context_hash': context_hash,
+            })
+
+    manifest.close()
+    return jobs, unchanged
+
+
+
+def load_input_rows(excel_files):
+    """
+    Returns the rows to generate documents for: the with-CUI rows of the
+    acquisition store, or the given files if 'excel_files' is set (.xlsx,
+    or tables written by export_reports()).
+    """
+    if excel_files is None:
+        store = AcquisitionStore()
+        try:
+            df = store.load_rows(with_cui=True)
+        finally:
+            store.close()
+        print(f" > Loaded {len(df)} rows with a supplier CUI from the acquisition store.")
+        return df
+
     all_dfs = []
     for file_path in excel_files:
         if not file_path.exists():
             print(f" > Warning: Input file not found: {file_path}")
             continue
         try:
-            all_dfs.append(pd.read_excel(file_path))
+            all_dfs.append(read_table(file_path, ROW_DTYPES))
             print(f" > Loaded: {file_path.name}")
         except Exception as e:
             print(f" > Error loading {file_path.name}: {e}")
-    
     if not all_dfs:
-        print(" > Error: No valid Excel files were loaded. Stopping.")
-        return False
+        return pd.DataFrame()
+    return pd.concat(all_dfs, ignore_index=True)
+
+
+def run_document_generation(excel_files=None, force=DOC_FORCE_REGENERATE, output_mode=DOC_OUTPUT_MODE):
+    """
+    Main function to run the entire document generation process.
+    'excel_files' is a list of Path objects to process; by default the
+    rows come from the acquisition store (see load_input_rows).
+    With DOC_WORKERS > 1 (or 0 = all cores) the documents are rendered
+    by a pool of processes.
+    Documents whose row data and template are unchanged since the last run
+    (see DocumentManifest) are skipped unless 'force' is True; the others
+    overwrite their previous file instead of adding a new copy.
+    With output_mode "zip" every document is rendered into one ZIP per
+    DOC_ARCHIVE_GROUP_COLUMN value instead (see DocumentArchiver); an
+    archive run always contains all documents.
+    """
+    print("--- Step 5: Generating Documents (with docxtpl) ---")
     
-    df = pd.concat(all_dfs, ignore_index=True)
+    with metrics.phase('io', step='generate'):
+        df = load_input_rows(excel_files)
+    if df.empty:
+        print(" > Error: No rows to generate documents for. Stopping.")
+        return False
     print(f" > Loaded a total of {len(df)} rows to process.")
     
     # Ensure output directory exists
     GENERATED_DOCS_DIR.mkdir(exist_ok=True)
-    
-    success_count = 0
-    failed_count = 0
-    
-    for index, row in df.iterrows():
-        sicap_id = row.get('Nr. anunt SICAP', f'Row {index+1}')
-        print(f"\n Processing {index + 1}/{len(df)}: {sicap_id}")
-        
-        # --- Process Template 1 (LV) ---
-        save_path_1 = get_unique_filename(row, 'LV', GENERATED_DOCS_DIR)
-        success, error = generate_document_from_template(TEMPLATE_1_FILE, row, save_path_1)
-        
-        if success:
-            print(f" > Saved LV: {save_path_1.name}")
-            success_count += 1
-        else:
-            print(f" > FAILED to generate LV doc: {error}")
-            failed_count += 1
-        
-        # --- Process Template 2 (RV) ---
-        save_path_2 = get_unique_filename(row, 'RV', GENERATED_DOCS_DIR)
-        success, error = generate_document_from_template(TEMPLATE_2_FILE, row, save_path_2)
-        
-        if success:
-            print(f" > Saved RV: {save_path_2.name}")
-            success_count += 1
-        else:
-            print(f" > FAILED to generate RV doc: {error}")
-            failed_count += 1
-    
-    print(f"\n--- Document Generation Complete ---")
-    print(f" > Successfully generated: {success_count} documents")
-    print(f" > Failed: {failed_count} documents")
+    archiver = DocumentArchiver(GENERATED_ARCHIVES_DIR) if output_mode == "zip" else None
+    if archiver is not None:
+        print(f" > Writing ZIP archives to: {archiver.run_dir}")
+
+    # 1. Plan every document
+    template_hashes = {template_type: get_template_hash(path) for template_type, path in TEMPLATES}
+    with metrics.phase('prepare', step='generate'):
+        jobs, unchanged = plan_documents(df, template_hashes, archiver, force)
+    metrics.count('generate', 'unchanged', len(unchanged))
+    if unchanged:
+        print(f" > {len(unchanged)} documents unchanged since the last run (skipped).")
+
+    def on_rendered(job, result):
+        # Rendered documents are timed where they were rendered (maybe another process)
+        metrics.add_item('generate', f"{result['sicap_id']} {result['template']}", result['seconds'],
+                         result['timings'], success=result['success'])
+        # Archive mode: write the rendered bytes into the ZIP right away
+        data = result.pop('data', None)
+        if archiver is not None and data is not None:
+            with metrics.phase('io', step='generate'):
+                archiver.add(job['output_path'], data,
+                             sicap_id=job['sicap_id'], template=job['template_type'])
+
+    # 2. Render
+    workers = DOC_WORKERS if DOC_WORKERS > 0 else (os.cpu_count() or 1)
+    if not jobs:
+        results = []
+    elif workers > 1 and len(jobs) > 1:
+        print(f" > Rendering {len(jobs)} documents with {workers} processes...")
+        results = render_jobs_in_processes(jobs, workers, on_result=on_rendered)
+        for result in results:
+            if not result['success']:
+                print(f" > FAILED to generate {result['template']} doc for {result['sicap_id']}: {result['error']}")
+    else:
+        results = []
+        last_position = None
+        for job in jobs:
+            if job['position'] != last_position:
+                last_position = job['position']
+                print(f"\n Processing {job['position'] + 1}/{len(df)}: {job['sicap_id']}")
+            result = _render_job(job)
+            on_rendered(job, result)
+            if result['success']:
+                print(f" > Saved {result['template']}: {Path(result['output_path']).name}")
+            else:
+                print(f" > FAILED to generate {result['template']} doc: {result['error']}")
+            results.append(result)
+
+    if archiver is not None:
+        print(f" > Archives and manifest saved to: {archiver.close()}")
+
+    # 3. Remember what was rendered, report
+    with metrics.phase('io', step='generate'):
+        save_generation_results(results, unchanged, template_hashes)
     
     return True
@@ -1,13 +1,16 @@
 # app/pnrr_scraper.py
-import pandas as pd
-import re
-import time
+import queue
+import threading
 from app.scraper.navigator import WebsiteNavigator
+from app.scraper.pnrr_client import PnrrApiClient
+from app.database.db_manager import CompanyStore, AcquisitionStore
+from app.utils.metrics import metrics
 from app.utils.config import (
     PNRR_EMAIL, 
     PNRR_PASSWORD, 
-    VALID_CODES_WITH_CUI_PATH, # Make sure this is the correct variable
-    SICAP_ID_HEADER 
+    PNRR_WORKERS,
+    PNRR_USE_API,
+    SESSION_COOKIE_PATH,
 )
 NO_ACQUISITION_FOUND = "[NU A FOST GASIT URL-UL ACHIZITIEI]"
 
@@ -17,6 +20,7 @@ def recreate_navigator_session(navigator):
     Returns a new navigator instance with fresh login.
     """
     print(" > ⚠️ Browser session invalid. Recreating session...")
+    metrics.count('beneficiaries', 'session_restarts')
     try:
         navigator.close()
     except:
@@ -34,207 +38,307 @@ def recreate_navigator_session(navigator):
         return None
 
 
+def restart_every(navigator, count, every=250):
+    """Restarts the browser every 'every' records to prevent memory issues."""
+    if count == 0 or count % every != 0:
+        return navigator
+    print(f"\n > Restarting browser at record {count} to free memory...")
+    metrics.count('beneficiaries', 'session_restarts')
+    navigator.close()
+    navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD)
+    navigator.login()
+    print(" > Browser restarted successfully")
+    return navigator
+
+
+def get_company_beneficiaries(navigator, cui_cleaned, memo, company_store):
+    """
+    Returns (names, url, denumire) for a cleaned CUI.
+    The company page is only scraped if this CUI was not already seen in this
+    run ('memo') or stored by an earlier run ('company_store').
+    Only pages that loaded correctly (a 'Denumire' was found) are remembered,
+    so timeouts are retried on the next row with the same CUI.
+    """
+    if cui_cleaned in memo:
+        print(f"    > CUI {cui_cleaned} already scraped in this run. Re-using result.")
+        metrics.count('beneficiaries', 'cache_hits')
+        return memo[cui_cleaned]
+
+    stored = company_store.get(cui_cleaned)
+    if stored is not None:
+        print(f"    > CUI {cui_cleaned} found in the company store. Re-using result.")
+        metrics.count('beneficiaries', 'cache_hits')
+        memo[cui_cleaned] = stored
+        return stored
+
+    with metrics.item('beneficiaries', cui_cleaned, kind='company', source='browser'):
+        with metrics.phase('network'):
+            result = navigator.scrape_company_beneficiaries(cui_cleaned)
+    if result[2]:
+        memo[cui_cleaned] = result
+        company_store.put(cui_cleaned, *result)
+    return result
+
+
+def _prefetch_worker(worker_id, job_queue, company_memo, company_store, acquisition_urls, lock):
+    """
+    One headless navigator that re-uses the saved login cookies and
+    processes ('company', cui) and ('acquisition', sicap_id) jobs.
+    """
+    try:
+        navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD, headless=True)
+    except Exception as e:
+        print(f" > [Worker {worker_id}] Could not start browser: {e}")
+        return
+
+    try:
+        if not navigator.login():
+            print(f" > [Worker {worker_id}] Login failed. Stopping this worker.")
+            return
+
+        while True:
+            try:
+                job_type, key = job_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                with metrics.item('beneficiaries', key, kind=job_type, source='browser'):
+                    if job_type == 'company':
+                        print(f" > [Worker {worker_id}] Company page for CUI {key}")
+                        with metrics.phase('network'):
+                            result = navigator.scrape_company_beneficiaries(key)
+                        if result[2]:
+                            with lock:
+                                company_memo[key] = result
+                                company_store.put(key, *result)
+                    else:
+                        print(f" > [Worker {worker_id}] Acquisition search for {key}")
+                        with metrics.phase('network'):
+                            acquisition_url = navigator.search_acquisition_by_sicap(key)
+                        with lock:
+                            acquisition_urls[key] = acquisition_url
+            except Exception as e:
+                # Left out of the results: the main loop retries it with its own browser
+                print(f" > [Worker {worker_id}] Error on {job_type} {key}: {e}")
+    finally:
+        navigator.close()
+
+
+def prefetch_in_parallel(company_cuis, sicap_ids, company_memo, company_store, workers):
+    """
+    Scrapes company pages and acquisition URLs with several headless navigators.
+    The main navigator must already be logged in (its cookies are saved in
+    session/cookies.json), so the workers skip the login form.
+    Fills 'company_memo' and returns {sicap_id: acquisition_url or None}.
+    """
+    job_queue = queue.Queue()
+    for cui in company_cuis:
+        job_queue.put(('company', cui))
+    for sicap_id in sicap_ids:
+        job_queue.put(('acquisition', sicap_id))
+
+    acquisition_urls = {}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(
+            target=_prefetch_worker,
+            args=(worker_id, job_queue, company_memo, company_store, acquisition_urls, lock),
+            daemon=True,
+        )
+        for worker_id in range(1, workers + 1)
+    ]
+    print(f"  > Prefetching {len(company_cuis)} companies and {len(sicap_ids)} acquisitions "
+          f"with {workers} parallel sessions...")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"  > Prefetch done: {len(company_memo)} companies, {len(acquisition_urls)} acquisitions.")
+    return acquisition_urls
+
+
+def check_ofertant(store, cui, denumire):
+    """Warns when the PNRR company name differs from the 'Ofertant' SICAP gave for this CUI."""
+    if not denumire:
+        print(f" > No 'Denumire' found on PNRR page for CUI {cui}")
+        return
+    for ofertant in store.ofertant_names(cui):
+        if ofertant.strip().upper() != denumire.strip().upper():
+            print(f" > ⚠️ OFERTANT MISMATCH DETECTED!")
+            print(f"    SICAP value: '{ofertant}'")
+            print(f"    Scraped value: '{denumire}'")
+            print(f" > The scraped value is used for 'Ofertant'.")
+
+
 def run_beneficiary_scraper():
     """
     Orchestrates the scraping of "Beneficiari reali" from the PNRR platform.
     
     This function performs the following steps:
-    1. Loads the 'valid_codes_with_cui.xlsx' file.
-    2. Checks for/creates 'Beneficiari reali' columns.
-    3. Initializes the WebsiteNavigator.
-    4. Performs a login to the PNRR platform.
-    5. Loops through each row in the Excel file.
-    6. If a row is missing data or failed, scrapes the beneficiary data and URL.
-    7. Updates the DataFrame in-place.
-    8. Saves the updated DataFrame back to 'valid_codes_with_cui.xlsx'.
-    9. Closes the browser.
+    1. Reads from the acquisition store the supplier CUIs whose company page
+       is missing or failed, and the SICAP IDs without an acquisition URL.
+    2. Re-uses company pages stored by earlier runs.
+    3. Asks the PNRR backend first, with the cookies of the last login.
+    4. Logs in with the WebsiteNavigator if anything is left (and asks the
+       backend again if the saved cookies had expired, then the optional
+       parallel sessions).
+    5. Scrapes whatever is left with the browser.
+    6. Saves every result to the store as soon as it has it.
+    7. Closes the browser.
     """
     print("--- Step 4: Scraping Real Beneficiaries (PNRR) ---")
 
-    # 1. Load the "with CUI" data file
-    if not VALID_CODES_WITH_CUI_PATH.exists():
-        print(f"Error: File not found at {VALID_CODES_WITH_CUI_PATH}")
-        print("Please ensure Step 3 (CUI Split) ran successfully.")
-        return False
+    # 1. Work out which companies and acquisitions still need to be looked up
+    store = AcquisitionStore()
+    company_cuis = store.companies_to_scrape()
+    sicap_ids = store.acquisitions_to_search()
+    if not company_cuis and not sicap_ids:
+        print("  > All beneficiary data already exists. Skipping beneficiary scrape.")
+        store.close()
+        return True
+    print(f"  > {len(company_cuis)} companies and {len(sicap_ids)} acquisitions to look up.")
 
-    try:
-        df = pd.read_excel(VALID_CODES_WITH_CUI_PATH)
-    except Exception as e:
-        print(f"Error reading {VALID_CODES_WITH_CUI_PATH}: {e}")
-        return False
+    # 2. Each supplier CUI is scraped once per run (and re-used across runs)
+    company_memo = {}
+    company_store = CompanyStore()
 
-    if df.empty:
-        print("  > No data found in valid_codes_with_cui.xlsx. Skipping beneficiary scrape.")
+    def save_company(cui, result):
+        store.save_company(cui, *result)
+        check_ofertant(store, cui, result[2])
+
+    for cui in company_cuis:
+        stored = company_store.get(cui)
+        if stored is not None:
+            company_memo[cui] = stored
+            save_company(cui, stored)
+    company_cuis = [cui for cui in company_cuis if cui not in company_memo]
+    metrics.count('beneficiaries', 'cache_hits', len(company_memo))
+    if company_memo:
+        print(f"  > {len(company_memo)} companies found in the company store.")
+
+    if not company_cuis and not sicap_ids:
+        print("--- Step 4 Complete ---")
+        company_store.close()
+        store.close()
         return True
-    
-    if 'Ofertant CUI' not in df.columns:
-        print("  > Error: 'Ofertant CUI' column not found in file.")
-        return False
-    
-    # Check for Ofertant column
-    if 'Ofertant' not in df.columns:
-        print(" > Warning: 'Ofertant' column not found. Creating empty column.")
-        df['Ofertant'] = pd.NA
-        
-    # Check for columns and create if they don't exist
-    if 'Beneficiari reali' not in df.columns:
-        df['Beneficiari reali'] = pd.NA
-        print("  > Column 'Beneficiari reali' created.")
-        
-    if 'Beneficiari reali URL' not in df.columns:
-        df['Beneficiari reali URL'] = pd.NA
-        print("  > Column 'Beneficiari reali URL' created.")
-
-    if 'Detalii achizitie URL PNRR' not in df.columns:
-        df['Detalii achizitie URL PNRR'] = pd.NA
-        print(" > Column 'Detalii achizitie URL PNRR' created.")
-        
-    print(f"  > Loaded {len(df)} companies with CUI to scrape.")
-
-    # 2. Initialize the navigator
-    navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD)
-    
-    # 3. Perform login
-    print("  > Attempting PNRR login...")
-    login_successful = navigator.login()
-    
-    if not login_successful:
-        print("  > Login failed. Cannot proceed with beneficiary scraping.")
-        navigator.close()
-        return False
-    
-    print("  > Login successful.")
 
-    # 4. Loop through each row and scrape
-    
-    for index, row in df.iterrows():
-        # Restart browser every 250 records to prevent memory issues
-        if index > 0 and index % 250 == 0:
-            print(f"\n > Restarting browser at record {index} to free memory...")
+    # 3. Fast path: ask the PNRR backend directly with a SESSION cookie,
+    # first the one saved by the last login, so the browser is only started
+    # for what the backend cannot answer.
+    prefetched_acquisitions = {}
+
+    def query_backend(api_client):
+        cuis = [cui for cui in company_cuis if cui not in company_memo]
+        ids = [sicap_id for sicap_id in sicap_ids if sicap_id not in prefetched_acquisitions]
+        print(f"  > Querying the PNRR backend for {len(cuis)} companies "
+              f"and {len(ids)} acquisitions...")
+        answered = 0
+        for cui_cleaned in cuis:
+            with metrics.item('beneficiaries', cui_cleaned, kind='company', source='api'):
+                result = api_client.get_company_beneficiaries(cui_cleaned)
+            if result is not None:
+                company_memo[cui_cleaned] = result
+                company_store.put(cui_cleaned, *result)
+                save_company(cui_cleaned, result)
+                answered += 1
+        found = 0
+        for sicap_id in ids:
+            with metrics.item('beneficiaries', sicap_id, kind='acquisition', source='api'):
+                acquisition_url = api_client.get_acquisition_url(sicap_id)
+            if acquisition_url is not None:
+                prefetched_acquisitions[sicap_id] = acquisition_url or None
+                found += 1
+        api_client.close()
+        print(f"  > Backend answered {answered} companies and {found} acquisitions.")
+
+    saved_client = PnrrApiClient.from_cookie_file(SESSION_COOKIE_PATH) if PNRR_USE_API else None
+    if saved_client is not None:
+        query_backend(saved_client)
+
+    # 4. Initialize the navigator and log in (only if something is left)
+    navigator = None
+    remaining_cuis = [cui for cui in company_cuis if cui not in company_memo]
+    remaining_ids = [sicap_id for sicap_id in sicap_ids if sicap_id not in prefetched_acquisitions]
+    if remaining_cuis or remaining_ids:
+        navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD)
+
+        print("  > Attempting PNRR login...")
+        login_successful = navigator.login()
+
+        if not login_successful:
+            print("  > Login failed. Cannot proceed with beneficiary scraping.")
             navigator.close()
-            navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD)
-            navigator.login()
-            print(" > Browser restarted successfully")
-
-        cui = row['Ofertant CUI']
-        sicap_id = row[SICAP_ID_HEADER]
-        
-        print(f"\n  Processing {index + 1}/{len(df)}: SICAP ID {sicap_id}")
-        
-        # --- 1. IMPROVED LOGIC: Check both columns ---
-        names_val = row['Beneficiari reali']
-        url_val = row['Beneficiari reali URL']
-        acquisition_url_val = row['Detalii achizitie URL PNRR']
-
-        is_names_empty = pd.isna(names_val)
-        is_names_failed = (str(names_val) == 'SCRAPE FAILED')
-        is_url_empty = pd.isna(url_val)
-        is_acquisition_url_empty = pd.isna(acquisition_url_val)
-
-        # We need to scrape if ANY of these are true
-        we_need_to_scrape = is_names_empty or is_names_failed or is_url_empty or is_acquisition_url_empty
-
-        # If we DON'T need to scrape, skip the row
-        if not we_need_to_scrape:
-            print(f" > All data already exists for {row['Ofertant CUI']}. Skipping.")
-            continue
-        
-        if is_names_failed:
-            print("    > Retrying row that previously failed.")
-        # --- End of improved logic ---
-
-        if pd.isna(cui):
-            print("    > Skipping row, CUI is empty.")
-            df.loc[index, 'Beneficiari reali'] = pd.NA # Ensure it's NA, not 'SCRAPE FAILED'
-            df.loc[index, 'Beneficiari reali URL'] = pd.NA
-            continue
-            
-        cui_str = str(cui)
-        cui_cleaned = re.sub(r'[^0-9]', '', cui_str) 
-        
-        print(f"    > (Original CUI: {cui_str}, Cleaned: {cui_cleaned})")
-        
-        if not cui_cleaned:
-            print(f"    > Skipping row, CUI '{cui_str}' became empty after cleaning.")
-            df.loc[index, 'Beneficiari reali'] = pd.NA
-            df.loc[index, 'Beneficiari reali URL'] = pd.NA
-            continue
-            
+            company_store.close()
+            store.close()
+            return False
+
+        print("  > Login successful.")
+
+        # The saved cookie was missing or expired: ask again with the fresh login
+        if PNRR_USE_API and (saved_client is None or saved_client.disabled):
+            query_backend(PnrrApiClient.from_navigator(navigator))
+    else:
+        print("  > The backend answered everything. No browser needed.")
+
+    # Optional: fan out over several headless sessions sharing the saved login.
+    # The loop below then mostly reads the prefetched results.
+    remaining_cuis = [cui for cui in company_cuis if cui not in company_memo]
+    remaining_ids = [sicap_id for sicap_id in sicap_ids if sicap_id not in prefetched_acquisitions]
+    metrics.count('beneficiaries', 'browser_fallbacks', len(remaining_cuis) + len(remaining_ids))
+    if PNRR_WORKERS > 1 and (remaining_cuis or remaining_ids):
+        known = set(company_memo)
+        prefetched_acquisitions.update(prefetch_in_parallel(
+            remaining_cuis, remaining_ids, company_memo, company_store, PNRR_WORKERS
+        ))
+        for cui in remaining_cuis:
+            if cui in company_memo and cui not in known:
+                save_company(cui, company_memo[cui])
+
+    # 5. Scrape what is left with the browser
+    count = 0
+    remaining_cuis = [cui for cui in company_cuis if cui not in company_memo]
+    for position, cui_cleaned in enumerate(remaining_cuis, start=1):
+        navigator = restart_every(navigator, count)
+        count += 1
+        print(f"\n  Company {position}/{len(remaining_cuis)}: CUI {cui_cleaned}")
         try:
-            # --- 2. NAVIGATION CALL ---
-            # This is only reached if the checks above pass
-            scraped_names, scraped_url, scraped_denumire = navigator.scrape_company_beneficiaries(cui_cleaned)
-
-            # --- 3. VALIDATE DENUMIRE AGAINST OFERTANT ---
-            excel_ofertant = row.get('Ofertant')
-
-            if scraped_denumire:
-                scraped_denumire_normalized = scraped_denumire.strip().upper()
-                
-                if pd.notna(excel_ofertant):
-                    excel_ofertant_normalized = str(excel_ofertant).strip().upper()
-                else:
-                    excel_ofertant_normalized = ""
-                
-                if scraped_denumire_normalized != excel_ofertant_normalized:
-                    print(f" > ⚠️ OFERTANT MISMATCH DETECTED!")
-                    print(f"    Excel value: '{excel_ofertant}'")
-                    print(f"    Scraped value: '{scraped_denumire}'")
-                    print(f" > Updating 'Ofertant' column with scraped value.")
-                    df.loc[index, 'Ofertant'] = scraped_denumire
-                else:
-                    print(f" > ✓ Ofertant matches: '{scraped_denumire}'")
-            else:
-                print(f" > No 'Denumire' found on PNRR page for CUI {cui_cleaned}")
-            
-            # Update DataFrame in-place
-            df.loc[index, 'Beneficiari reali'] = scraped_names
-            df.loc[index, 'Beneficiari reali URL'] = scraped_url
-
-            # --- NEW: SEARCH FOR ACQUISITION DETAILS URL ---
-            print(f" > Searching for acquisition details URL...")
-            
-            # Check if we already have the URL
-            existing_url = row.get('Detalii achizitie URL PNRR')
-            if pd.notna(existing_url) and str(existing_url).strip():
-                print(f" > Acquisition URL already exists. Skipping search.")
-            else:
-                try:
-                    acquisition_url = navigator.search_acquisition_by_sicap(sicap_id)
-                    if acquisition_url:
-                        df.loc[index, 'Detalii achizitie URL PNRR'] = acquisition_url
-                        print(f" > ✓ Saved acquisition URL")
-                    else:
-                        print(f" > Could not find acquisition URL - marking as not found")
-                        df.loc[index, 'Detalii achizitie URL PNRR'] = NO_ACQUISITION_FOUND
-                    
-                    # Navigate back to prevent issues with next iteration
-                    navigator.driver.get("https://coordonare.pnrr.gov.ro/#/acquisitions/view")
-                    time.sleep(1)
-
-                except Exception as e:
-                    print(f" > Error searching for acquisition: {e}")
-                    df.loc[index, 'Detalii achizitie URL PNRR'] = NO_ACQUISITION_FOUND
-            
+            result = get_company_beneficiaries(navigator, cui_cleaned, company_memo, company_store)
+            save_company(cui_cleaned, result)
         except Exception as e:
             print(f"    > CRITICAL ERROR during scrape for {cui_cleaned}: {e}")
             print("    > Saving 'SCRAPE FAILED' and continuing...")
-            
-            # Update DataFrame in-place with error
-            df.loc[index, 'Beneficiari reali'] = "SCRAPE FAILED"
             failed_url = f"https://coordonare.pnrr.gov.ro/#/acquisitions/detalii-companie/{cui_cleaned}"
-            df.loc[index, 'Beneficiari reali URL'] = failed_url
+            store.save_company(cui_cleaned, "SCRAPE FAILED", failed_url, None)
 
-    # 8. Close the browser
-    print("\n  > Scrape complete. Closing browser.")
-    navigator.close()
+    for position, sicap_id in enumerate(sicap_ids, start=1):
+        if sicap_id in prefetched_acquisitions:
+            acquisition_url = prefetched_acquisitions[sicap_id]
+        else:
+            navigator = restart_every(navigator, count)
+            count += 1
+            print(f"\n  Acquisition {position}/{len(sicap_ids)}: SICAP ID {sicap_id}")
+            try:
+                with metrics.item('beneficiaries', sicap_id, kind='acquisition', source='browser'):
+                    with metrics.phase('network'):
+                        acquisition_url = navigator.search_acquisition_by_sicap(sicap_id)
+                        # Navigate back to prevent issues with next iteration
+                        navigator.driver.get("https://coordonare.pnrr.gov.ro/#/acquisitions/view")
+                        navigator.waiter.wait_for_idle()
+            except Exception as e:
+                print(f" > Error searching for acquisition: {e}")
+                acquisition_url = None
 
-    # 7. Save updated file
-    try:
-        df.to_excel(VALID_CODES_WITH_CUI_PATH, index=False)
-        print(f"\n  > Successfully updated {VALID_CODES_WITH_CUI_PATH} with 'Beneficiari reali' data.")
-        print("--- Step 4 Complete ---")
-        return True
-    except Exception as e:
-        print(f"  > CRITICAL ERROR: Could not save final file to {VALID_CODES_WITH_CUI_PATH}: {e}")
-        return False
\ No newline at end of file
+        if not acquisition_url:
+            print(f" > Could not find acquisition URL for {sicap_id} - marking as not found")
+        store.save_acquisition_url(sicap_id, acquisition_url or NO_ACQUISITION_FOUND)
+
+    # 6. Close the browser
+    print("\n  > Scrape complete. Closing browser.")
+    print(f"  > {len(company_memo)} distinct companies resolved.")
+    if navigator is not None:
+        navigator.close()
+    company_store.close()
+    store.close()
+    print("--- Step 4 Complete ---")
+    return True
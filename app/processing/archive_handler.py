@@ -0,0 +1,117 @@
+# app/processing/archive_handler.py
+import csv
+import hashlib
+import io
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+
+from app.utils.filenames import FilenameAllocator
+
+# Packs the generated documents into ZIP archives instead of thousands of
+# loose .docx files. Documents are rendered into memory and written straight
+# into the archive, so nothing is written to disk twice. One big file per
+# group is also much faster to copy to the network share.
+
+MANIFEST_NAME = "manifest.csv"
+MAX_OPEN_ARCHIVES = 32  # more groups than this are closed and re-opened as needed
+
+
+def _unique_name(taken, filename):
+    """Returns 'filename' or 'stem_1.ext', 'stem_2.ext'... not yet in 'taken'."""
+    stem, dot, extension = filename.rpartition('.')
+    name = filename
+    counter = 1
+    while name in taken:
+        name = f"{stem}_{counter}{dot}{extension}"
+        counter += 1
+    taken.add(name)
+    return name
+
+
+class DocumentArchiver:
+    """
+    Writes documents into one ZIP archive per group (e.g. per authority),
+    inside a new folder for every run.
+
+    reserve() decides the archive and the name of a document up front (so
+    names don't depend on the order documents finish rendering); add()
+    stores the rendered bytes. close() writes a manifest.csv into every
+    archive and a manifest.xlsx for the whole run.
+    """
+    def __init__(self, output_dir, run_name=None):
+        run_name = run_name or datetime.now().strftime("run_%Y%m%d_%H%M%S")
+        self.run_dir = output_dir / run_name
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.allocator = FilenameAllocator(self.run_dir)
+        self.archives = {}          # group -> archive path
+        self.names = {}             # archive path -> names used inside it
+        self.entries = []           # one manifest row per stored document
+        self.open_zips = OrderedDict()  # archive path -> ZipFile, least recently used first
+
+    def reserve(self, group, filename):
+        """
+        Returns the path of 'filename' inside the archive of 'group'
+        (archive.zip/filename); the name is unique within that archive.
+        """
+        group = group or "documente"
+        if group not in self.archives:
+            archive_path = self.allocator.claim(f"{group}.zip")
+            self.archives[group] = archive_path
+            self.names[archive_path] = {MANIFEST_NAME}
+        archive_path = self.archives[group]
+        return archive_path / _unique_name(self.names[archive_path], filename)
+
+    def _zip(self, archive_path):
+        """Returns the open ZipFile of an archive, re-opening it if it was closed."""
+        if archive_path in self.open_zips:
+            self.open_zips.move_to_end(archive_path)
+            return self.open_zips[archive_path]
+
+        if len(self.open_zips) >= MAX_OPEN_ARCHIVES:
+            _, oldest = self.open_zips.popitem(last=False)
+            oldest.close()
+        # 'w' the first time (the file was claimed empty), 'a' afterwards
+        mode = 'a' if archive_path.stat().st_size > 0 else 'w'
+        # .docx files are already compressed, so they are stored as they are
+        zf = zipfile.ZipFile(archive_path, mode, compression=zipfile.ZIP_STORED)
+        self.open_zips[archive_path] = zf
+        return zf
+
+    def add(self, entry_path, data, **info):
+        """Stores 'data' at 'entry_path' (from reserve()). 'info' goes into the manifest."""
+        self._zip(entry_path.parent).writestr(entry_path.name, data)
+        self.entries.append({
+            'archive': entry_path.parent.name,
+            'file': entry_path.name,
+            **info,
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        })
+
+    def close(self):
+        """Writes the manifests and closes every archive. Returns the run folder."""
+        for archive_path in self.archives.values():
+            rows = [entry for entry in self.entries if entry['archive'] == archive_path.name]
+            if not rows:
+                continue
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+            # utf-8-sig so Excel shows the Romanian characters correctly
+            self._zip(archive_path).writestr(MANIFEST_NAME, buffer.getvalue().encode('utf-8-sig'))
+
+        for zf in self.open_zips.values():
+            zf.close()
+        self.open_zips.clear()
+
+        # Archives whose documents all failed
+        for archive_path in self.archives.values():
+            if archive_path.stat().st_size == 0:
+                archive_path.unlink()
+
+        if self.entries:
+            pd.DataFrame(self.entries).to_excel(self.run_dir / "manifest.xlsx", index=False)
+        return self.run_dir
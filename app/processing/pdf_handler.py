@@ -0,0 +1,246 @@
+# app/processing/pdf_handler.py
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import ocrmypdf
+from pypdf import PdfWriter
+
+from app.doc_generator import sanitize_filename
+from app.utils.tables import read_table
+from app.utils.config import (
+    GENERATION_REPORT_PATH,
+    GENERATED_PDFS_DIR,
+    ATTACHMENTS_DIR,
+    LIBREOFFICE_PATH,
+    PDF_CONVERT_BATCH_SIZE,
+    PDF_CONVERT_TIMEOUT,
+    OCR_WORKERS,
+    OCR_LANGUAGES,
+)
+
+# PDF step after document generation: converts the generated LV/RV
+# documents to PDF, OCRs the scanned attachments of every acquisition and
+# merges everything into one PDF per SICAP ID.
+
+_SOFFICE_LOCATIONS = [
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+    r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
+    "/Applications/LibreOffice.app/Contents/MacOS/soffice",
+]
+
+
+def find_soffice():
+    """Returns the path of the LibreOffice executable, or None if it is not installed."""
+    if LIBREOFFICE_PATH:
+        return LIBREOFFICE_PATH if Path(LIBREOFFICE_PATH).exists() else None
+    found = shutil.which("soffice") or shutil.which("libreoffice")
+    if found:
+        return found
+    for location in _SOFFICE_LOCATIONS:
+        if Path(location).exists():
+            return location
+    return None
+
+
+def is_up_to_date(output_path, input_path):
+    """True if 'output_path' exists and is newer than 'input_path'."""
+    return output_path.exists() and output_path.stat().st_mtime >= input_path.stat().st_mtime
+
+
+class LibreOfficeConverter:
+    """
+    Converts .docx files to PDF with headless LibreOffice.
+
+    Starting LibreOffice takes seconds, so every process converts a whole
+    batch of files. All batches share one private profile folder: it is
+    set up only once, and a LibreOffice window the user has open does not
+    block the conversion.
+    """
+    def __init__(self, soffice_path, batch_size=PDF_CONVERT_BATCH_SIZE, timeout=PDF_CONVERT_TIMEOUT):
+        self.soffice_path = soffice_path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.profile_dir = Path(tempfile.mkdtemp(prefix="lo_profile_"))
+
+    def convert(self, docx_paths, output_dir):
+        """Converts the files into 'output_dir'. Returns {docx_path: pdf_path or None}."""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        results = {}
+        for start in range(0, len(docx_paths), self.batch_size):
+            batch = docx_paths[start:start + self.batch_size]
+            print(f" > Converting documents {start + 1}-{start + len(batch)} of {len(docx_paths)}...")
+            command = [
+                self.soffice_path,
+                f"-env:UserInstallation={self.profile_dir.as_uri()}",
+                "--headless", "--invisible", "--norestore", "--nolockcheck",
+                "--convert-to", "pdf",
+                "--outdir", str(output_dir),
+                *[str(path) for path in batch],
+            ]
+            try:
+                subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               timeout=self.timeout, check=False)
+            except subprocess.TimeoutExpired:
+                print(f" > Warning: LibreOffice did not finish this batch in {self.timeout}s.")
+
+            for path in batch:
+                pdf_path = output_dir / f"{path.stem}.pdf"
+                results[path] = pdf_path if is_up_to_date(pdf_path, path) else None
+        return results
+
+    def close(self):
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+def _ocr_file(input_path, output_path):
+    """
+    Adds a text layer to one scanned PDF. Runs in a worker process.
+    Pages that already have text are left as they are.
+    Returns (input_path, output_path or None, error).
+    """
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        ocrmypdf.ocr(input_path, output_path, language=OCR_LANGUAGES,
+                     skip_text=True, jobs=1, progress_bar=False)
+        return input_path, output_path, None
+    except Exception as e:
+        return input_path, None, str(e)
+
+
+def ocr_in_processes(files, workers):
+    """
+    OCRs (input_path, output_path) pairs with a pool of processes.
+    Returns {input_path: output_path or None}.
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_ocr_file, input_path, output_path) for input_path, output_path in files]
+        for future in as_completed(futures):
+            input_path, output_path, error = future.result()
+            if error:
+                print(f" > OCR FAILED for {input_path.name}: {error}")
+            results[input_path] = output_path
+    return results
+
+
+def merge_pdfs(pdf_paths, output_path):
+    """Merges the PDFs, in order, into 'output_path'."""
+    writer = PdfWriter()
+    for pdf_path in pdf_paths:
+        writer.append(str(pdf_path))
+    with open(output_path, 'wb') as f:
+        writer.write(f)
+    writer.close()
+
+
+def load_generated_documents(report_path):
+    """
+    Reads the generation report and returns {sicap_id: [docx paths]} for
+    every document that exists on disk, in report order (LV before RV).
+    """
+    report = read_table(report_path)
+    documents = {}
+    for _, row in report[report['success'].fillna(False)].iterrows():
+        path = Path(str(row['output_path']))
+        # Documents inside a ZIP archive (DOC_OUTPUT_MODE=zip) are not on disk
+        if path.suffix.lower() != '.docx' or not path.is_file():
+            continue
+        documents.setdefault(str(row['sicap_id']), []).append(path)
+    return documents
+
+
+# --- Main Orchestrator Function ---
+
+def run_pdf_generation(report_path=GENERATION_REPORT_PATH):
+    """
+    Converts the documents of the last generation run to PDF and merges
+    them, with the OCR'd attachments from ATTACHMENTS_DIR/<SICAP ID>/,
+    into one PDF per acquisition in GENERATED_PDFS_DIR.
+    Files that are already up to date are not converted again.
+    """
+    print("--- Step 6: Generating PDFs ---")
+
+    if not report_path.exists():
+        print(f" > Error: Generation report not found: {report_path}")
+        return False
+
+    soffice_path = find_soffice()
+    if soffice_path is None:
+        print(" > Error: LibreOffice not found. Install it or set LIBREOFFICE_PATH in .env.")
+        return False
+
+    documents = load_generated_documents(report_path)
+    if not documents:
+        print(" > No generated .docx files to convert.")
+        return True
+    print(f" > Found {sum(len(paths) for paths in documents.values())} documents for {len(documents)} acquisitions.")
+
+    # 1. DOCX -> PDF (only documents changed since their last conversion)
+    pdf_dir = GENERATED_PDFS_DIR / "documents"
+    pdf_paths = {}
+    to_convert = []
+    for paths in documents.values():
+        for path in paths:
+            pdf_path = pdf_dir / f"{path.stem}.pdf"
+            if is_up_to_date(pdf_path, path):
+                pdf_paths[path] = pdf_path
+            else:
+                to_convert.append(path)
+
+    up_to_date_count = len(pdf_paths)
+    if to_convert:
+        converter = LibreOfficeConverter(soffice_path)
+        try:
+            pdf_paths.update(converter.convert(to_convert, pdf_dir))
+        finally:
+            converter.close()
+    converted_count = sum(1 for path in to_convert if pdf_paths.get(path))
+    print(f" > Converted {converted_count}/{len(to_convert)} documents ({up_to_date_count} already up to date).")
+
+    # 2. OCR of the scanned attachments
+    attachments = {}
+    to_ocr = []
+    for sicap_id in documents:
+        folder = ATTACHMENTS_DIR / sanitize_filename(sicap_id)
+        if not folder.is_dir():
+            continue
+        attachments[sicap_id] = []
+        for input_path in sorted(folder.glob("*.pdf")):
+            output_path = GENERATED_PDFS_DIR / "ocr" / folder.name / input_path.name
+            attachments[sicap_id].append((input_path, output_path))
+            if not is_up_to_date(output_path, input_path):
+                to_ocr.append((input_path, output_path))
+
+    if to_ocr:
+        workers = OCR_WORKERS if OCR_WORKERS > 0 else (os.cpu_count() or 1)
+        print(f" > Running OCR on {len(to_ocr)} attachments with {workers} processes...")
+        ocr_in_processes(to_ocr, workers)
+
+    # 3. One PDF per acquisition: LV, RV, then the attachments
+    merged_count = 0
+    failed_count = 0
+    for sicap_id, paths in documents.items():
+        parts = [pdf_paths[path] for path in paths if pdf_paths.get(path)]
+        if len(parts) < len(paths):
+            print(f" > FAILED to convert some documents of {sicap_id}.")
+            failed_count += 1
+        for input_path, output_path in attachments.get(sicap_id, []):
+            # Attachments that could not be OCR'd are merged as they are
+            parts.append(output_path if is_up_to_date(output_path, input_path) else input_path)
+        if not parts:
+            continue
+        try:
+            merge_pdfs(parts, GENERATED_PDFS_DIR / f"{sanitize_filename(sicap_id)}.pdf")
+            merged_count += 1
+        except Exception as e:
+            print(f" > FAILED to merge the PDFs of {sicap_id}: {e}")
+            failed_count += 1
+
+    print(f"\n--- PDF Generation Complete ---")
+    print(f" > Merged PDFs: {merged_count}")
+    print(f" > Acquisitions with errors: {failed_count}")
+    print(f" > Saved to: {GENERATED_PDFS_DIR}")
+    return True
@@ -0,0 +1,121 @@
+# app/scraper/driver_pool.py
+import queue
+import threading
+
+
+def is_driver_alive(driver):
+    """Returns True if the browser still answers a trivial command."""
+    try:
+        driver.execute_script("return 1")
+        return True
+    except Exception:
+        return False
+
+
+class DriverPool:
+    """
+    Runs one task over many items using several Selenium drivers in parallel.
+
+    Each worker thread owns one driver and takes jobs from a shared queue.
+    Before every job the driver is health-checked, and it is replaced
+    after 'recycle_after' jobs (to free Chrome memory) or when it stopped
+    responding.
+    """
+    def __init__(self, driver_factory, size=4, recycle_after=200, failed_result=None):
+        """
+        :param driver_factory: function returning a new driver (or None on failure)
+        :param size: number of parallel browsers
+        :param recycle_after: restart a browser after this many jobs
+        :param failed_result: result stored for jobs that could not be processed
+        """
+        self.driver_factory = driver_factory
+        self.size = max(1, size)
+        self.recycle_after = recycle_after
+        self.failed_result = failed_result
+
+    def run(self, jobs, task, on_result=None):
+        """
+        'jobs' is a list of tuples whose first element is the row position.
+        'task(driver, *job[1:])' must return (driver, result); it may return a
+        new driver if it had to restart the browser.
+        'on_result(job, result)' is called (under a lock) after each job.
+        Returns a dict {position: result} covering every job.
+        """
+        job_queue = queue.Queue()
+        for job in jobs:
+            job_queue.put(job)
+
+        results = {}
+        lock = threading.Lock()
+        workers = [
+            threading.Thread(
+                target=self._worker, args=(worker_id, job_queue, task, on_result, results, lock), daemon=True
+            )
+            for worker_id in range(1, min(self.size, len(jobs)) + 1)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Jobs left in the queue (every worker failed to start a driver)
+        for job in jobs:
+            results.setdefault(job[0], self.failed_result)
+        return results
+
+    def _new_driver(self, worker_id):
+        print(f"  > [Worker {worker_id}] Starting browser...")
+        return self.driver_factory()
+
+    def _worker(self, worker_id, job_queue, task, on_result, results, lock):
+        driver = None
+        handled = 0
+        needs_restart = False
+
+        while True:
+            try:
+                job = job_queue.get_nowait()
+            except queue.Empty:
+                break
+            position = job[0]
+
+            # Health check / recycle before using the driver
+            if driver is not None and (needs_restart or handled >= self.recycle_after or not is_driver_alive(driver)):
+                print(f"  > [Worker {worker_id}] Recycling browser after {handled} items...")
+                try:
+                    driver.quit()
+                except Exception:
+                    pass  # Already dead
+                driver = None
+
+            if driver is None:
+                driver = self._new_driver(worker_id)
+                handled = 0
+                needs_restart = False
+                if driver is None:
+                    print(f"  > [Worker {worker_id}] Driver setup failed. Stopping this worker.")
+                    with lock:
+                        results[position] = self.failed_result
+                    break
+
+            print(f"  > [Worker {worker_id}] Processing row {position + 1}: {job[1]}")
+            try:
+                driver, result = task(driver, *job[1:])
+            except Exception as e:
+                # The task should handle its own errors; if it didn't, the
+                # browser is in an unknown state, so it gets replaced.
+                print(f"  > [Worker {worker_id}] FAILED: An unexpected error occurred: {e}")
+                result = self.failed_result
+                needs_restart = True
+            handled += 1
+
+            with lock:
+                results[position] = result
+                if on_result is not None:
+                    on_result(job, result)
+
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
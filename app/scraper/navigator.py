@@ -1,5 +1,4 @@
 # app/scraper/navigator.py
-import time
 from selenium import webdriver
 import json
 import os
@@ -10,24 +9,29 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains 
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException, ElementClickInterceptedException
+from app.scraper.waits import PageWaiter
+from app.utils.config import SESSION_COOKIE_PATH
 
 # A class to encapsulate all browser navigation actions
 class WebsiteNavigator:
     """
     Manages the Selenium WebDriver and browser interactions.
     """
-    def __init__(self, email, password):
+    def __init__(self, email, password, headless=False):
         """
         Initializes the navigator with user credentials and sets up the WebDriver.
+        'headless' is used by the parallel workers (no visible window).
         """
         self.email = email
         self.password = password
         
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        self.cookie_path = os.path.join(project_root, 'session', 'cookies.json')
+        self.cookie_path = str(SESSION_COOKIE_PATH)
         
         options = webdriver.ChromeOptions()
-        # options.add_argument("--headless") # Run in headless mode (no UI)
+        if headless:
+            options.add_argument("--headless=new") # Run in headless mode (no UI)
+            options.add_argument("--window-size=1920,1080")
         options.add_argument("--no-sandbox")
         options.add_argument("--start-maximized")
         
@@ -48,6 +52,9 @@ class WebsiteNavigator:
         self.driver.execute_script("document.body.style.zoom = '50%'")
         print("WebDriver initialized with 50% zoom.")
 
+        # Waits for Angular / spinners instead of fixed sleeps
+        self.waiter = PageWaiter(self.driver)
+
     def navigate_to_acquisitions(self):
         """
         Navigates to the 'Vizualizare achiziții' page by clicking through the main menu.
@@ -144,8 +151,8 @@ class WebsiteNavigator:
                 ))
                 option_20.click()
 
-                print("  -> Waiting 3 seconds for table to reload...")
-                time.sleep(3)
+                print("  -> Waiting for table to reload...")
+                self.waiter.wait_for_idle()
                 print("✅ Page size successfully set to 20.")
             else:
                 print("✅ Page size is already set to 20.")
@@ -194,14 +201,13 @@ class WebsiteNavigator:
                     try:
                         # We keep this scroll, as it helps click the correct button
                         self.driver.execute_script("arguments[0].scrollIntoView({block: 'center', inline: 'center'});", button_to_click)
-                        time.sleep(1)
+                        wait.until(EC.element_to_be_clickable(button_to_click))
                         button_to_click.click()
                     except ElementClickInterceptedException:
                         print("    -> Normal click intercepted. Retrying with JavaScript click.")
                         self.driver.execute_script("arguments[0].click();", button_to_click)
 
-                    time.sleep(1)
-                    print("    -> Wait before getting the 'Număr anunț SICAP'.")
+                    print("    -> Waiting for the 'Număr anunț SICAP'.")
                     target_element = wait.until(EC.presence_of_element_located(
                         (By.XPATH, "//*[contains(text(), 'Număr anunț SICAP')]/following-sibling::div//span")
                     ))
@@ -210,8 +216,8 @@ class WebsiteNavigator:
                     print(f"    ✅ Success! Scraped data: {sicap_value}")
                     all_data.append(sicap_value)
                     
-                    time.sleep(2)
                     self.driver.back()
+                    self.waiter.wait_for_idle()
 
                 except (StaleElementReferenceException, TimeoutException, IndexError) as e:
                     print(f"    ❌ Error on item {i + 1}: {type(e).__name__}. Skipping item.")
@@ -225,7 +231,7 @@ class WebsiteNavigator:
                 # We no longer scroll to the paginator.
                 # paginator = self.driver.find_element(By.TAG_NAME, "mat-paginator")
                 # self.driver.execute_script("arguments[0].scrollIntoView(true);", paginator)
-                time.sleep(1)
+                self.waiter.wait_for_idle()
                 
                 next_button = self.driver.find_element(By.CSS_SELECTOR, "button[aria-label='Următoarea pagină']")
                 
@@ -233,9 +239,15 @@ class WebsiteNavigator:
                     print("\nLast page reached. All pages have been processed. ✔️")
                     break
                 else:
+                    first_button = self.driver.find_element(By.CSS_SELECTOR, "button[mattooltip='Detalii achiziție']")
                     next_button.click()
                     page_count += 1
-                    time.sleep(3) 
+                    # The old rows are replaced when the next page arrives
+                    try:
+                        WebDriverWait(self.driver, self.waiter.timeout.value).until(EC.staleness_of(first_button))
+                    except TimeoutException:
+                        pass
+                    self.waiter.wait_for_idle()
                     
             except NoSuchElementException:
                 print("\nCould not find 'Next Page' button. Assuming it's the only page.")
@@ -265,7 +277,7 @@ class WebsiteNavigator:
         # --- FIX 1: REFRESH PAGE TO LOAD DATA ---
         print("    > Refreshing page to load data...")
         self.driver.refresh()
-        time.sleep(1) 
+        self.waiter.wait_for_idle()
         
         wait = WebDriverWait(self.driver, 10) 
         
@@ -365,7 +377,7 @@ class WebsiteNavigator:
             
             # Wait for the info button to appear (means results loaded)
             print(f" > Waiting for search results to load...")
-            time.sleep(1)  # Small buffer for Angular to process                                         
+            self.waiter.wait_for_idle()
             
             # Find the first "Detalii achiziție" info button
             print(f" > Searching for acquisition details button...")
@@ -381,8 +393,12 @@ class WebsiteNavigator:
                 print(" > Normal click intercepted. Using JavaScript click...")
                 self.driver.execute_script("arguments[0].click();", info_button)
             
-            # Wait for navigation - look for a unique element on the details page instead of URL
+            # Wait for navigation to the details page
             print(" > Waiting for details page to load...")
+            try:
+                WebDriverWait(self.driver, self.waiter.timeout.value).until(EC.url_contains("acquisition-details"))
+            except TimeoutException:
+                pass
             
             details_url = self.driver.current_url
             
@@ -408,10 +424,64 @@ class WebsiteNavigator:
 
 
 
-    def login(self):
+    def save_cookies(self):
+        """Saves the current browser cookies to 'session/cookies.json'."""
+        try:
+            os.makedirs(os.path.dirname(self.cookie_path), exist_ok=True)
+            with open(self.cookie_path, 'w', encoding='utf-8') as f:
+                json.dump(self.driver.get_cookies(), f)
+            print(f"Session cookies saved to {self.cookie_path}")
+            return True
+        except Exception as e:
+            print(f"Warning: Could not save cookies: {e}")
+            return False
+
+    def load_cookies(self):
+        """
+        Loads the cookies from 'session/cookies.json' into the browser and
+        checks that the session is still logged in.
+        Returns True if the saved session works.
+        """
+        if not os.path.exists(self.cookie_path):
+            return False
+
+        try:
+            with open(self.cookie_path, 'r', encoding='utf-8') as f:
+                cookies = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not read cookies: {e}")
+            return False
+
+        # Cookies can only be added for the domain that is currently open
+        self.driver.get("https://coordonare.pnrr.gov.ro")
+        for cookie in cookies:
+            if 'expiry' in cookie:
+                cookie['expiry'] = int(cookie['expiry'])
+            try:
+                self.driver.add_cookie(cookie)
+            except Exception:
+                pass  # Cookie for another (sub)domain
+
+        # The SICAP filter is only shown to logged-in users
+        self.driver.get("https://coordonare.pnrr.gov.ro/#/acquisitions/view")
+        try:
+            WebDriverWait(self.driver, 10).until(EC.presence_of_element_located(
+                (By.XPATH, "//input[@data-placeholder='Filtrează după număr anunț SICAP']")
+            ))
+            print("Logged in with saved session cookies.")
+            return True
+        except TimeoutException:
+            print("Saved session cookies are no longer valid.")
+            return False
+
+    def login(self, use_saved_cookies=True):
         """
         Manages the login process by either using saved cookies or performing a new login.
+        After a new login the session cookies are saved for the next navigator.
         """
+        if use_saved_cookies and self.load_cookies():
+            return True
+
         # The base URL is needed to load cookies properly
         base_url = "https://coordonare.pnrr.gov.ro"
         self.driver.get(base_url)
@@ -424,7 +494,6 @@ class WebsiteNavigator:
         try:
             wait = WebDriverWait(self.driver, 10)
             print("Locating username and password fields...")
-            time.sleep(1)
             username_field = wait.until(EC.presence_of_element_located((By.ID, "username")))
             username_field.send_keys(self.email)
             password_field = self.driver.find_element(By.ID, "password")
@@ -432,7 +501,6 @@ class WebsiteNavigator:
             
             #############login_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[type='submit']")))
             login_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//button[.//span[text()='Autentificare']]")))
-            time.sleep(1)
             print("Clicking login button...")
             login_button.click()
             
@@ -443,6 +511,13 @@ class WebsiteNavigator:
             print(f"An error occurred during login: {e}")
             self.driver.save_screenshot("login_error.png")
             return False
+
+        # Keep the session for other navigators (only once we left the login page)
+        try:
+            WebDriverWait(self.driver, 10).until(EC.not_(EC.url_contains('/auth/login')))
+            self.save_cookies()
+        except TimeoutException:
+            print("Warning: Still on the login page. Session cookies not saved.")
         return True
 
     def close(self):
@@ -0,0 +1,150 @@
+# app/scraper/pnrr_client.py
+import json
+import os
+import requests
+import pandas as pd
+
+from app.utils.metrics import metrics
+
+from app.utils.config import (
+    PNRR_BASE_URL,
+    PNRR_API,
+    PNRR_API_TIMEOUT,
+    PNRR_COMPANY_PAGE_URL,
+    PNRR_ACQUISITION_DETAILS_URL,
+)
+
+
+def _first_present(item, fields):
+    """Returns the value of the first key in 'fields' that 'item' has."""
+    for field in fields:
+        if isinstance(item, dict) and item.get(field) not in (None, ""):
+            return item[field]
+    return None
+
+
+class PnrrApiClient:
+    """
+    Talks to the JSON backend of coordonare.pnrr.gov.ro directly, re-using the
+    SESSION cookie of a logged-in WebsiteNavigator (or session/cookies.json).
+
+    Every method returns None when the backend could not answer, so the
+    caller falls back to the Selenium navigator. After 'max_failures'
+    unexpected responses in a row the client disables itself for the run.
+    """
+    def __init__(self, cookies, max_failures=3):
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept": "application/json, text/plain, */*",
+            "Content-Type": "application/json;charset=UTF-8",
+            "Origin": PNRR_BASE_URL,
+            "Referer": PNRR_BASE_URL + "/",
+        })
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', '').lstrip('.') or None, path=cookie.get('path', '/'),
+            )
+        self.max_failures = max_failures
+        self.failures = 0
+        self.disabled = False
+
+    @classmethod
+    def from_navigator(cls, navigator):
+        """Builds a client from the cookies of a logged-in navigator."""
+        return cls(navigator.driver.get_cookies())
+
+    @classmethod
+    def from_cookie_file(cls, cookie_path):
+        """Builds a client from a saved session/cookies.json file (or returns None)."""
+        if not os.path.exists(cookie_path):
+            return None
+        with open(cookie_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _request(self, method, url, **kwargs):
+        """Returns the decoded JSON, or None (and counts a failure)."""
+        if self.disabled:
+            return None
+        try:
+            with metrics.phase('network', step='beneficiaries'):
+                response = self.session.request(method, url, timeout=PNRR_API_TIMEOUT, **kwargs)
+                response.raise_for_status()
+            with metrics.phase('parse', step='beneficiaries'):
+                data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"    > PNRR API request failed: {e}")
+            metrics.count('beneficiaries', 'api_errors')
+            self._failed()
+            return None
+        return data
+
+    def _failed(self):
+        self.failures += 1
+        if self.failures >= self.max_failures and not self.disabled:
+            print("    > PNRR API disabled for this run. Using the browser only.")
+            self.disabled = True
+
+    def get_company_beneficiaries(self, cui):
+        """
+        Same result as WebsiteNavigator.scrape_company_beneficiaries():
+        (names, url, denumire), or None if the backend could not answer.
+        """
+        data = self._request("GET", PNRR_API['company_details'].format(cui=cui))
+        if data is None:
+            return None
+
+        denumire = _first_present(data, PNRR_API['company_name_fields'])
+        # The beneficiaries key must be there (an empty list is fine): a missing
+        # key means another response shape, not a company without beneficiaries
+        beneficiaries_field = next((field for field in PNRR_API['beneficiaries_fields'] if field in data), None)
+        beneficiaries = data.get(beneficiaries_field) if beneficiaries_field else None
+        if denumire is None or not isinstance(beneficiaries, list):
+            # Not the response shape we expect
+            self._failed()
+            return None
+        self.failures = 0
+
+        names = [
+            str(_first_present(person, PNRR_API['beneficiary_name_fields'])).strip()
+            for person in beneficiaries
+            if _first_present(person, PNRR_API['beneficiary_name_fields'])
+        ]
+        result = ", ".join(names) if names else pd.NA
+        return result, PNRR_COMPANY_PAGE_URL.format(cui=cui), str(denumire).strip()
+
+    def get_acquisition_url(self, sicap_id):
+        """
+        Same result as WebsiteNavigator.search_acquisition_by_sicap(): the
+        details URL, "" if the search returned no acquisition, or None if
+        the backend could not answer (or answered with other acquisitions,
+        i.e. it ignored the filter).
+        """
+        payload = {PNRR_API['acquisition_filter_field']: str(sicap_id), "page": 0,
+                   "size": PNRR_API['acquisition_page_size']}
+        data = self._request("POST", PNRR_API['acquisition_search'], json=payload)
+        if data is None:
+            return None
+
+        items = data.get('content', data.get('items')) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            self._failed()
+            return None
+        if not items:
+            self.failures = 0
+            return ""
+
+        # Only the item whose code matches exactly (like sicap_api.parse_api_response)
+        wanted = str(sicap_id).replace(' ', '').upper()
+        code_field = PNRR_API['acquisition_code_field']
+        item = next((candidate for candidate in items if isinstance(candidate, dict)
+                     and str(candidate.get(code_field, '')).replace(' ', '').upper() == wanted), None)
+        acquisition_id = item.get(PNRR_API['acquisition_id_field']) if item else None
+        if acquisition_id in (None, ""):
+            self._failed()
+            return None
+        self.failures = 0
+        return PNRR_ACQUISITION_DETAILS_URL.format(id=acquisition_id)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,117 @@
+# app/scraper/waits.py
+import threading
+import time
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# Event-driven replacements for time.sleep() in the scrapers.
+# Both sites are Angular apps: coordonare.pnrr.gov.ro (Angular 2+) and
+# e-licitatie.ro (AngularJS). Angular knows when it has no pending HTTP
+# requests or timers, so we ask it instead of sleeping a fixed time.
+
+_PAGE_IDLE_SCRIPT = """
+if (document.readyState !== 'complete') { return false; }
+// Loading indicators used by both sites (Material spinners / FontAwesome)
+var spinners = document.querySelectorAll('mat-spinner, mat-progress-spinner, mat-progress-bar, i.fa-spinner');
+for (var i = 0; i < spinners.length; i++) {
+    if (spinners[i].offsetParent !== null) { return false; }
+}
+if (!arguments[0]) { return true; }
+// Angular 2+ : every app root must be stable (no pending XHR / timers)
+if (window.getAllAngularTestabilities) {
+    return window.getAllAngularTestabilities().every(function (t) { return t.isStable(); });
+}
+// AngularJS : no pending $http requests
+if (window.angular) {
+    try {
+        var injector = window.angular.element(document.body).injector();
+        if (injector) { return injector.get('$http').pendingRequests.length === 0; }
+    } catch (e) { }
+}
+return true;
+"""
+
+
+class AdaptiveTimeout:
+    """
+    Timeout that follows how long the site actually takes.
+    Keeps a moving average of observed wait times and returns
+    'factor' times that average, kept between 'minimum' and 'maximum'.
+    """
+    def __init__(self, initial=10, minimum=3, maximum=30, factor=4.0, smoothing=0.2):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.smoothing = smoothing
+        self.average = initial / factor
+
+    @property
+    def value(self):
+        return max(self.minimum, min(self.maximum, self.average * self.factor))
+
+    def observe(self, elapsed):
+        self.average = (1 - self.smoothing) * self.average + self.smoothing * elapsed
+
+
+def is_page_idle(driver, check_angular=True):
+    """
+    True when the document is loaded, no spinner is visible and
+    (if 'check_angular') Angular has no pending requests or timers.
+    """
+    try:
+        return bool(driver.execute_script(_PAGE_IDLE_SCRIPT, check_angular))
+    except WebDriverException:
+        return False
+
+
+class PageWaiter:
+    """
+    Waits for a page to become idle instead of sleeping a fixed time.
+
+    Uses an AdaptiveTimeout, so the wait follows how fast the site is today.
+    If Angular never reports "stable" (e.g. an app with a polling timer),
+    the Angular check is switched off after the first timeout and only the
+    document state and the spinners are checked from then on.
+    """
+    def __init__(self, driver, timeout=None, poll=0.1):
+        self.driver = driver
+        self.timeout = timeout or AdaptiveTimeout()
+        self.poll = poll
+        self.check_angular = True
+
+    def wait_for_idle(self):
+        """Returns the seconds waited. Never raises on timeout - the caller's
+        own element wait will report a real failure."""
+        seconds = self.timeout.value
+        start = time.monotonic()
+        try:
+            WebDriverWait(self.driver, seconds, poll_frequency=self.poll).until(
+                lambda d: is_page_idle(d, self.check_angular)
+            )
+            self.timeout.observe(time.monotonic() - start)
+        except TimeoutException:
+            if self.check_angular:
+                print(f"    > (Info) Angular not stable after {seconds:.1f}s. Checking spinners only from now on.")
+                self.check_angular = False
+            else:
+                print(f"    > (Info) Page still busy after {seconds:.1f}s. Continuing.")
+        return time.monotonic() - start
+
+
+# One PageWaiter per driver, so its timeout keeps adapting across pages. It is
+# kept on the driver itself, so it goes away with it (restarts, pool recycling).
+_waiter_lock = threading.Lock()
+
+
+def page_waiter(driver, timeout=5):
+    """The PageWaiter of a driver that has none of its own (like WebsiteNavigator.waiter)."""
+    with _waiter_lock:
+        waiter = getattr(driver, '_page_waiter', None)
+        if waiter is None:
+            waiter = driver._page_waiter = PageWaiter(driver, AdaptiveTimeout(initial=timeout))
+        return waiter
+
+
+def wait_for_page_idle(driver, timeout=5):
+    """Waits for the page of a driver to become idle, with that driver's adaptive timeout."""
+    return page_waiter(driver, timeout).wait_for_idle()
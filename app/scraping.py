@@ -1,7 +1,5 @@
 # app/scraping.py
 import pandas as pd
-import time
-import re
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.by import By
@@ -12,7 +10,6 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException,
 
 # Import all paths, URLs, and locators from our central config
 from app.utils.config import (
-    VALID_FILE_PATH,
     DRIVER_PATH,
     URL_MAP,
     SICAP_ID_HEADER,
@@ -20,13 +17,28 @@ from app.utils.config import (
     SEARCH_BUTTON,
     SEARCH_BUTTON_SPINNER,
     LIST_PAGE_LOCATORS,
+    SICAP_LOOKUP_MODE,
+    SICAP_API_CONCURRENCY,
+    SICAP_API_RATE_LIMIT,
+    SELENIUM_WORKERS,
+    DRIVER_RECYCLE_AFTER,
+    SICAP_CACHE_REFRESH_NEGATIVE,
     # DETAILS_PAGE_LOCATORS is no longer needed
 )
+from app.utils.parsing import clean_value, split_and_clean_ofertant
+from app.sicap_api import create_api_session, fetch_sicap_records
+from app.scraper.driver_pool import DriverPool
+from app.scraper.waits import wait_for_page_idle
+from app.database.db_manager import AcquisitionStore, LookupCache
+from app.utils.metrics import metrics
 
 # --- 1. Helper Functions (No changes here) ---
 
-def setup_driver():
-    """Initializes a new Selenium WebDriver instance."""
+def setup_driver(headless=False):
+    """
+    Initializes a new Selenium WebDriver instance.
+    'headless' is used by the driver pool (no visible window).
+    """
     print("  > Setting up Chrome driver...")
     
     if not DRIVER_PATH.exists():
@@ -35,8 +47,12 @@ def setup_driver():
 
     service = ChromeService(executable_path=str(DRIVER_PATH))
     options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
-    # options.add_argument("--headless")
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--disable-dev-shm-usage")
+    else:
+        options.add_argument("--start-maximized")
     
     try:
         driver = webdriver.Chrome(service=service, options=options)
@@ -46,37 +62,6 @@ def setup_driver():
         print(f"Error setting up Chrome driver: {e}")
         return None
 
-def clean_value(raw_text):
-    """
-    Cleans text like '9.749,50 RON' to '9.749,50'.
-    """
-    if pd.isna(raw_text) or not raw_text:
-        return pd.NA
-    match = re.search(r'^[0-9.,\s]+', raw_text.strip())
-    if match:
-        return match.group(0).strip()
-    return pd.NA
-
-def split_and_clean_ofertant(raw_text):
-    """
-    Splits 'RO31306086 Uniqit System SRL' OR '47489788 FULOP UNLIMITED'
-    into CUI and Name.
-    Returns (Ofertant, Ofertant CUI)
-    """
-    if pd.isna(raw_text) or not raw_text:
-        return pd.NA, pd.NA
-        
-    raw_text = raw_text.strip()
-    
-    match = re.match(r'^(RO\s*\d+|\d+)\s+(.*)$', raw_text, re.IGNORECASE)
-    
-    if match:
-        cui = match.group(1).replace(" ", "") 
-        ofertant = match.group(2).strip()
-        return ofertant, cui
-    else:
-        return raw_text, pd.NA
-
 def safe_get_text(element, locator, clean_func=None, wait_time=2):
     """
     Tries to find a sub-element and get its text.
@@ -107,8 +92,11 @@ def scrape_sicap_page(driver, sicap_id, id_type, base_url):
     Orchestrator: Searches, scrapes list, clicks, gets URL.
     Returns a dictionary of all found data.
     """
+    # Page loads and waits count as network time, reading the result as parse
+    clock = metrics.clock('scrape')
     try:
         # 1. Go to the correct search page
+        clock.switch('network')
         driver.get(base_url)
         wait = WebDriverWait(driver, 10) 
         
@@ -127,9 +115,10 @@ def scrape_sicap_page(driver, sicap_id, id_type, base_url):
         
         # 4. Wait for the spinner to disappear
         wait.until(EC.invisibility_of_element_located(SEARCH_BUTTON_SPINNER))
-        time.sleep(0.5) 
+        wait_for_page_idle(driver, timeout=5)
 
         # --- 5. Scrape ALL available data from the list ---
+        clock.switch('parse')
         scraped_data = {} 
         locators = LIST_PAGE_LOCATORS.get(id_type, {})
         
@@ -157,6 +146,7 @@ def scrape_sicap_page(driver, sicap_id, id_type, base_url):
             print(f"    > List scrape complete: {scraped_data}")
 
             # --- 6. Click the link to get the URL ---
+            clock.switch('network')
             link_to_click = wait.until(EC.element_to_be_clickable(locators.get('link_to_click')))
             print("    > Clicking result link...")
             driver.execute_script("arguments[0].click();", link_to_click)
@@ -189,120 +179,226 @@ def scrape_sicap_page(driver, sicap_id, id_type, base_url):
     except Exception as e:
         # Re-raise the exception so the 'run_scraper' can catch it
         raise e
+    finally:
+        clock.stop()
+
+def scrape_with_driver(driver, sicap_id, id_type, base_url, headless=False):
+    """
+    Runs scrape_sicap_page() and restarts the browser once if it crashed.
+    Returns (driver, scraped_data) - the driver may be a new instance.
+    """
+    with metrics.item('scrape', sicap_id, source='selenium'):
+        return _scrape_with_restart(driver, sicap_id, id_type, base_url, headless)
+
+def _scrape_with_restart(driver, sicap_id, id_type, base_url, headless):
+    try:
+        # Try to scrape the page
+        scraped_data = scrape_sicap_page(driver, sicap_id, id_type, base_url)
+
+    except InvalidSessionIdException:
+        # This is the error you saw. It means the browser crashed.
+        print(f"  > CRITICAL: Browser session crashed (InvalidSessionIdException).")
+        print("    > Restarting browser and retrying this item...")
+
+        try:
+            driver.quit() # Kill the old, dead browser
+        except Exception:
+            pass # It's already dead, no problem
+
+        metrics.count('scrape', 'driver_restarts')
+        driver = setup_driver(headless=headless) # Start a new, fresh browser
+        if driver is None:
+            print("  > Driver restart failed. Skipping item.")
+            scraped_data = {'seap_url': 'Driver restart failed'}
+        else:
+            # Retry the *same item* one more time
+            print(f"    > Retrying item: {sicap_id}")
+            metrics.count('scrape', 'retries')
+            try:
+                scraped_data = scrape_sicap_page(driver, sicap_id, id_type, base_url)
+            except Exception as e:
+                print(f"  > FAILED on retry: {e}")
+                scraped_data = {'seap_url': f'Failed on retry: {e}'}
+
+    except Exception as e:
+        # Catch any other unexpected error from scrape_sicap_page
+        print(f"  > FAILED: An unexpected error occurred: {e}")
+        scraped_data = {'seap_url': f'Error: {e}'}
+
+    return driver, scraped_data
+
+# Results that mean "try again next run" - these are never checkpointed
+RETRYABLE_RESULTS = ('Page timeout', 'Driver setup failed', 'Driver restart failed')
+
+def is_retryable_result(scraped_data):
+    """True if the row failed for a temporary reason (timeout, crash, etc.)."""
+    seap_url = str(scraped_data.get('seap_url', ''))
+    return seap_url in RETRYABLE_RESULTS or seap_url.startswith(('Error:', 'Failed on retry'))
+
+def resolve_base_url(sicap_id, id_type):
+    """
+    Returns (base_url, None) for a SICAP ID of type 'id_type' (as classified
+    by the cleaning step), or (None, failed_result) if it cannot be looked up.
+    """
+    if not id_type:
+        print(f"    > FAILED ({sicap_id}): Could not determine ID type (DA, CN, etc.)")
+        return None, {'seap_url': 'Invalid ID format'}
+
+    base_url = URL_MAP.get(id_type)
+    if not base_url:
+        print(f"    > FAILED ({sicap_id}): No URL configured for type '{id_type}'")
+        return None, {'seap_url': f'No URL for type {id_type}'}
+    return base_url, None
 
 # --- 3. Main Execution Function (UPDATED) ---
 
 def run_scraper():
     """
     Main function to run the entire scraping process.
-    (This version is resilient to browser crashes)
+    Scrapes every SICAP ID of the acquisition store that has no result yet
+    (or only a temporary failure), and saves each result as soon as it has
+    it, so a crashed run resumes where it stopped.
+    Uses the e-licitatie.ro JSON API first (see app/sicap_api.py), running
+    SICAP_API_CONCURRENCY lookups at once, and only starts Chrome for IDs
+    the API could not answer.
+    (The Selenium path is resilient to browser crashes)
     """
     print("\n--- Step 2: Running Full Data Scraper ---")
     
-    # 1. Load the cleaned data
-    if not VALID_FILE_PATH.exists():
-        print(f"Error: Cleaned file not found at {VALID_FILE_PATH}")
-        return False
-        
-    try:
-        df = pd.read_excel(VALID_FILE_PATH)
-        df_original = df.copy() 
-    except Exception as e:
-        print(f"Error reading {VALID_FILE_PATH}: {e}")
-        return False
-        
-    if df.empty:
-        print("  > No valid rows found in valid_codes.xlsx. Skipping scrape.")
+    # 1. Load the IDs still to scrape
+    store = AcquisitionStore()
+    total = store.count_acquisitions()
+    if total == 0:
+        print("  > No valid rows found in the acquisition store. Skipping scrape.")
+        print("  > (Run Step 1 (Cleaning) first.)")
+        store.close()
         return True
 
-    print(f"  > Loaded {len(df)} valid rows to scrape.")
+    acquisitions = store.acquisitions_to_scrape()
+    print(f"  > {total} valid rows, {len(acquisitions)} SICAP IDs left to scrape.")
+    if not acquisitions:
+        store.close()
+        print("--- Scraping Step Complete ---")
+        return True
 
-    # 2. Setup the *first* driver
-    driver = setup_driver()
-    if driver is None:
-        print("  > Driver setup failed. Aborting scrape.")
-        return False
+    # 2. Setup the API session. The driver is only started if an ID needs it.
+    session = None
+    if SICAP_LOOKUP_MODE == 'api':
+        session = create_api_session(pool_size=SICAP_API_CONCURRENCY)
+        print("  > Using the SICAP JSON API (Selenium as fallback).")
+    driver = None
+    driver_failed = False
 
-    # 3. Prepare for scraping
-    results_list = []
-    id_type_pattern = re.compile(r'^[A-Z]+')
+    # 3. Look up the URL of every ID type (the type was classified when cleaning).
+    pending = []  # (position, sicap_id, id_type, base_url)
 
-    # 4. Loop through all valid rows
-    for index, row in df.iterrows():
-        sicap_id = str(row[SICAP_ID_HEADER]).strip()
-        
-        print(f"\n  Processing {index + 1}/{len(df)}: {sicap_id}")
-        
-        match = id_type_pattern.match(sicap_id)
-        if not match:
-            print("    > FAILED: Could not determine ID type (DA, CN, etc.)")
-            results_list.append({'seap_url': 'Invalid ID format'})
+    for position, (sicap_id, id_type) in enumerate(acquisitions):
+        sicap_id = str(sicap_id).strip()
+        base_url, failed_result = resolve_base_url(sicap_id, id_type)
+        if failed_result is not None:
+            store.save_scrape_result(sicap_id, id_type, failed_result)
             continue
-            
-        id_type = match.group(0)
-        base_url = URL_MAP.get(id_type)
-        
-        if not base_url:
-            print(f"    > FAILED: No URL configured for type '{id_type}'")
-            results_list.append({'seap_url': f'No URL for type {id_type}'})
+
+        pending.append((position, sicap_id, id_type, base_url))
+
+    # 3b. Cross-run cache: most codes were already looked up in earlier exports
+    cache = LookupCache(refresh_negative=SICAP_CACHE_REFRESH_NEGATIVE)
+    still_pending = []
+    for job in pending:
+        cached_data = cache.get(job[1], job[2])
+        if cached_data is None:
+            still_pending.append(job)
+        else:
+            store.save_scrape_result(job[1], job[2], cached_data)
+    metrics.count('scrape', 'cache_hits', len(pending) - len(still_pending))
+    if len(still_pending) < len(pending):
+        print(f"  > {len(pending) - len(still_pending)} IDs served from the SICAP cache, "
+              f"{len(still_pending)} left to scrape.")
+    pending = still_pending
+
+    saved_ids = set()
+
+    def save_result(job, scraped_data):
+        # Written as soon as a record finishes, so a crash loses nothing.
+        # Temporary failures are stored too, and scraped again next time.
+        if scraped_data is None:
+            return
+        saved_ids.add(job[1])
+        retryable = is_retryable_result(scraped_data)
+        if retryable:
+            metrics.count('scrape', 'retryable_failures')
+        store.save_scrape_result(job[1], job[2], scraped_data, retryable=retryable)
+        if not retryable:
+            cache.put(job[1], job[2], scraped_data)
+
+    # 4. FAST PATH: concurrent JSON API lookups
+    if session is not None and pending:
+        rate = f"max {SICAP_API_RATE_LIMIT} req/s" if SICAP_API_RATE_LIMIT > 0 else "no rate limit"
+        print(f"  > Looking up {len(pending)} IDs through the API "
+              f"({SICAP_API_CONCURRENCY} at a time, {rate})...")
+        lookups = [(sicap_id, id_type) for _, sicap_id, id_type, _ in pending]
+        api_jobs = pending
+        api_results = fetch_sicap_records(
+            session, lookups, concurrency=SICAP_API_CONCURRENCY, rate_limit=SICAP_API_RATE_LIMIT,
+            on_result=lambda i, scraped_data: save_result(api_jobs[i], scraped_data),
+        )
+        pending = [job for job, scraped_data in zip(pending, api_results) if scraped_data is None]
+        metrics.count('scrape', 'selenium_fallbacks', len(pending))
+        if pending:
+            print(f"  > {len(pending)} IDs could not be answered by the API. Falling back to Selenium.")
+
+    # 5a. SELENIUM FALLBACK with a pool of headless browsers
+    if pending and SELENIUM_WORKERS > 1:
+        print(f"\n  > Scraping {len(pending)} IDs with {SELENIUM_WORKERS} headless browsers...")
+        pool = DriverPool(
+            driver_factory=lambda: setup_driver(headless=True),
+            size=SELENIUM_WORKERS,
+            recycle_after=DRIVER_RECYCLE_AFTER,
+            failed_result={'seap_url': 'Driver setup failed'},
+        )
+        pool_results = pool.run(
+            pending, lambda d, *job: scrape_with_driver(d, *job, headless=True),
+            on_result=save_result,
+        )
+        # Jobs no worker could start (driver setup failed) never reached on_result
+        for job in pending:
+            if job[1] not in saved_ids:
+                save_result(job, pool_results[job[0]])
+        pending = []
+
+    # 5b. SELENIUM FALLBACK with one browser (started on first use)
+    for count, job in enumerate(pending, start=1):
+        position, sicap_id, id_type, base_url = job
+        print(f"\n  Processing {count}/{len(pending)}: {sicap_id}")
+
+        if driver is None and not driver_failed:
+            driver = setup_driver()
+            driver_failed = driver is None
+        if driver is None:
+            print("  > Driver setup failed. Skipping item.")
+            save_result(job, {'seap_url': 'Driver setup failed'})
             continue
-            
-        # --- 5. NEW RESILIENT SCRAPING BLOCK ---
-        try:
-            # Try to scrape the page
-            scraped_data = scrape_sicap_page(driver, sicap_id, id_type, base_url)
-            
-        except InvalidSessionIdException:
-            # This is the error you saw. It means the browser crashed.
-            print(f"  > CRITICAL: Browser session crashed (InvalidSessionIdException).")
-            print("    > Restarting browser and retrying this item...")
-            
-            try:
-                driver.quit() # Kill the old, dead browser
-            except Exception:
-                pass # It's already dead, no problem
-                
-            driver = setup_driver() # Start a new, fresh browser
-            if driver is None:
-                print("  > Driver restart failed. Skipping item.")
-                scraped_data = {'seap_url': 'Driver restart failed'}
-            else:
-                # Retry the *same item* one more time
-                print(f"    > Retrying item: {sicap_id}")
-                try:
-                    scraped_data = scrape_sicap_page(driver, sicap_id, id_type, base_url)
-                except Exception as e:
-                    print(f"  > FAILED on retry: {e}")
-                    scraped_data = {'seap_url': f'Failed on retry: {e}'}
 
-        except Exception as e:
-            # Catch any other unexpected error from scrape_sicap_page
-            print(f"  > FAILED: An unexpected error occurred: {e}")
-            scraped_data = {'seap_url': f'Error: {e}'}
-            
-        results_list.append(scraped_data)
+        driver, scraped_data = scrape_with_driver(driver, sicap_id, id_type, base_url)
+        save_result(job, scraped_data)
             
     # 6. Close the *last* browser
-    try:
-        driver.quit()
-        print("\n  > Scraping Complete.")
-    except Exception as e:
-        print(f"\n  > (Info) Error quitting final browser: {e}")
-    
-    # 7. Save results back to the Excel file
-    try:
-        results_df = pd.DataFrame(results_list)
-        
-        df_original.reset_index(drop=True, inplace=True)
-        results_df.reset_index(drop=True, inplace=True)
-        
-        final_df = pd.concat([df_original, results_df], axis=1)
-        
-        final_df.to_excel(VALID_FILE_PATH, index=False)
-        print(f"  > Successfully updated {VALID_FILE_PATH} with all scraped data.")
-    except Exception as e:
-        print(f"  > CRITICAL ERROR: Could not save results to {VALID_FILE_PATH}: {e}")
-        return False
+    if session is not None:
+        session.close()
+    if driver is not None:
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"\n  > (Info) Error quitting final browser: {e}")
+    print("\n  > Scraping Complete.")
+    cache.print_stats()
+    cache.close()
+
+    # 7. Everything is already in the store; report what is left
+    left = len(store.sicap_ids_to_scrape())
+    store.close()
+    if left:
+        print(f"  > {left} IDs failed temporarily and will be retried on the next run.")
         
     print("--- Scraping Step Complete ---")
-    return True
\ No newline at end of file
+    return True
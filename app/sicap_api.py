@@ -0,0 +1,208 @@
+# app/sicap_api.py
+import asyncio
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+import pandas as pd
+
+from app.utils.config import (
+    URL_MAP,
+    SICAP_API_MAP,
+    SICAP_API_HEADERS,
+    SICAP_API_TIMEOUT,
+)
+from app.utils.parsing import split_and_clean_ofertant, format_ron_value
+from app.utils.metrics import metrics
+
+# e-licitatie.ro is called with verify=False (same as api_tester.py)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def create_api_session(pool_size=10):
+    """
+    Creates a requests.Session with the headers the e-licitatie.ro app sends.
+    Re-using one session keeps the HTTPS connection alive between lookups.
+    'pool_size' should be at least the number of concurrent lookups.
+    """
+    session = requests.Session()
+    session.headers.update(SICAP_API_HEADERS)
+    session.verify = False
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def build_api_request(sicap_id, id_type):
+    """
+    Returns (api_url, payload, headers) for a SICAP ID,
+    or None if there is no API configured for this ID type.
+    """
+    api_config = SICAP_API_MAP.get(id_type)
+    if not api_config:
+        return None
+
+    payload = dict(api_config['payload'])
+    payload[api_config['filter_field']] = sicap_id
+    headers = {"Referer": URL_MAP.get(id_type, "https://www.e-licitatie.ro/")}
+    return api_config['api_url'], payload, headers
+
+
+def parse_api_response(data, sicap_id, id_type):
+    """
+    Converts the JSON list response into the same dictionary
+    scrape_sicap_page() returns (Ofertant, Ofertant CUI, Valoare estimata,
+    Valoare cumparare directa, seap_url).
+    Returns None if the response does not look like we expect, so the
+    caller can fall back to Selenium.
+    """
+    api_config = SICAP_API_MAP[id_type]
+
+    if not isinstance(data, dict) or 'items' not in data:
+        return None
+
+    items = data.get('items') or []
+    if not items:
+        print("    > FAILED: 0 results found (API).")
+        return {'seap_url': '0 results found'}
+
+    # Only the item whose code matches exactly: if the server ignored the
+    # filter, the items are other notices and Selenium must answer instead
+    code_field = api_config.get('code_field')
+    wanted = sicap_id.replace(' ', '').upper()
+    item = next((candidate for candidate in items if code_field and isinstance(candidate, dict)
+                 and str(candidate.get(code_field, '')).replace(' ', '').upper() == wanted), None)
+    if item is None:
+        print(f"    > No exact match for {sicap_id} in the API results. Falling back to the browser.")
+        return None
+
+    view_id = item.get(api_config['id_field'])
+    if view_id is None:
+        return None
+
+    scraped_data = {}
+
+    ofertant_field = api_config.get('ofertant_field')
+    ofertant_raw = item.get(ofertant_field) if ofertant_field else None
+    scraped_data['Ofertant'], scraped_data['Ofertant CUI'] = split_and_clean_ofertant(ofertant_raw)
+
+    valoare_field = api_config.get('valoare_estimata_field')
+    scraped_data['Valoare estimata'] = format_ron_value(item.get(valoare_field)) if valoare_field else pd.NA
+
+    cumparare_field = api_config.get('valoare_cumparare_field')
+    if cumparare_field:
+        scraped_data['Valoare cumparare directa'] = format_ron_value(item.get(cumparare_field))
+
+    scraped_data['seap_url'] = f"{api_config['view_url']}{view_id}"
+    return scraped_data
+
+
+def fetch_sicap_record(session, sicap_id, id_type):
+    """
+    Looks up a single SICAP ID through the e-licitatie.ro JSON API.
+    Returns the scraped dictionary, or None if the API could not be used
+    (no endpoint for this type, network error, unexpected response).
+    """
+    request = build_api_request(sicap_id, id_type)
+    if request is None:
+        return None
+    api_url, payload, headers = request
+
+    with metrics.item('scrape', sicap_id, source='api'):
+        try:
+            with metrics.phase('network'):
+                response = session.post(api_url, json=payload, headers=headers, timeout=SICAP_API_TIMEOUT)
+                response.raise_for_status()
+            with metrics.phase('parse'):
+                data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"    > API request failed for {sicap_id}: {e}")
+            metrics.count('scrape', 'api_errors')
+            return None
+
+        with metrics.phase('parse'):
+            return parse_api_response(data, sicap_id, id_type)
+
+
+# --- Concurrent lookups ---
+
+class TokenBucket:
+    """
+    Asyncio token bucket: allows 'rate' requests per second on average,
+    with bursts of up to 'capacity' requests. 'rate' must be positive.
+    """
+    def __init__(self, rate, capacity):
+        if rate <= 0:
+            raise ValueError(f"TokenBucket rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _fetch_all(session, lookups, concurrency, rate_limit, on_result):
+    """
+    Runs fetch_sicap_record() for every (sicap_id, id_type) in 'lookups'
+    with at most 'concurrency' requests in flight and one token bucket per host.
+    The blocking requests call runs in a worker thread.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    buckets = {}
+    results = [None] * len(lookups)
+
+    async def fetch_one(position, sicap_id, id_type):
+        request = build_api_request(sicap_id, id_type)
+        if request is None:
+            return position, None
+        host = urlparse(request[0]).netloc
+        if rate_limit > 0 and host not in buckets:
+            buckets[host] = TokenBucket(rate_limit, max(1, concurrency))
+
+        async with semaphore:
+            if host in buckets:
+                # Time spent waiting for the rate limit counts as sleep
+                waiting = time.perf_counter()
+                await buckets[host].acquire()
+                metrics.add_phase('scrape', 'sleep', time.perf_counter() - waiting)
+            result = await asyncio.to_thread(fetch_sicap_record, session, sicap_id, id_type)
+        return position, result
+
+    tasks = [fetch_one(position, sicap_id, id_type) for position, (sicap_id, id_type) in enumerate(lookups)]
+    done = 0
+    for finished in asyncio.as_completed(tasks):
+        position, result = await finished
+        results[position] = result
+        if on_result is not None:
+            on_result(position, result)
+        done += 1
+        if done % 50 == 0 or done == len(lookups):
+            print(f"  > API lookups finished: {done}/{len(lookups)}")
+
+    return results
+
+
+def fetch_sicap_records(session, lookups, concurrency=8, rate_limit=5.0, on_result=None):
+    """
+    Looks up many SICAP IDs concurrently.
+    'lookups' is a list of (sicap_id, id_type) tuples.
+    'on_result(position, result)' is called as soon as each lookup finishes.
+    Returns a list in the same order as 'lookups'; an entry is None when
+    the API could not answer that ID (the caller falls back to Selenium).
+    """
+    if not lookups:
+        return []
+    return asyncio.run(_fetch_all(session, lookups, max(1, concurrency), rate_limit, on_result))
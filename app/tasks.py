@@ -0,0 +1,419 @@
+# app/tasks.py
+from pathlib import Path
+import pandas as pd
+from celery import Celery, chord
+from celery.signals import worker_process_shutdown
+
+from app.scraping import setup_driver, scrape_with_driver, is_retryable_result, resolve_base_url
+from app.sicap_api import create_api_session, fetch_sicap_record
+from app.scraper.navigator import WebsiteNavigator
+from app.scraper.pnrr_client import PnrrApiClient
+from app.pnrr_scraper import check_ofertant, NO_ACQUISITION_FOUND
+from app.doc_generator import (
+    _render_job,
+    load_input_rows,
+    plan_documents,
+    save_generation_results,
+    get_template_hash,
+    TEMPLATES,
+)
+from app.database.db_manager import AcquisitionStore, LookupCache, CompanyStore, DocumentManifest
+from app.utils.config import (
+    CELERY_BROKER_URL,
+    CELERY_RESULT_BACKEND,
+    CELERY_ALWAYS_EAGER,
+    CELERY_RESULT_TIMEOUT,
+    SICAP_LOOKUP_MODE,
+    SICAP_CACHE_REFRESH_NEGATIVE,
+    DRIVER_RECYCLE_AFTER,
+    PNRR_EMAIL,
+    PNRR_PASSWORD,
+    PNRR_USE_API,
+    PNRR_COMPANY_PAGE_URL,
+    SESSION_COOKIE_PATH,
+    GENERATED_DOCS_DIR,
+    DOC_FORCE_REGENERATE,
+)
+
+# Celery version of the slow parts of the workflow: every SICAP lookup,
+# PNRR lookup and document render is one task, so a monthly run can be
+# spread over several worker processes or machines.
+#
+# Each step is a chord: every lookup / render task saves its own result
+# into the acquisition store (and the cross-run caches) as soon as it has
+# it, exactly like the interactive steps do, so a failed task or a timeout
+# loses nothing that already finished. The workers share processed/ with
+# the submitting side. The chord's callback only prints the summary.
+# The submitting side reads the store, serves what the caches already
+# know, and only sends the rest.
+
+celery_app = Celery("acquisitions", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+celery_app.conf.update(
+    task_always_eager=CELERY_ALWAYS_EAGER,
+    task_eager_propagates=True,
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    # Lookups are slow and uneven: a worker only takes the next one when it is free
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+)
+
+
+# --- Per-process resources ---
+# A worker process re-uses its API session / browser for all its tasks.
+
+_resources = {}
+
+
+def _sicap_session():
+    if 'sicap_session' not in _resources:
+        _resources['sicap_session'] = create_api_session(pool_size=1)
+    return _resources['sicap_session']
+
+
+def _sicap_driver():
+    """A headless browser, restarted every DRIVER_RECYCLE_AFTER lookups (None if it can't start)."""
+    driver = _resources.get('driver')
+    if driver is not None and _resources.get('driver_uses', 0) >= DRIVER_RECYCLE_AFTER:
+        _quit(driver)
+        driver = None
+    if driver is None:
+        driver = setup_driver(headless=True)
+        _resources['driver'] = driver
+        _resources['driver_uses'] = 0
+    _resources['driver_uses'] = _resources.get('driver_uses', 0) + 1
+    return driver
+
+
+def _pnrr_client():
+    """API client with the saved login cookies (None if disabled or never logged in)."""
+    if not PNRR_USE_API:
+        return None
+    if 'pnrr_client' not in _resources:
+        _resources['pnrr_client'] = PnrrApiClient.from_cookie_file(SESSION_COOKIE_PATH)
+    return _resources['pnrr_client']
+
+
+def _pnrr_navigator():
+    """A headless navigator logged in with the saved cookies (None if the login failed)."""
+    if 'navigator' not in _resources:
+        navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD, headless=True)
+        if not navigator.login():
+            navigator.close()
+            navigator = None
+        _resources['navigator'] = navigator
+    return _resources['navigator']
+
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+@worker_process_shutdown.connect
+def close_resources(**kwargs):
+    if _resources.get('sicap_session') is not None:
+        _resources['sicap_session'].close()
+    if _resources.get('driver') is not None:
+        _quit(_resources['driver'])
+    if _resources.get('pnrr_client') is not None:
+        _resources['pnrr_client'].close()
+    if _resources.get('navigator') is not None:
+        _resources['navigator'].close()
+    _resources.clear()
+
+
+def _json_safe(value):
+    """pd.NA / NaN -> None, so results can go through the JSON serializer."""
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return None if pd.isna(value) else value
+
+
+# --- Step 2: SICAP lookups ---
+
+@celery_app.task(name="sicap.lookup")
+def lookup_sicap_id(sicap_id, id_type, base_url):
+    """
+    Looks up one SICAP ID (API first, then a browser) and saves the result.
+    Returns [sicap_id, retryable].
+    """
+    scraped_data = None
+    if SICAP_LOOKUP_MODE == 'api':
+        scraped_data = fetch_sicap_record(_sicap_session(), sicap_id, id_type)
+    if scraped_data is None:
+        driver = _sicap_driver()
+        if driver is None:
+            scraped_data = {'seap_url': 'Driver setup failed'}
+        else:
+            driver, scraped_data = scrape_with_driver(driver, sicap_id, id_type, base_url, headless=True)
+            _resources['driver'] = driver
+    return [sicap_id, _save_scrape_result(sicap_id, id_type, scraped_data)]
+
+
+def _save_scrape_result(sicap_id, id_type, scraped_data):
+    """Saves one lookup into the acquisition store and the SICAP cache. Returns True if retryable."""
+    retryable = is_retryable_result(scraped_data)
+    store = AcquisitionStore()
+    cache = LookupCache(refresh_negative=SICAP_CACHE_REFRESH_NEGATIVE)
+    try:
+        store.save_scrape_result(sicap_id, id_type, scraped_data, retryable=retryable)
+        if not retryable:
+            cache.put(sicap_id, id_type, scraped_data)
+    finally:
+        cache.close()
+        store.close()
+    return retryable
+
+
+@celery_app.task(name="sicap.summary")
+def save_scrape_results(results):
+    """Chord callback: the lookups are already saved, only counts them."""
+    retry_count = sum(1 for _, retryable in results if retryable)
+    print(f"  > Saved {len(results)} SICAP results ({retry_count} to retry).")
+    return {'saved': len(results), 'retryable': retry_count}
+
+
+def submit_scraping():
+    """
+    Sends the SICAP IDs of the store that still need a lookup to the
+    workers. Returns the chord's AsyncResult, or None if nothing is left.
+    """
+    store = AcquisitionStore()
+    cache = LookupCache(refresh_negative=SICAP_CACHE_REFRESH_NEGATIVE)
+    lookups = []
+    try:
+        for sicap_id, id_type in store.acquisitions_to_scrape():
+            sicap_id = str(sicap_id).strip()
+            base_url, failed_result = resolve_base_url(sicap_id, id_type)
+            if failed_result is not None:
+                store.save_scrape_result(sicap_id, id_type, failed_result)
+                continue
+            cached_data = cache.get(sicap_id, id_type)
+            if cached_data is not None:
+                store.save_scrape_result(sicap_id, id_type, cached_data)
+                continue
+            lookups.append(lookup_sicap_id.s(sicap_id, id_type, base_url))
+    finally:
+        cache.close()
+        store.close()
+
+    if not lookups:
+        return None
+    print(f"  > Sending {len(lookups)} SICAP lookups to the Celery workers...")
+    return chord(lookups)(save_scrape_results.s())
+
+
+# --- Step 4: PNRR beneficiaries ---
+
+@celery_app.task(name="pnrr.lookup_company")
+def lookup_company(cui):
+    """Looks up and saves the company page of one supplier CUI. Returns ['company', cui, failed]."""
+    result = None
+    try:
+        client = _pnrr_client()
+        if client is not None:
+            result = client.get_company_beneficiaries(cui)
+        if result is None and _pnrr_navigator() is not None:
+            result = _pnrr_navigator().scrape_company_beneficiaries(cui)
+    except Exception as e:
+        print(f"    > CRITICAL ERROR during scrape for {cui}: {e}")
+        result = None
+    _save_company(cui, result)
+    return ['company', cui, result is None]
+
+
+def _save_company(cui, result):
+    """Saves one company page into the store (and the company store if it has a name)."""
+    store = AcquisitionStore()
+    company_store = CompanyStore()
+    try:
+        if result is None:
+            store.save_company(cui, "SCRAPE FAILED", PNRR_COMPANY_PAGE_URL.format(cui=cui), None)
+            return
+        names, url, denumire = result
+        if denumire:
+            company_store.put(cui, names, url, denumire)
+        store.save_company(cui, names, url, denumire)
+        check_ofertant(store, cui, denumire)
+    finally:
+        company_store.close()
+        store.close()
+
+
+@celery_app.task(name="pnrr.lookup_acquisition")
+def lookup_acquisition(sicap_id):
+    """Looks up and saves the PNRR details URL of one SICAP ID. Returns ['acquisition', sicap_id, False]."""
+    acquisition_url = None
+    try:
+        client = _pnrr_client()
+        if client is not None:
+            acquisition_url = client.get_acquisition_url(sicap_id)
+        if acquisition_url is None and _pnrr_navigator() is not None:
+            navigator = _pnrr_navigator()
+            acquisition_url = navigator.search_acquisition_by_sicap(sicap_id)
+            # Navigate back to prevent issues with the next search
+            navigator.driver.get("https://coordonare.pnrr.gov.ro/#/acquisitions/view")
+            navigator.waiter.wait_for_idle()
+    except Exception as e:
+        print(f" > Error searching for acquisition: {e}")
+        acquisition_url = None
+    store = AcquisitionStore()
+    try:
+        store.save_acquisition_url(sicap_id, acquisition_url or NO_ACQUISITION_FOUND)
+    finally:
+        store.close()
+    return ['acquisition', sicap_id, False]
+
+
+@celery_app.task(name="pnrr.summary")
+def save_beneficiary_results(results):
+    """Chord callback: the companies and acquisition URLs are already saved, only counts them."""
+    failed_count = sum(1 for kind, _, failed in results if kind == 'company' and failed)
+    print(f"  > Saved {len(results)} PNRR results ({failed_count} companies failed).")
+    return {'saved': len(results), 'failed': failed_count}
+
+
+def submit_beneficiaries():
+    """
+    Sends the companies and acquisitions of the store that still need a
+    PNRR lookup to the workers (companies already in the company store are
+    saved right away). Logs in once here, so the workers can use the saved
+    session cookies. Returns the chord's AsyncResult, or None.
+    """
+    store = AcquisitionStore()
+    company_store = CompanyStore()
+    try:
+        company_cuis = []
+        for cui in store.companies_to_scrape():
+            stored = company_store.get(cui)
+            if stored is None:
+                company_cuis.append(cui)
+            else:
+                store.save_company(cui, *stored)
+                check_ofertant(store, cui, stored[2])
+        sicap_ids = store.acquisitions_to_search()
+    finally:
+        company_store.close()
+        store.close()
+
+    if not company_cuis and not sicap_ids:
+        return None
+
+    # Fresh session/cookies.json for the workers
+    navigator = WebsiteNavigator(email=PNRR_EMAIL, password=PNRR_PASSWORD)
+    try:
+        if not navigator.login():
+            raise RuntimeError("PNRR login failed; cannot send the beneficiary lookups.")
+    finally:
+        navigator.close()
+
+    print(f"  > Sending {len(company_cuis)} company and {len(sicap_ids)} acquisition lookups "
+          f"to the Celery workers...")
+    lookups = [lookup_company.s(cui) for cui in company_cuis]
+    lookups += [lookup_acquisition.s(sicap_id) for sicap_id in sicap_ids]
+    return chord(lookups)(save_beneficiary_results.s())
+
+
+# --- Step 5: document rendering ---
+
+@celery_app.task(name="documents.render")
+def render_document(job, template_hash):
+    """
+    Renders one planned document (see doc_generator.plan_documents()) and
+    records it in the document manifest, so the next run skips it.
+    """
+    job = dict(job, template_path=Path(job['template_path']), output_path=Path(job['output_path']))
+    result = _render_job(job)
+    if result['success'] and result.get('doc_key'):
+        manifest = DocumentManifest()
+        try:
+            manifest.put_many([(result['doc_key'], result['template'], result['context_hash'],
+                                template_hash, result['output_path'])])
+        finally:
+            manifest.close()
+    return result
+
+
+@celery_app.task(name="documents.summary")
+def save_document_results(results, unchanged, template_hashes):
+    """Chord callback: the manifest is already updated, only writes the generation report."""
+    failed_count = save_generation_results(results, unchanged, template_hashes, update_manifest=False)
+    return {'rendered': len(results) - failed_count, 'unchanged': len(unchanged), 'failed': failed_count}
+
+
+def submit_document_generation(excel_files=None, force=DOC_FORCE_REGENERATE):
+    """
+    Plans the documents here (output paths are claimed in row order, like
+    run_document_generation()) and sends one render task per document.
+    Always writes loose .docx files (DOC_OUTPUT_MODE=zip needs one process
+    to own each archive, so it stays with run_document_generation()).
+    Returns the chord's AsyncResult, or None if there is nothing to render.
+    """
+    df = load_input_rows(excel_files)
+    if df.empty:
+        print(" > No rows to generate documents for.")
+        return None
+
+    GENERATED_DOCS_DIR.mkdir(exist_ok=True)
+    template_hashes = {template_type: get_template_hash(path) for template_type, path in TEMPLATES}
+    jobs, unchanged = plan_documents(df, template_hashes, force=force)
+    unchanged = _json_safe(unchanged)
+    if not jobs:
+        save_generation_results([], unchanged, template_hashes)
+        return None
+
+    print(f" > Sending {len(jobs)} documents to the Celery workers "
+          f"({len(unchanged)} unchanged since the last run)...")
+    renders = [
+        render_document.s(_json_safe(dict(job, template_path=str(job['template_path']),
+                                          output_path=str(job['output_path']))),
+                          template_hashes[job['template_type']])
+        for job in jobs
+    ]
+    return chord(renders)(save_document_results.s(unchanged, template_hashes))
+
+
+# --- Workflow steps (run_workflow.py --celery) ---
+
+def _wait(async_result, step_name):
+    """Waits for a step's chord. Returns True if it finished (or there was nothing to do)."""
+    if async_result is None:
+        print(f"  > Nothing to send for {step_name}.")
+        return True
+    try:
+        summary = async_result.get(timeout=CELERY_RESULT_TIMEOUT)
+    except Exception as e:
+        print(f"  > {step_name} failed on the Celery workers: {e}")
+        return False
+    finally:
+        if CELERY_ALWAYS_EAGER:
+            # The tasks ran in this process: close their browser / sessions now
+            close_resources()
+    print(f"  > {step_name} done: {summary}")
+    return True
+
+
+def run_scraper_with_celery():
+    print("\n--- Step 2: Scraping SICAP (Celery) ---")
+    return _wait(submit_scraping(), "SICAP scraping")
+
+
+def run_beneficiary_scraper_with_celery():
+    print("--- Step 4: Scraping Real Beneficiaries (PNRR, Celery) ---")
+    try:
+        async_result = submit_beneficiaries()
+    except RuntimeError as e:
+        print(f"  > {e}")
+        return False
+    return _wait(async_result, "Beneficiary scraping")
+
+
+def run_document_generation_with_celery():
+    print("--- Step 5: Generating Documents (Celery) ---")
+    return _wait(submit_document_generation(), "Document generation")
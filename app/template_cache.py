@@ -0,0 +1,149 @@
+# app/template_cache.py
+import copy
+import hashlib
+import io
+import re
+import threading
+from jinja2 import Template
+import docxtpl
+from docxtpl import DocxTemplate
+
+# Parsing a .docx and preparing its XML for Jinja is most of the cost of
+# rendering one document (unzip + parse + docxtpl's patch_xml regexes +
+# Jinja compile). Every row uses the same two templates, so we do that work
+# once per template file and render each row from a cheap copy.
+#
+# CompiledTemplate copies the internals of render_xml_part() and
+# build_headers_footers_xml() from docxtpl 0.20.2. With any other docxtpl
+# version we render with a plain DocxTemplate instead (slower, but correct).
+COMPILED_DOCXTPL_VERSIONS = ('0.20.2',)
+USE_COMPILED = getattr(docxtpl, '__version__', None) in COMPILED_DOCXTPL_VERSIONS
+if not USE_COMPILED:
+    print(f"Warning: template cache written for docxtpl {', '.join(COMPILED_DOCXTPL_VERSIONS)}, "
+          f"found {getattr(docxtpl, '__version__', 'unknown')}. Rendering without it.")
+
+
+def _compile_xml(xml):
+    """Same preparation as DocxTemplate.render_xml_part(), but done once."""
+    return Template(re.sub(r"<w:p([ >])", r"\n<w:p\1", xml))
+
+
+class _CompiledMaster:
+    """The parsed document and pre-compiled Jinja templates of one .docx file."""
+    def __init__(self, path):
+        self.path = path
+        stat = path.stat()
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        data = path.read_bytes()
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
+        tpl = DocxTemplate(io.BytesIO(data))
+        tpl.init_docx()
+        self.docx = tpl.docx
+
+        # Body
+        self.body_template = _compile_xml(tpl.patch_xml(tpl.get_xml()))
+
+        # Headers and footers, keyed by relationship ID
+        self.part_templates = {}
+        for uri in (DocxTemplate.HEADER_URI, DocxTemplate.FOOTER_URI):
+            for rel_key, part in tpl.get_headers_footers(uri):
+                xml = tpl.get_part_xml(part)
+                encoding = tpl.get_headers_footers_encoding(xml)
+                self.part_templates[rel_key] = (_compile_xml(tpl.patch_xml(xml)), encoding)
+
+
+class CompiledTemplate(DocxTemplate):
+    """
+    A DocxTemplate that starts from a deep copy of the cached document and
+    renders the cached Jinja templates instead of re-parsing the file.
+    Use get_template() to create one; each instance renders one document.
+    """
+    def __init__(self, master):
+        super().__init__(master.path)
+        self.master = master
+        self.docx = copy.deepcopy(master.docx)
+
+    def init_docx(self, reload=True):
+        if not self.docx or (self.is_rendered and reload):
+            self.docx = copy.deepcopy(self.master.docx)
+            self.is_rendered = False
+
+    def _render_compiled(self, template, part, context):
+        # Post-processing copied from DocxTemplate.render_xml_part()
+        self.current_rendering_part = part
+        dst_xml = template.render(context)
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
+
+    def build_xml(self, context, jinja_env=None):
+        if jinja_env is not None:
+            return super().build_xml(context, jinja_env)
+        return self._render_compiled(self.master.body_template, self.docx._part, context)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        if jinja_env is not None:
+            yield from super().build_headers_footers_xml(context, uri, jinja_env)
+            return
+        for rel_key, part in self.get_headers_footers(uri):
+            template, encoding = self.master.part_templates[rel_key]
+            yield rel_key, self._render_compiled(template, part, context).encode(encoding)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _is_current(master):
+    """True if the template file on disk is still the one we compiled."""
+    stat = master.path.stat()
+    if stat.st_mtime_ns == master.mtime_ns and stat.st_size == master.size:
+        return True
+    # mtime changed (e.g. file copied again) - only recompile if the content did
+    if hashlib.sha256(master.path.read_bytes()).hexdigest() == master.sha256:
+        master.mtime_ns = stat.st_mtime_ns
+        master.size = stat.st_size
+        return True
+    return False
+
+
+def _get_master(template_path):
+    with _cache_lock:
+        master = _cache.get(template_path)
+        if master is None or not _is_current(master):
+            if master is not None:
+                print(f" > Template changed on disk, recompiling: {template_path.name}")
+            master = _CompiledMaster(template_path)
+            _cache[template_path] = master
+    return master
+
+
+def get_template(template_path):
+    """
+    Returns a fresh CompiledTemplate for 'template_path'.
+    The file is parsed and compiled only the first time (and again if it
+    changed on disk); later calls only copy the parsed document.
+    (A plain DocxTemplate on docxtpl versions we have not checked.)
+    """
+    if not USE_COMPILED:
+        return DocxTemplate(template_path)
+    return CompiledTemplate(_get_master(template_path))
+
+
+def get_template_hash(template_path):
+    """SHA-256 of the template file's content (from the cache)."""
+    if not USE_COMPILED:
+        return hashlib.sha256(template_path.read_bytes()).hexdigest()
+    return _get_master(template_path).sha256
+
+
+def clear_template_cache():
+    with _cache_lock:
+        _cache.clear()
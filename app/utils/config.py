@@ -11,17 +11,31 @@ PNRR_EMAIL = os.getenv("PNRR_EMAIL")
 PNRR_PASSWORD = os.getenv("PNRR_PASSWORD")
 # --- Base Directories ---
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-PROCESSED_DIR = BASE_DIR / "processed"
-GENERATED_DOCS_DIR = BASE_DIR / "generated_docs"
+# RUN_DIR moves the data of a run (processed/ and the generated folders)
+# into its own folder; the web API uses one per submitted run. The
+# cross-run caches stay in CACHE_DIR (the benchmarks use their own).
+RUN_DIR = Path(os.getenv("RUN_DIR")) if os.getenv("RUN_DIR") else BASE_DIR
+CACHE_DIR = Path(os.getenv("CACHE_DIR")) if os.getenv("CACHE_DIR") else BASE_DIR / "processed"
+PROCESSED_DIR = RUN_DIR / "processed"
+GENERATED_DOCS_DIR = RUN_DIR / "generated_docs"
+GENERATED_ARCHIVES_DIR = RUN_DIR / "generated_archives"
+GENERATED_PDFS_DIR = RUN_DIR / "generated_pdfs"
+ATTACHMENTS_DIR = BASE_DIR / "attachments"  # scanned attachments, one sub-folder per SICAP ID
 
 # --- 1. CLEANING FILE PATHS ---
 INPUT_FILE_NAME = 'export_achizitii_2025-10-20T12_03_21.815970182_2012.xlsx'
-INPUT_FILE_PATH = BASE_DIR / INPUT_FILE_NAME
+INPUT_FILE_PATH = Path(os.getenv("INPUT_FILE_PATH", BASE_DIR / INPUT_FILE_NAME))
 VALID_FILE_PATH = PROCESSED_DIR / "valid_codes.xlsx"
 INVALID_FILE_PATH = PROCESSED_DIR / "invalid_codes.xlsx"
 VALID_CODES_WITH_CUI_PATH = PROCESSED_DIR / "valid_codes_with_cui.xlsx"
 VALID_CODES_WITH_CUI_PATH_TEST = PROCESSED_DIR / "valid_codes_with_cui_test.xlsx"
 VALID_CODES_NO_CUI_PATH = PROCESSED_DIR / "valid_codes_no_cui.xlsx"
+# Tables passed between the steps (and the typed copy of the reports) are
+# written as "parquet" or "feather" next to the .xlsx paths above. The
+# .xlsx reports are only written with EXPORT_EXCEL=1 in .env (or when
+# export_reports(excel=True) is called).
+INTERMEDIATE_FORMAT = os.getenv("INTERMEDIATE_FORMAT", "parquet")
+EXPORT_EXCEL = os.getenv("EXPORT_EXCEL", "0") == "1"
 
 # --- 2. SCRAPING URL MAP ---
 URL_MAP = {
@@ -32,6 +46,114 @@ URL_MAP = {
     'ADV': "https://www.e-licitatie.ro/pub/adv-notices/list/1",
 }
 
+# --- 2b. SICAP JSON API (used instead of Selenium when available) ---
+# 'api' = use the JSON endpoints first and fall back to Selenium per row.
+# 'selenium' = always use the browser (old behaviour).
+SICAP_LOOKUP_MODE = os.getenv("SICAP_LOOKUP_MODE", "api")
+SICAP_API_TIMEOUT = 15  # seconds per request
+# Host of the JSON endpoints below (the benchmarks point it at a local stub server)
+SICAP_API_BASE_URL = os.getenv("SICAP_API_BASE_URL", "https://www.e-licitatie.ro")
+# How many API lookups run at the same time, and how many requests per second
+# we allow towards e-licitatie.ro (token bucket, bursts up to the concurrency;
+# 0 or less = no rate limit).
+SICAP_API_CONCURRENCY = int(os.getenv("SICAP_API_CONCURRENCY", "8"))
+SICAP_API_RATE_LIMIT = float(os.getenv("SICAP_API_RATE_LIMIT", "5"))
+
+# The same headers the e-licitatie.ro Angular app sends (see api_tester.py)
+SICAP_API_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8,ro;q=0.7",
+    "Authorization": "Bearer null",
+    "Connection": "keep-alive",
+    "Content-Type": "application/json;charset=UTF-8",
+    "Culture": "ro-RO",
+    "HttpSessionID": "null",
+    "Origin": "https://www.e-licitatie.ro",
+    "RefreshToken": "null",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36",
+}
+
+# One entry per ID type (same keys as URL_MAP).
+# 'filter_field' is the payload key that receives the SICAP ID,
+# 'id_field' is the item key used to build the public 'seap_url',
+# the '*_field' entries map list item keys to our Excel columns (None = not available).
+SICAP_API_MAP = {
+    'DA': {
+        'api_url': SICAP_API_BASE_URL + "/api-pub/DirectAcquisitionCommon/GetDirectAcquisitionList/",
+        'view_url': "https://www.e-licitatie.ro/pub/direct-acquisition/view/",
+        'payload': {
+            "pageSize": 5, "pageIndex": 0, "showOngoingDa": True, "cookieContext": None,
+            "sysDirectAcquisitionStateId": None,
+            "finalizationDateStart": None, "finalizationDateEnd": None,
+            "publicationDateStart": None, "publicationDateEnd": None,
+        },
+        'filter_field': "uniqueIdentificationCode",
+        'code_field': "uniqueIdentificationCode",
+        'id_field': "directAcquisitionId",
+        'ofertant_field': "supplierName",
+        'valoare_estimata_field': "estimatedValueRon",
+        'valoare_cumparare_field': "closingValue",
+    },
+    'DAN': {
+        'api_url': SICAP_API_BASE_URL + "/api-pub/DaAwardNoticeCommon/GetDaAwardNoticeList/",
+        'view_url': "https://www.e-licitatie.ro/pub/da-award-notice/view/",
+        'payload': {
+            "pageSize": 5, "pageIndex": 0, "cookieContext": None,
+            "startPublicationDate": None, "endPublicationDate": None,
+        },
+        'filter_field': "noticeNo",
+        'code_field': "noticeNo",
+        'id_field': "daAwardNoticeId",
+        'ofertant_field': "supplierName",
+        'valoare_estimata_field': "estimatedValueRon",
+        'valoare_cumparare_field': None,
+    },
+    'CN': {
+        'api_url': SICAP_API_BASE_URL + "/api-pub/NoticeCommon/GetCNoticeList/",
+        'view_url': "https://www.e-licitatie.ro/pub/notices/c-notice/v2/view/",
+        'payload': {
+            "pageSize": 5, "pageIndex": 0, "sysNoticeTypeIds": [2], "sortProperties": [],
+            "hasUnansweredQuestions": False, "sysProcedureStateId": None,
+            "startPublicationDate": None, "endPublicationDate": None,
+        },
+        'filter_field': "noticeNo",
+        'code_field': "noticeNo",
+        'id_field': "cNoticeId",
+        'ofertant_field': None,
+        'valoare_estimata_field': "estimatedValueRon",
+        'valoare_cumparare_field': None,
+    },
+    'SCN': {
+        'api_url': SICAP_API_BASE_URL + "/api-pub/NoticeCommon/GetCNoticeList/",
+        'view_url': "https://www.e-licitatie.ro/pub/notices/c-notice/v2/view/",
+        'payload': {
+            "pageSize": 5, "pageIndex": 0, "sysNoticeTypeIds": [17], "sortProperties": [],
+            "hasUnansweredQuestions": False, "sysProcedureStateId": None,
+            "startPublicationDate": None, "endPublicationDate": None,
+        },
+        'filter_field': "noticeNo",
+        'code_field': "noticeNo",
+        'id_field': "cNoticeId",
+        'ofertant_field': None,
+        'valoare_estimata_field': "estimatedValueRon",
+        'valoare_cumparare_field': None,
+    },
+    'ADV': {
+        'api_url': SICAP_API_BASE_URL + "/api-pub/AdvNoticeCommon/GetAdvNoticeList/",
+        'view_url': "https://www.e-licitatie.ro/pub/adv-notice/view/",
+        'payload': {
+            "pageSize": 5, "pageIndex": 0, "cookieContext": None,
+            "startPublicationDate": None, "endPublicationDate": None,
+        },
+        'filter_field': "noticeNo",
+        'code_field': "noticeNo",
+        'id_field': "advNoticeId",
+        'ofertant_field': None,
+        'valoare_estimata_field': "estimatedValueRon",
+        'valoare_cumparare_field': None,
+    },
+}
+
 # --- 3. SCRAPING LOCATORS (BASED ON seap result DIVS.txt) ---
 
 # Locators for the SEARCH INPUT field on each page
@@ -111,6 +233,118 @@ DETAILS_PAGE_LOCATORS = {
 TEMPLATE_1_FILE = BASE_DIR / "templates" / "template1.docx"
 TEMPLATE_2_FILE = BASE_DIR / "templates" / "template2.docx"
 DRIVER_PATH = BASE_DIR / "drivers" / "chromedriver.exe"
+# Processes used to render documents. 1 = render in this process, 0 = one per CPU core.
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", "1"))
+GENERATION_REPORT_PATH = PROCESSED_DIR / f"generation_report.{INTERMEDIATE_FORMAT}"  # read by the PDF step
+GENERATION_REPORT_XLSX_PATH = PROCESSED_DIR / "generation_report.xlsx"  # only with EXPORT_EXCEL=1
+# "files": one .docx per document in GENERATED_DOCS_DIR.
+# "zip": documents are written straight into one ZIP per group (with a
+# manifest) in a new folder of GENERATED_ARCHIVES_DIR for every run.
+DOC_OUTPUT_MODE = os.getenv("DOC_OUTPUT_MODE", "files")
+DOC_ARCHIVE_GROUP_COLUMN = 'Denumire autoritate contractantă'  # e.g. 'CUI autoritate contractantă'; None = one archive
+# PDF step after document generation (needs LibreOffice; OCR needs Tesseract).
+# Off by default, so machines without LibreOffice still finish the workflow;
+# set GENERATE_PDFS=1 in .env to enable.
+GENERATE_PDFS = os.getenv("GENERATE_PDFS", "0") == "1"
+LIBREOFFICE_PATH = os.getenv("LIBREOFFICE_PATH", "")  # empty = look in PATH and the default install folders
+PDF_CONVERT_BATCH_SIZE = 50  # documents converted per LibreOffice process
+PDF_CONVERT_TIMEOUT = 600  # seconds per batch
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))  # 0 = one per CPU core
+OCR_LANGUAGES = ['ron', 'eng']
+# Number of headless Chrome workers for the SICAP Selenium fallback.
+# 1 = the old single, visible browser.
+SELENIUM_WORKERS = int(os.getenv("SELENIUM_WORKERS", "1"))
+DRIVER_RECYCLE_AFTER = 200  # restart a pooled browser after this many items
+# Number of headless PNRR navigators sharing the saved login (session/cookies.json).
+# 1 = the old single browser.
+PNRR_WORKERS = int(os.getenv("PNRR_WORKERS", "1"))
+SESSION_COOKIE_PATH = Path(os.getenv("SESSION_COOKIE_PATH", BASE_DIR / "session" / "cookies.json"))  # saved by WebsiteNavigator.login()
+
+# --- PNRR backend (JSON endpoints behind the Angular app) ---
+# Used with the SESSION cookie from session/cookies.json; the Selenium
+# navigator stays as fallback. Off by default: the endpoints and field names
+# below have not been checked against the live site yet. Set PNRR_USE_API=1
+# in .env to enable.
+PNRR_USE_API = os.getenv("PNRR_USE_API", "0") == "1"
+PNRR_BASE_URL = "https://coordonare.pnrr.gov.ro"
+PNRR_API_TIMEOUT = 15  # seconds per request
+PNRR_API_BASE_URL = os.getenv("PNRR_API_BASE_URL", PNRR_BASE_URL)  # a local stub in the benchmarks
+PNRR_API = {
+    # GET, returns the company with its real beneficiaries
+    'company_details': PNRR_API_BASE_URL + "/api/acquisitions/companies/{cui}",
+    'company_name_fields': ['denumire', 'name'],
+    'beneficiaries_fields': ['beneficiariReali', 'realBeneficiaries', 'beneficiaries'],
+    'beneficiary_name_fields': ['name', 'nume'],
+    # POST, paged search of acquisitions
+    'acquisition_search': PNRR_API_BASE_URL + "/api/acquisitions/search",
+    'acquisition_filter_field': "numarAnuntSicap",
+    'acquisition_code_field': "numarAnuntSicap",  # the SICAP code of each item, matched exactly
+    'acquisition_id_field': "id",
+    'acquisition_page_size': 20,
+}
+PNRR_COMPANY_PAGE_URL = PNRR_BASE_URL + "/#/acquisitions/detalii-companie/{cui}"
+PNRR_ACQUISITION_DETAILS_URL = PNRR_BASE_URL + "/#/acquisitions/acquisition-details/{id}"
+
+# --- WORKFLOW RUNNER (run_workflow.py) ---
+# "Done" stamps of the steps; a step is skipped when its outputs are newer
+# than its inputs. Steps that don't depend on each other run in parallel.
+WORKFLOW_STATE_DIR = PROCESSED_DIR / "workflow"
+WORKFLOW_MAX_PARALLEL = int(os.getenv("WORKFLOW_MAX_PARALLEL", "2"))
+# One JSON line per step event (started / done / skipped / failed), read
+# by the web API to show the progress of a run.
+WORKFLOW_EVENTS_PATH = WORKFLOW_STATE_DIR / "events.jsonl"
+# Timings of every run (per step, per item, retries, cache hits...) as JSON
+# lines, appended run after run (see app/utils/metrics.py)
+METRICS_PATH = PROCESSED_DIR / "metrics.jsonl"
+
+# --- WEB API (app/web.py) ---
+# Every submitted export gets a folder in WEB_RUNS_DIR and runs
+# run_workflow.py in its own process; at most WEB_MAX_CONCURRENT_RUNS at once.
+WEB_RUNS_DIR = BASE_DIR / "web_runs"
+WEB_MAX_CONCURRENT_RUNS = int(os.getenv("WEB_MAX_CONCURRENT_RUNS", "2"))
+WEB_MAX_UPLOAD_MB = 50
+
+# --- CELERY (app/tasks.py, run_workflow.py --celery) ---
+# Lookups and document rendering fanned out to Celery workers. Start the
+# workers from the project folder (they share processed/, generated_docs/
+# and session/ with the machine that submits the run):
+#   celery -A app.tasks worker --loglevel=info
+# CELERY_ALWAYS_EAGER=1 runs the tasks in the submitting process instead
+# (no Redis or workers needed, e.g. for tests).
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
+CELERY_ALWAYS_EAGER = os.getenv("CELERY_ALWAYS_EAGER", "0") == "1"
+CELERY_RESULT_TIMEOUT = 6 * 3600  # seconds to wait for one step's chord
 
 # --- 5. EXCEL HEADERS ---
-SICAP_ID_HEADER = 'Nr. anunt SICAP'
\ No newline at end of file
+SICAP_ID_HEADER = 'Nr. anunt SICAP'
+
+# --- 6. LOCAL DATABASE ---
+# Acquisitions of the current run and the results of every step (the
+# hand-off between the workflow steps; a crashed step resumes from it).
+ACQUISITION_DB_PATH = PROCESSED_DIR / "acquisitions.sqlite"
+
+# Cross-run cache of SICAP lookups (the same codes recur in monthly exports).
+# TTL in days per ID type; results without a SEAP URL ("0 results found")
+# use SICAP_CACHE_NEGATIVE_TTL_DAYS. Set SICAP_CACHE_REFRESH_NEGATIVE=1 in
+# .env to ignore cached negative results for one run.
+SICAP_CACHE_PATH = CACHE_DIR / "sicap_cache.sqlite"
+SICAP_CACHE_TTL_DAYS = {
+    'DA': 90,
+    'DAN': 90,
+    'CN': 30,
+    'SCN': 30,
+    'ADV': 30,
+}
+SICAP_CACHE_NEGATIVE_TTL_DAYS = 1
+SICAP_CACHE_REFRESH_NEGATIVE = os.getenv("SICAP_CACHE_REFRESH_NEGATIVE", "0") == "1"
+
+# Cross-run store of PNRR company pages (beneficiaries per supplier CUI)
+COMPANY_CACHE_PATH = CACHE_DIR / "pnrr_companies.sqlite"
+COMPANY_CACHE_TTL_DAYS = 30
+
+# Manifest of generated documents (hash of each row's context + template).
+# Documents whose row and template did not change since the last run are
+# skipped. Set DOC_FORCE_REGENERATE=1 in .env to render everything again.
+DOC_MANIFEST_PATH = PROCESSED_DIR / "documents_manifest.sqlite"
+DOC_FORCE_REGENERATE = os.getenv("DOC_FORCE_REGENERATE", "0") == "1"
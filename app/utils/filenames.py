@@ -0,0 +1,69 @@
+# app/utils/filenames.py
+import os
+import threading
+from pathlib import Path
+
+# Unique output filenames without probing the disk in a loop.
+# The folder is listed once; after that, free names come from memory, and
+# each one is claimed with an exclusive create (O_EXCL), so two workers or
+# two runs writing to the same (network) folder can never get the same file.
+
+
+class FilenameAllocator:
+    """
+    Hands out unique file paths in one output folder.
+
+    'suffix_format' builds the name used when the plain name is taken, from
+    the original 'stem', the 'suffix' (extension) and a counter 'n' that
+    starts at 1, e.g. "{stem}_{n}{suffix}" -> "DA123_LV_1.docx".
+    Safe to use from several threads.
+    """
+    def __init__(self, directory, suffix_format="{stem}_{n}{suffix}"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.suffix_format = suffix_format
+        self.lock = threading.Lock()
+        # One directory listing instead of one stat() per candidate name
+        with os.scandir(self.directory) as entries:
+            self.taken = {entry.name for entry in entries}
+        # Next counter to try for every name we already handed out
+        self.next_counter = {}
+
+    def _candidates(self, filename):
+        """Yields the plain name first, then the numbered names."""
+        if filename not in self.next_counter:
+            yield filename
+        stem, suffix = Path(filename).stem, Path(filename).suffix
+        while True:
+            n = self.next_counter.get(filename, 1)
+            self.next_counter[filename] = n + 1
+            yield self.suffix_format.format(stem=stem, suffix=suffix, n=n)
+
+    def claim(self, filename):
+        """
+        Returns a path for 'filename' (or a numbered variant of it) and
+        creates it as an empty file, so nobody else can take it.
+        The caller then overwrites the file with the real content.
+        """
+        with self.lock:
+            for candidate in self._candidates(filename):
+                if candidate in self.taken:
+                    continue
+                self.taken.add(candidate)
+                path = self.directory / candidate
+                try:
+                    # Exclusive create: fails if another process got there first
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                except FileExistsError:
+                    continue
+                return path
+
+
+def release_unused(path):
+    """Deletes a claimed file that was never written (e.g. rendering failed)."""
+    try:
+        path = Path(path)
+        if path.exists() and path.stat().st_size == 0:
+            path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,225 @@
+# app/utils/metrics.py
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Timing and counters for the workflow, so we can see where the hours go.
+#
+# Every step's wall time is split into phases (network wait, sleep, parse,
+# render, io, prepare); every item (a SICAP ID, a company, a document) gets
+# its own record with its phases; counters track retries, restarts and
+# cache hits.
+# Records are appended as JSON lines to the file given to start_run(), and
+# summary() prints one table at the end of the run.
+#
+# Usage:
+#   with metrics.item('scrape', sicap_id):       # per-item wall time
+#       with metrics.phase('network'):           # phase of the current item
+#           response = session.post(...)
+#   metrics.count('scrape', 'cache_hits', 12)
+#
+# item() and step() set the "current step" of the thread, so phase() inside
+# them needs no step name. Worker threads of a step (driver pool, API
+# threads) must name the step in item() themselves.
+
+PHASES = ('network', 'sleep', 'parse', 'render', 'io', 'prepare')
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.path = None
+        self.run_id = None
+        self.steps = {}     # step -> {'wall', 'items', 'item_time', 'phases': {phase: seconds}}
+        self.counters = {}  # step -> {name: count}
+
+    def start_run(self, path):
+        """Starts a new run: clears the totals and appends records to 'path' from now on."""
+        with self.lock:
+            self.path = Path(path)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.steps = {}
+            self.counters = {}
+        self._write({'type': 'run', 'event': 'started'})
+
+    def _write(self, record):
+        if self.path is None:
+            return
+        record = {'time': datetime.now().isoformat(timespec='milliseconds'), 'run': self.run_id, **record}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    def _step_totals(self, step):
+        # Called with self.lock held
+        if step not in self.steps:
+            self.steps[step] = {'wall': 0.0, 'items': 0, 'item_time': 0.0,
+                                'phases': {phase: 0.0 for phase in PHASES}}
+        return self.steps[step]
+
+    def current_step(self):
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1][0] if stack else None
+
+    # --- Recording ---
+
+    def add_phase(self, step, phase, seconds):
+        """Adds 'seconds' of 'phase' to a step (and to the current item of this thread)."""
+        step = step or self.current_step() or 'other'
+        with self.lock:
+            phases = self._step_totals(step)['phases']
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        stack = getattr(self.local, 'stack', None)
+        if stack and stack[-1][0] == step and stack[-1][1] is not None:
+            item_phases = stack[-1][1]
+            item_phases[phase] = item_phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase, step=None):
+        """Times the block as 'phase' of 'step' (default: the thread's current step)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(step, phase, time.perf_counter() - started)
+
+    def add_item(self, step, item_id, seconds, phases=None, **info):
+        """Records one finished item (e.g. a document rendered in another process)."""
+        phases = {phase: round(value, 4) for phase, value in (phases or {}).items()}
+        with self.lock:
+            totals = self._step_totals(step)
+            totals['items'] += 1
+            totals['item_time'] += seconds
+            for phase, value in phases.items():
+                totals['phases'][phase] = totals['phases'].get(phase, 0.0) + value
+        self._write({'type': 'item', 'step': step, 'item': item_id, 'seconds': round(seconds, 4),
+                     'phases': phases, **info})
+
+    @contextmanager
+    def item(self, step, item_id, **info):
+        """Times one item of 'step'; phase() calls inside it are split out per item."""
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        phases = {}
+        stack.append((step, phases))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            seconds = time.perf_counter() - started
+            with self.lock:
+                totals = self._step_totals(step)
+                totals['items'] += 1
+                totals['item_time'] += seconds
+            self._write({'type': 'item', 'step': step, 'item': item_id, 'seconds': round(seconds, 4),
+                         'phases': {phase: round(value, 4) for phase, value in phases.items()}, **info})
+
+    @contextmanager
+    def step(self, step):
+        """Times a whole workflow step and makes it the current step of this thread."""
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append((step, None))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            seconds = time.perf_counter() - started
+            with self.lock:
+                totals = self._step_totals(step)
+                totals['wall'] += seconds
+                summary = self._step_summary(step)
+            self._write({'type': 'step', 'step': step, **summary})
+
+    def clock(self, step=None):
+        """A PhaseClock for code with many return paths (see PhaseClock)."""
+        return PhaseClock(self, step or self.current_step())
+
+    def count(self, step, name, value=1):
+        """Adds 'value' to the counter 'name' of 'step' (retries, restarts, cache hits...)."""
+        if not value:
+            return
+        with self.lock:
+            counters = self.counters.setdefault(step, {})
+            counters[name] = counters.get(name, 0) + value
+
+    # --- Summary ---
+
+    def _step_summary(self, step):
+        # Called with self.lock held
+        totals = self.steps.get(step) or {'wall': 0.0, 'items': 0, 'item_time': 0.0, 'phases': {}}
+        wall = totals['wall']
+        return {
+            'wall': round(wall, 3),
+            'items': totals['items'],
+            'items_per_sec': round(totals['items'] / wall, 2) if wall and totals['items'] else None,
+            'avg_item': round(totals['item_time'] / totals['items'], 4) if totals['items'] else None,
+            'phases': {phase: round(value, 3) for phase, value in totals['phases'].items() if value},
+            'counters': dict(self.counters.get(step, {})),
+        }
+
+    def summary(self):
+        """Returns {step: summary} for every step with a record, and writes it as a JSON line."""
+        with self.lock:
+            names = list(self.steps) + [step for step in self.counters if step not in self.steps]
+            summary = {step: self._step_summary(step) for step in names}
+        self._write({'type': 'summary', 'steps': summary})
+        return summary
+
+    def print_summary(self):
+        """Prints the summary table (times in seconds; phases can overlap in parallel steps)."""
+        summary = self.summary()
+        if not summary:
+            return
+        header = f"{'step':<14}{'wall':>9}{'items':>8}{'items/s':>9}{'avg':>8}" + "".join(f"{p:>9}" for p in PHASES)
+        print("\n--- Timing Summary ---")
+        print(header)
+        print("-" * len(header))
+        for step, row in summary.items():
+            rate = f"{row['items_per_sec']:.1f}" if row['items_per_sec'] else "-"
+            avg = f"{row['avg_item']:.2f}" if row['avg_item'] is not None else "-"
+            phases = "".join(f"{row['phases'].get(phase, 0.0):>9.1f}" for phase in PHASES)
+            print(f"{step:<14}{row['wall']:>9.1f}{row['items']:>8}{rate:>9}{avg:>8}{phases}")
+        for step, row in summary.items():
+            if row['counters']:
+                counters = ", ".join(f"{name}={value}" for name, value in sorted(row['counters'].items()))
+                print(f"  {step}: {counters}")
+        if self.path is not None:
+            print(f" > Details: {self.path}")
+
+
+class PhaseClock:
+    """
+    Splits a function into consecutive phases without nesting it in with-blocks:
+    switch('parse') ends the running phase and starts the next one, stop()
+    ends the last one (call it in a 'finally').
+    """
+    def __init__(self, recorder, step):
+        self.recorder = recorder
+        self.step = step
+        self.phase = None
+        self.started = None
+
+    def switch(self, phase):
+        self.stop()
+        self.phase = phase
+        self.started = time.perf_counter()
+
+    def stop(self):
+        if self.phase is not None:
+            self.recorder.add_phase(self.step, self.phase, time.perf_counter() - self.started)
+            self.phase = None
+
+
+# One recorder per process
+metrics = Metrics()
@@ -0,0 +1,53 @@
+# app/utils/parsing.py
+import re
+import pandas as pd
+
+# Shared text helpers used by both the Selenium scraper (app/scraping.py)
+# and the JSON API client (app/sicap_api.py).
+
+def clean_value(raw_text):
+    """
+    Cleans text like '9.749,50 RON' to '9.749,50'.
+    """
+    if pd.isna(raw_text) or not raw_text:
+        return pd.NA
+    match = re.search(r'^[0-9.,\s]+', raw_text.strip())
+    if match:
+        return match.group(0).strip()
+    return pd.NA
+
+def split_and_clean_ofertant(raw_text):
+    """
+    Splits 'RO31306086 Uniqit System SRL' OR '47489788 FULOP UNLIMITED'
+    into CUI and Name.
+    Returns (Ofertant, Ofertant CUI)
+    """
+    if pd.isna(raw_text) or not raw_text:
+        return pd.NA, pd.NA
+
+    raw_text = raw_text.strip()
+
+    match = re.match(r'^(RO\s*\d+|\d+)\s+(.*)$', raw_text, re.IGNORECASE)
+
+    if match:
+        cui = match.group(1).replace(" ", "")
+        ofertant = match.group(2).strip()
+        return ofertant, cui
+    else:
+        return raw_text, pd.NA
+
+def format_ron_value(number):
+    """
+    Formats a number from the API (e.g. 9749.5) the same way the website
+    displays it ('9.749,50'), so API and Selenium results look identical.
+    """
+    if number is None or pd.isna(number):
+        return pd.NA
+    if isinstance(number, str):
+        return clean_value(number)
+    try:
+        text = f"{float(number):,.2f}"
+    except (ValueError, TypeError):
+        return pd.NA
+    # 9,749.50 -> 9.749,50
+    return text.replace(',', ' ').replace('.', ',').replace(' ', '.')
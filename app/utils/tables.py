@@ -0,0 +1,73 @@
+# app/utils/tables.py
+from pathlib import Path
+import pandas as pd
+
+# Tables passed between the workflow steps are written as Parquet (or
+# Feather) instead of Excel: reading and writing them takes milliseconds
+# instead of minutes with openpyxl, and the column types are stored in
+# the file, so nothing has to be guessed when the next step reads it.
+# Excel is only written for people (see export_reports()).
+
+TABLE_FORMATS = ('parquet', 'feather')
+
+
+def _as_text(values):
+    """The values as a string column; whole floats lose their '.0' (4305849.0 -> '4305849')."""
+    def to_text(value):
+        if pd.isna(value):
+            return pd.NA
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    return values.astype(object).map(to_text).astype('string')
+
+
+def apply_schema(df, dtypes, default='string'):
+    """
+    Returns 'df' with explicit column types: 'dtypes' maps column -> dtype,
+    every other column gets 'default' (None = leave it as it is).
+    Numeric values that cannot be converted become NA.
+    """
+    df = df.copy()
+    for column in df.columns:
+        dtype = dtypes.get(column, default)
+        if dtype is None:
+            continue
+        if dtype == 'string':
+            df[column] = _as_text(df[column])
+        elif dtype == 'boolean':
+            df[column] = df[column].astype('boolean')
+        else:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df
+
+
+def table_path(path, table_format):
+    """'path' with the file extension of 'table_format' ('parquet' or 'feather')."""
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format '{table_format}' (use one of {TABLE_FORMATS})")
+    return Path(path).with_suffix(f".{table_format}")
+
+
+def write_table(df, path):
+    """Writes 'df' as Parquet or Feather, depending on the extension of 'path'."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.feather':
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_parquet(path, index=False)
+
+
+def read_table(path, dtypes=None):
+    """
+    Reads a table written by write_table(), or an Excel file. Excel files
+    have no column types, so 'dtypes' (see apply_schema()) is applied to them.
+    """
+    path = Path(path)
+    if path.suffix == '.feather':
+        return pd.read_feather(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    df = pd.read_excel(path, dtype=object)
+    return apply_schema(df, dtypes) if dtypes is not None else df
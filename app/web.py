@@ -0,0 +1,246 @@
+# app/web.py
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from flask import Flask, Response, abort, jsonify, request, send_file
+from werkzeug.utils import secure_filename
+
+from app.database.db_manager import AcquisitionStore
+from app.workflow import read_events
+from app.utils.config import (
+    BASE_DIR,
+    WEB_RUNS_DIR,
+    WEB_MAX_CONCURRENT_RUNS,
+    WEB_MAX_UPLOAD_MB,
+)
+
+# Small job API around run_workflow.py, so officers can submit an export
+# from the browser instead of running the script at a terminal:
+#
+#   POST /runs                   upload an export (.xlsx) -> {"run_id": ...}
+#   GET  /runs                   every run and its status
+#   GET  /runs/<id>              status, step events and progress counters
+#   GET  /runs/<id>/stream       the same, as server-sent events until it ends
+#   GET  /runs/<id>/download     ZIP with the documents, PDFs and reports
+#   GET  /runs/<id>/log          the run's console output
+#
+# Every run gets its own folder (RUN_DIR) and runs run_workflow.py in its
+# own process, so runs never share an acquisition store and a crashed run
+# cannot take the server down. The request only saves the upload and
+# queues the run; at most WEB_MAX_CONCURRENT_RUNS run at once.
+
+RUN_SCRIPT = BASE_DIR / "run_workflow.py"
+OUTPUT_FOLDERS = ['generated_docs', 'generated_archives', 'generated_pdfs']
+STREAM_INTERVAL = 2  # seconds between server-sent events
+
+
+class RunManager:
+    """Queues workflow runs and keeps track of them (state is also saved in each run folder)."""
+    def __init__(self, runs_dir=WEB_RUNS_DIR, max_concurrent=WEB_MAX_CONCURRENT_RUNS):
+        self.runs_dir = Path(runs_dir)
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.download_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.runs = {}
+        # Runs of an earlier server process (those that were still going are lost)
+        for status_path in self.runs_dir.glob("*/status.json"):
+            run = json.loads(status_path.read_text(encoding='utf-8'))
+            if run['status'] in ('queued', 'running'):
+                run['status'] = 'interrupted'
+            self.runs[run['run_id']] = run
+
+    def run_dir(self, run_id):
+        return self.runs_dir / run_id
+
+    def _update(self, run_id, **changes):
+        with self.lock:
+            run = self.runs[run_id]
+            run.update(changes)
+            (self.run_dir(run_id) / "status.json").write_text(json.dumps(run, indent=2), encoding='utf-8')
+            return dict(run)
+
+    def submit(self, upload, submitted_by=None, output_mode=None):
+        """Saves the uploaded export and queues its run. Returns the run record."""
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        run_dir = self.run_dir(run_id)
+        run_dir.mkdir(parents=True)
+        input_path = run_dir / (secure_filename(upload.filename) or "export.xlsx")
+        upload.save(input_path)
+
+        with self.lock:
+            self.runs[run_id] = {
+                'run_id': run_id,
+                'status': 'queued',
+                'input_file': input_path.name,
+                'submitted_by': submitted_by,
+                'output_mode': output_mode,
+                'submitted_at': datetime.now().isoformat(timespec='seconds'),
+                'started_at': None,
+                'finished_at': None,
+                'return_code': None,
+            }
+        record = self._update(run_id)
+        self.executor.submit(self._run, run_id, input_path, output_mode)
+        return record
+
+    def _run(self, run_id, input_path, output_mode):
+        """Runs the workflow of one run in a child process (in a pool thread)."""
+        run_dir = self.run_dir(run_id)
+        # The officers download the reports, so they are written as Excel too
+        env = dict(os.environ, RUN_DIR=str(run_dir), INPUT_FILE_PATH=str(input_path),
+                   EXPORT_EXCEL="1", PYTHONUNBUFFERED="1")
+        if output_mode:
+            env['DOC_OUTPUT_MODE'] = output_mode
+        self._update(run_id, status='running', started_at=datetime.now().isoformat(timespec='seconds'))
+        try:
+            with open(run_dir / "run.log", 'w', encoding='utf-8') as log:
+                process = subprocess.run(
+                    [sys.executable, str(RUN_SCRIPT)], cwd=str(BASE_DIR), env=env,
+                    stdout=log, stderr=subprocess.STDOUT,
+                )
+            status = 'finished' if process.returncode == 0 else 'failed'
+            return_code = process.returncode
+        except Exception as e:
+            print(f" > Run {run_id} could not be started: {e}")
+            status, return_code = 'failed', None
+        self._update(run_id, status=status, return_code=return_code,
+                     finished_at=datetime.now().isoformat(timespec='seconds'))
+
+    def get(self, run_id):
+        with self.lock:
+            run = self.runs.get(run_id)
+            return dict(run) if run is not None else None
+
+    def list(self):
+        with self.lock:
+            return sorted((dict(run) for run in self.runs.values()),
+                          key=lambda run: run['submitted_at'], reverse=True)
+
+    def progress(self, run_id):
+        """The run record plus its step events and progress counters."""
+        run = self.get(run_id)
+        if run is None:
+            return None
+        run_dir = self.run_dir(run_id)
+        processed_dir = run_dir / "processed"
+
+        events = read_events(processed_dir / "workflow" / "events.jsonl")
+        steps = {}
+        for event in events:
+            if event['step'] != 'workflow':
+                steps[event['step']] = {key: value for key, value in event.items() if key != 'step'}
+
+        counters = {}
+        db_path = processed_dir / "acquisitions.sqlite"
+        if db_path.exists():
+            store = AcquisitionStore(db_path)
+            try:
+                counters = store.progress()
+            finally:
+                store.close()
+        docs_dir = run_dir / "generated_docs"
+        if docs_dir.is_dir():
+            counters['documents'] = sum(1 for path in docs_dir.glob("*.docx") if path.stat().st_size > 0)
+
+        return {**run, 'steps': steps, 'counters': counters}
+
+    def build_download(self, run_id):
+        """Zips the run's outputs once (documents, archives, PDFs, reports). Returns the path."""
+        run_dir = self.run_dir(run_id)
+        zip_path = run_dir / f"{run_id}.zip"
+        with self.download_lock:
+            if zip_path.exists():
+                return zip_path
+            partial_path = zip_path.with_suffix(".zip.part")
+            with zipfile.ZipFile(partial_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+                for folder in OUTPUT_FOLDERS:
+                    for path in sorted((run_dir / folder).rglob("*")):
+                        if path.is_file():
+                            zf.write(path, path.relative_to(run_dir))
+                for path in sorted((run_dir / "processed").glob("*.xlsx")):
+                    zf.write(path, path.relative_to(run_dir))
+            partial_path.replace(zip_path)
+        return zip_path
+
+
+def create_app(manager=None):
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = WEB_MAX_UPLOAD_MB * 1024 * 1024
+    manager = manager or RunManager()
+    app.extensions['run_manager'] = manager
+
+    def get_run_or_404(run_id):
+        run = manager.get(run_id)
+        if run is None:
+            abort(404, description=f"Run {run_id} not found")
+        return run
+
+    @app.post("/runs")
+    def submit_run():
+        upload = request.files.get('export')
+        if upload is None or not upload.filename:
+            return jsonify(error="Upload the export workbook as the 'export' file field."), 400
+        if not upload.filename.lower().endswith('.xlsx'):
+            return jsonify(error="The export must be an .xlsx workbook."), 400
+        output_mode = request.form.get('output_mode') or None
+        if output_mode not in (None, 'files', 'zip'):
+            return jsonify(error="output_mode must be 'files' or 'zip'."), 400
+        run = manager.submit(upload, submitted_by=request.form.get('submitted_by'), output_mode=output_mode)
+        return jsonify(run), 202
+
+    @app.get("/runs")
+    def list_runs():
+        return jsonify(manager.list())
+
+    @app.get("/runs/<run_id>")
+    def run_status(run_id):
+        get_run_or_404(run_id)
+        return jsonify(manager.progress(run_id))
+
+    @app.get("/runs/<run_id>/stream")
+    def run_stream(run_id):
+        get_run_or_404(run_id)
+
+        def events():
+            last = None
+            while True:
+                progress = manager.progress(run_id)
+                data = json.dumps(progress)
+                if data != last:
+                    yield f"data: {data}\n\n"
+                    last = data
+                if progress['status'] not in ('queued', 'running'):
+                    return
+                time.sleep(STREAM_INTERVAL)
+
+        return Response(events(), mimetype="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
+    @app.get("/runs/<run_id>/download")
+    def run_download(run_id):
+        run = get_run_or_404(run_id)
+        if run['status'] != 'finished':
+            return jsonify(error=f"Run is {run['status']}; outputs are available when it has finished."), 409
+        return send_file(manager.build_download(run_id), as_attachment=True)
+
+    @app.get("/runs/<run_id>/log")
+    def run_log(run_id):
+        get_run_or_404(run_id)
+        log_path = manager.run_dir(run_id) / "run.log"
+        text = log_path.read_text(encoding='utf-8', errors='replace') if log_path.exists() else ""
+        return Response(text, mimetype="text/plain")
+
+    return app
+
+
+if __name__ == "__main__":
+    # threaded=True: status requests and streams are served while runs go on
+    create_app().run(host=os.getenv("WEB_HOST", "127.0.0.1"), port=int(os.getenv("WEB_PORT", "5000")), threaded=True)
@@ -0,0 +1,220 @@
+# app/workflow.py
+import json
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from app.utils.metrics import metrics
+
+# A small make-like runner for the workflow steps. Every step declares the
+# files it reads, the files it writes and the steps it runs after. A step
+# whose outputs are newer than all its inputs is skipped, so e.g. editing a
+# template only re-runs document generation and what comes after it.
+# Steps that do not depend on each other run at the same time.
+#
+# Most results live in the acquisition store, which every step updates, so
+# each step also writes a "done" stamp file; the stamp is one of its outputs
+# and an input of the steps that run after it.
+
+
+class Step:
+    """
+    One workflow step. 'run' is called without arguments and returns True
+    on success (like the existing run_* functions). 'inputs' and 'outputs'
+    are file paths; 'after' are names of steps that must finish first.
+    'pending' (optional) is called without arguments and returns True while
+    the step still has work left in the store (e.g. lookups that failed for
+    a temporary reason); the step is then never up to date.
+    Disabled steps are left out of the run.
+    """
+    def __init__(self, name, run, inputs=(), outputs=(), after=(), enabled=True, description="",
+                 pending=None):
+        self.name = name
+        self.run = run
+        self.pending = pending
+        self.inputs = [Path(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+        self.after = list(after)
+        self.enabled = enabled
+        self.description = description
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class Workflow:
+    """
+    Runs a list of Steps in dependency order.
+
+    run() with no selection runs every out-of-date step. 'from_step' runs
+    that step and everything after it; 'only' runs just the named steps.
+    Selected steps always run, the others are skipped if up to date.
+    When a step fails, the steps after it are not started.
+    """
+    def __init__(self, steps, state_dir, max_parallel=2, on_event=None):
+        self.steps = {step.name: step for step in steps}
+        self.state_dir = Path(state_dir)
+        self.max_parallel = max_parallel
+        # on_event(step_name, state, elapsed_seconds) for every state change
+        self.on_event = on_event
+        self.print_lock = threading.Lock()
+        for step in steps:
+            for name in step.after:
+                if name not in self.steps:
+                    raise ValueError(f"Step '{step.name}' runs after unknown step '{name}'")
+
+    def stamp_path(self, name):
+        return self.state_dir / f"{name}.done"
+
+    def inputs_of(self, step):
+        """The step's own input files plus the stamps of the steps it runs after."""
+        return step.inputs + [self.stamp_path(name) for name in step.after]
+
+    def outputs_of(self, step):
+        return step.outputs + [self.stamp_path(step.name)]
+
+    def is_up_to_date(self, step):
+        """
+        True if every output exists and is newer than every existing input,
+        and the step has no pending work left.
+        """
+        if step.pending is not None and step.pending():
+            return False
+        output_times = [_mtime(path) for path in self.outputs_of(step)]
+        if any(mtime is None for mtime in output_times):
+            return False
+        input_times = [mtime for mtime in map(_mtime, self.inputs_of(step)) if mtime is not None]
+        return not input_times or min(output_times) >= max(input_times)
+
+    def downstream(self, name):
+        """'name' and every step that (directly or not) runs after it."""
+        names = {name}
+        changed = True
+        while changed:
+            changed = False
+            for step in self.steps.values():
+                if step.name not in names and names.intersection(step.after):
+                    names.add(step.name)
+                    changed = True
+        return names
+
+    def plan(self, only=None, from_step=None):
+        """Returns (steps to consider, steps that must run even if up to date)."""
+        for name in list(only or []) + ([from_step] if from_step else []):
+            if name not in self.steps:
+                raise ValueError(f"Unknown step '{name}'. Steps: {', '.join(self.steps)}")
+        if only:
+            selected = set(only)
+            forced = set(only)
+        elif from_step:
+            selected = self.downstream(from_step)
+            forced = {from_step}
+        else:
+            selected = set(self.steps)
+            forced = set()
+        selected = {name for name in selected if self.steps[name].enabled}
+        return selected, forced & selected
+
+    def _log(self, message):
+        with self.print_lock:
+            print(message)
+
+    def _event(self, name, state, elapsed=None):
+        if self.on_event is not None:
+            self.on_event(name, state, elapsed)
+
+    def _run_step(self, step):
+        started = time.perf_counter()
+        with metrics.step(step.name):
+            success = bool(step.run())
+        if success:
+            stamp = self.stamp_path(step.name)
+            stamp.parent.mkdir(parents=True, exist_ok=True)
+            stamp.touch()
+        return success, time.perf_counter() - started
+
+    def run(self, only=None, from_step=None, force=False):
+        """Runs the selected steps. Returns True if none of them failed."""
+        selected, forced = self.plan(only, from_step)
+        if force:
+            forced = set(selected)
+        self._event("workflow", "started")
+        status = {}  # name -> 'done', 'skipped', 'failed' or 'blocked'
+        running = {}  # future -> step
+
+        def ready(step):
+            # Steps outside the selection count as finished
+            return all(status.get(name) in ('done', 'skipped') or name not in selected for name in step.after)
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while True:
+                for name in self.steps:
+                    step = self.steps[name]
+                    if name not in selected or name in status or step in running.values():
+                        continue
+                    if any(status.get(dep) in ('failed', 'blocked') for dep in step.after):
+                        status[name] = 'blocked'
+                        self._event(name, 'blocked')
+                        self._log(f"\n=== Step '{name}' not run: a step before it failed ===")
+                        continue
+                    if not ready(step):
+                        continue
+                    if name not in forced and self.is_up_to_date(step):
+                        status[name] = 'skipped'
+                        self._event(name, 'skipped')
+                        self._log(f"\n=== Step '{name}' is up to date, skipped ===")
+                        continue
+                    self._log(f"\n=== Step '{name}': {step.description or 'running'} ===")
+                    self._event(name, 'started')
+                    running[executor.submit(self._run_step, step)] = step
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        success, elapsed = future.result()
+                    except Exception as e:
+                        self._log(f"\n=== Step '{step.name}' crashed: {e} ===")
+                        success, elapsed = False, 0.0
+                    status[step.name] = 'done' if success else 'failed'
+                    self._event(step.name, status[step.name], elapsed)
+                    self._log(f"\n=== Step '{step.name}' {'finished' if success else 'FAILED'} ({elapsed:.1f}s) ===")
+
+        failed = [name for name, state in status.items() if state in ('failed', 'blocked')]
+        if failed:
+            self._log(f"\nWorkflow stopped: {', '.join(failed)} did not complete.")
+        self._event("workflow", 'failed' if failed else 'done')
+        return not failed
+
+
+class EventLog:
+    """on_event for Workflow: appends every event as one JSON line to 'path'."""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def __call__(self, name, state, elapsed=None):
+        event = {'time': datetime.now().isoformat(timespec='seconds'), 'step': name, 'state': state}
+        if elapsed is not None:
+            event['elapsed'] = round(elapsed, 3)
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event) + "\n")
+
+
+def read_events(path):
+    """The events written by EventLog, oldest first ([] if there are none yet)."""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,291 @@
+# benchmarks/run.py
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Offline benchmark of the workflow steps.
+#
+#   python -m benchmarks.run                          # 100, 1k and 10k rows, every stage
+#   python -m benchmarks.run --sizes 100 1000 --stages clean scrape
+#   python -m benchmarks.run --latency 80             # add 80 ms per stub answer
+#   python -m benchmarks.run --history                # stored results, newest last
+#
+# For every size a synthetic export is written and a StubServer replays the
+# SICAP and PNRR answers. Each stage runs in its own process, in workflow
+# order, against the same run folder (like run_workflow.py), so its peak
+# RSS is its own. The results are appended to RESULTS_PATH with the git
+# version, and compared with the last run of another version, so a
+# slowdown shows up next to the change that caused it.
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_PATH = Path(__file__).resolve().parent / "results.jsonl"
+RESULT_PREFIX = "BENCHMARK_RESULT "
+DEFAULT_SIZES = [100, 1000, 10000]
+# Slower than the baseline by more than this share (and this many seconds) is flagged
+REGRESSION_THRESHOLD = 0.10
+REGRESSION_MIN_SECONDS = 0.1
+
+# Stage name -> (module, function), in workflow order
+STAGES = {
+    'clean': ('app.cleaning', 'clean_excel_file'),
+    'scrape': ('app.scraping', 'run_scraper'),
+    'split': ('app.cleaning', 'split_valid_codes_by_cui'),
+    'beneficiaries': ('app.pnrr_scraper', 'run_beneficiary_scraper'),
+    'reports': ('app.cleaning', 'export_reports'),
+    'generate': ('app.doc_generator', 'run_document_generation'),
+}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB (None if unknown)."""
+    try:
+        import resource
+    except ImportError:
+        # Windows: psutil is optional
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 2**20, 1)
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (2**20 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_version():
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BASE_DIR,
+                                capture_output=True, text=True, timeout=30)
+        return result.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+# --- One stage (child process) ---
+
+def run_stage(stage):
+    """Runs one stage in this process and prints its result line."""
+    # Imported here: the configuration is read from the environment the parent set up
+    from app.utils.metrics import metrics
+    from app.utils.config import METRICS_PATH
+
+    module_name, function_name = STAGES[stage]
+    function = getattr(importlib.import_module(module_name), function_name)
+    metrics.start_run(METRICS_PATH)
+    started = time.perf_counter()
+    with metrics.step(stage):
+        success = bool(function())
+    seconds = time.perf_counter() - started
+    summary = metrics.summary().get(stage, {})
+    result = {
+        'success': success,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'phases': summary.get('phases', {}),
+        'counters': summary.get('counters', {}),
+    }
+    print(RESULT_PREFIX + json.dumps(result))
+    return success
+
+
+# --- One size (parent process) ---
+
+def stage_environment(run_dir, input_path, stub_url, args):
+    cookie_path = run_dir / "cookies.json"
+    # The stub ignores the cookie, but the PNRR step only uses the backend with one
+    cookie = {'name': "SESSION", 'value': "benchmark", 'domain': "127.0.0.1", 'path': "/"}
+    cookie_path.write_text(json.dumps([cookie]), encoding='utf-8')
+    return dict(
+        os.environ,
+        RUN_DIR=str(run_dir),
+        CACHE_DIR=str(run_dir / "cache"),  # Empty caches: every lookup goes to the stub
+        INPUT_FILE_PATH=str(input_path),
+        SESSION_COOKIE_PATH=str(cookie_path),
+        SICAP_API_BASE_URL=stub_url,
+        PNRR_API_BASE_URL=stub_url,
+        SICAP_LOOKUP_MODE="api",
+        SICAP_API_RATE_LIMIT=str(args.rate_limit),
+        PNRR_USE_API="1",
+        EXPORT_EXCEL="0",
+        DOC_OUTPUT_MODE="files",
+        PYTHONUNBUFFERED="1",
+    )
+
+
+def benchmark_size(size, stages, work_dir, args):
+    """Runs the stages on a synthetic export of 'size' rows. Returns a list of result records."""
+    # Imported here so 'python -m benchmarks.run --history' works without the app's dependencies
+    from benchmarks.stub_server import StubServer
+    from benchmarks.synthetic import write_export
+
+    run_dir = work_dir / f"rows_{size}"
+    if run_dir.exists():
+        # A folder kept from an earlier run (--work-dir) has warm caches and a manifest
+        shutil.rmtree(run_dir)
+    run_dir.mkdir(parents=True)
+    input_path = write_export(run_dir / "export.xlsx", size, seed=args.seed)
+    print(f"\n=== {size} rows ({input_path}) ===")
+
+    results = []
+    # About four rows per supplier, like the real exports
+    with StubServer(companies=max(1, size // 4), latency=args.latency / 1000) as stub:
+        env = stage_environment(run_dir, input_path, stub.url, args)
+        for stage in stages:
+            log_path = run_dir / f"{stage}.log"
+            requests_before = stub.requests
+            with open(log_path, 'w', encoding='utf-8') as log:
+                process = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.run", "--child", stage],
+                    cwd=str(BASE_DIR), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                )
+                log.write(process.stdout)
+            result_lines = [line for line in process.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+            if not result_lines:
+                print(f"  {stage:<14} CRASHED (exit code {process.returncode}), see {log_path}")
+                break
+            result = json.loads(result_lines[-1][len(RESULT_PREFIX):])
+            result.update({
+                'size': size,
+                'stage': stage,
+                'rows_per_sec': round(size / result['seconds'], 1) if result['seconds'] else None,
+                'stub_requests': stub.requests - requests_before,
+            })
+            results.append(result)
+            print(f"  {stage:<14} {result['seconds']:>9.2f}s {result['rows_per_sec'] or 0:>10.1f} rows/s "
+                  f"{result['peak_rss_mb'] or 0:>8.1f} MB peak")
+            if not result['success']:
+                print(f"  > {stage} reported a failure, see {log_path}. Later stages skipped.")
+                break
+    return results
+
+
+# --- Stored results ---
+
+def load_results(path=RESULTS_PATH):
+    if not Path(path).exists():
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_results(records, path=RESULTS_PATH):
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _comparable(record, other):
+    keys = ('size', 'stage', 'latency_ms', 'rate_limit')
+    return all(record.get(key) == other.get(key) for key in keys) and other.get('success')
+
+
+def find_baseline(record, history):
+    """The latest earlier result of another version for the same size, stage and stub settings
+    (or of the same version if there is no other)."""
+    candidates = [other for other in history if _comparable(record, other)]
+    other_versions = [other for other in candidates if other['version'] != record['version']]
+    return (other_versions or candidates or [None])[-1]
+
+
+def print_comparison(records, history):
+    print(f"\n{'rows':>7} {'stage':<14}{'seconds':>10}{'rows/s':>11}{'peak MB':>9}   vs baseline")
+    for record in records:
+        baseline = find_baseline(record, history)
+        if baseline is None:
+            comparison = "(no baseline)"
+        else:
+            change = (record['seconds'] - baseline['seconds']) / baseline['seconds'] if baseline['seconds'] else 0.0
+            slower = record['seconds'] - baseline['seconds'] > REGRESSION_MIN_SECONDS
+            flag = "  SLOWER" if change > REGRESSION_THRESHOLD and slower else ""
+            comparison = f"{change:+.0%} vs {baseline['version']} ({baseline['seconds']:.2f}s){flag}"
+        print(f"{record['size']:>7} {record['stage']:<14}{record['seconds']:>10.2f}"
+              f"{record['rows_per_sec'] or 0:>11.1f}{record['peak_rss_mb'] or 0:>9.1f}   {comparison}")
+
+
+def print_history(history):
+    print(f"{'run':<17}{'version':<22}{'rows':>7} {'stage':<14}{'seconds':>10}{'rows/s':>11}{'peak MB':>9}")
+    for record in history:
+        print(f"{record['run']:<17}{record['version']:<22}{record['size']:>7} {record['stage']:<14}"
+              f"{record['seconds']:>10.2f}{record['rows_per_sec'] or 0:>11.1f}{record['peak_rss_mb'] or 0:>9.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Times the workflow stages offline, against a local stub server.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, metavar="ROWS",
+                        help="synthetic export sizes (default: 100 1000 10000)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES), metavar="STAGE",
+                        help=f"stages to time, run in workflow order ({', '.join(STAGES)})")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS",
+                        help="milliseconds the stub waits before every answer")
+    parser.add_argument("--rate-limit", type=float, default=1000.0, metavar="REQ_PER_SEC",
+                        help="SICAP_API_RATE_LIMIT for the run (default 1000, i.e. not the bottleneck)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic exports")
+    parser.add_argument("--work-dir", type=Path, help="keep the run folders here (default: a temporary folder); "
+                             "its rows_<N> folders are recreated on every run")
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH, help="JSON lines file the results go to")
+    parser.add_argument("--no-save", action="store_true", help="don't store the results")
+    parser.add_argument("--history", action="store_true", help="show the stored results and exit")
+    parser.add_argument("--child", choices=list(STAGES), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        return 0 if run_stage(args.child) else 1
+    if args.history:
+        print_history(load_results(args.results))
+        return 0
+
+    # Stages always run in workflow order: each one reads what the previous one stored
+    stages = [stage for stage in STAGES if stage in args.stages]
+    history = load_results(args.results)
+    run_info = {
+        'run': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'version': git_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(terse=True),
+        'latency_ms': args.latency,
+        'rate_limit': args.rate_limit,
+        'seed': args.seed,
+    }
+    print(f"Benchmark {run_info['run']} of version {run_info['version']}: "
+          f"sizes {args.sizes}, stages {', '.join(stages)}")
+
+    if args.work_dir:
+        work_dir = args.work_dir
+        work_dir.mkdir(parents=True, exist_ok=True)
+        temporary = None
+    else:
+        temporary = tempfile.TemporaryDirectory(prefix="benchmark_")
+        work_dir = Path(temporary.name)
+
+    records = []
+    try:
+        for size in args.sizes:
+            records += [{**run_info, **result} for result in benchmark_size(size, stages, work_dir, args)]
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+
+    if records:
+        print_comparison(records, history)
+        if not args.no_save:
+            save_results(records, args.results)
+            print(f"\nResults appended to: {args.results}")
+    return 0 if records and all(record['success'] for record in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# benchmarks/stub_server.py
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from app.utils.config import SICAP_API_MAP, PNRR_API
+
+# Local stand-in for the e-licitatie.ro and coordonare.pnrr.gov.ro JSON
+# endpoints, so the workflow can be timed without touching the live portals.
+# It replays the responses in benchmarks/fixtures/ with the requested code
+# filled in:
+#
+#   POST /api-pub/...                     SICAP list search (sicap_<TYPE>.json)
+#   GET  /api/acquisitions/companies/CUI  PNRR company page (pnrr_company.json)
+#   POST /api/acquisitions/search         PNRR acquisition search
+#
+# The fixtures are synthetic, not recorded: the PNRR ones follow the guessed
+# PNRR_API schema in app/utils/config.py (see the README).
+#
+# Every answer is derived from a checksum of the code, so runs are
+# repeatable: about 1 in NOT_FOUND_EVERY codes has no SICAP result, and
+# suppliers are drawn from 'companies' CUIs (so PNRR pages repeat).
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+NOT_FOUND_EVERY = 20
+SICAP_FILTER_FIELDS = sorted({api_config['filter_field'] for api_config in SICAP_API_MAP.values()})
+CODE_TYPE_PATTERN = re.compile(r'^[A-Z]+')
+
+
+def _checksum(text):
+    return zlib.crc32(str(text).encode('utf-8'))
+
+
+def render_fixture(template, values):
+    """Replaces every "{{name}}" string of a fixture by the JSON value of values[name]."""
+    for name, value in values.items():
+        template = template.replace(f'"{{{{{name}}}}}"', json.dumps(value, ensure_ascii=False))
+        template = template.replace(f'{{{{{name}}}}}', str(value))
+    return template
+
+
+class StubServer:
+    """
+    Runs the stub on 127.0.0.1 in a background thread.
+    'latency' (seconds) is added to every response, to imitate the portals.
+    """
+    def __init__(self, companies=500, latency=0.0, port=0):
+        self.companies = max(1, companies)
+        self.latency = latency
+        self.fixtures = {path.stem: path.read_text(encoding='utf-8') for path in FIXTURES_DIR.glob("*.json")}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # --- Responses ---
+
+    def supplier_cui(self, code):
+        return str(10000000 + _checksum(code) % self.companies)
+
+    def sicap_response(self, payload):
+        code = next((str(payload[field]) for field in SICAP_FILTER_FIELDS if payload.get(field)), "")
+        match = CODE_TYPE_PATTERN.match(code)
+        id_type = match.group(0) if match else ""
+        checksum = _checksum(code)
+        if not match or checksum % NOT_FOUND_EVERY == 0:
+            return self.fixtures['sicap_empty']
+        fixture = self.fixtures.get(f"sicap_{'CN' if id_type == 'SCN' else id_type}")
+        if fixture is None:
+            return self.fixtures['sicap_empty']
+        cui = self.supplier_cui(code)
+        estimated = round(1000 + checksum % 500000 + (checksum % 100) / 100, 2)
+        return render_fixture(fixture, {
+            'code': code,
+            'view_id': 100000000 + checksum % 900000000,
+            'authority': f"AUTORITATEA CONTRACTANTA {checksum % 300}",
+            'supplier': f"{cui} SC FURNIZOR {cui} SRL",
+            'estimated': estimated,
+            'closing': round(estimated * 0.9, 2),
+        })
+
+    def company_response(self, cui):
+        checksum = _checksum(cui)
+        beneficiaries = [
+            {'name': f"BENEFICIAR {cui}-{number}", 'procentDetinere': round(100 / (checksum % 3 + 1), 2)}
+            for number in range(1, checksum % 3 + 2)
+        ]
+        return render_fixture(self.fixtures['pnrr_company'], {
+            'cui': cui,
+            'denumire': f"SC FURNIZOR {cui} SRL",
+            'beneficiaries': beneficiaries,
+        })
+
+    def acquisition_response(self, payload):
+        code = str(payload.get(PNRR_API['acquisition_filter_field'], ""))
+        return render_fixture(self.fixtures['pnrr_acquisition_search'], {
+            'code': code,
+            'acquisition_id': 1 + _checksum(code) % 1000000,
+        })
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real sites
+            # Headers and body go out in separate writes: with Nagle's algorithm
+            # (and the client's delayed ACK) that adds ~40 ms to every answer
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass  # One line per request would drown the benchmark output
+
+            def _payload(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b""
+                try:
+                    return json.loads(body or b"{}")
+                except ValueError:
+                    return {}
+
+            def _reply(self, status, body):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    stub.requests += 1
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=UTF-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                payload = self._payload()
+                if self.path.startswith("/api-pub/"):
+                    self._reply(200, stub.sicap_response(payload))
+                elif self.path.startswith("/api/acquisitions/search"):
+                    self._reply(200, stub.acquisition_response(payload))
+                else:
+                    self._reply(404, json.dumps({'error': f"No stub for POST {self.path}"}))
+
+            def do_GET(self):
+                match = re.match(r'^/api/acquisitions/companies/(\w+)', self.path)
+                if match:
+                    self._reply(200, stub.company_response(match.group(1)))
+                else:
+                    self._reply(404, json.dumps({'error': f"No stub for GET {self.path}"}))
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # Stand-alone, e.g. to point a normal run at it:
+    #   SICAP_API_BASE_URL=http://127.0.0.1:8765 PNRR_API_BASE_URL=http://127.0.0.1:8765 python run_workflow.py
+    server = StubServer(port=8765).start()
+    print(f"Stub server on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,82 @@
+# benchmarks/synthetic.py
+import random
+from openpyxl import Workbook
+
+# Synthetic exports with the columns of the real "export_achizitii" workbook.
+# The SICAP ID column mixes the cases the cleaning step meets in practice:
+# clean codes, codes with spaces or text around them, repeated codes
+# (several contracts of one procedure) and cells without any code.
+
+EXPORT_HEADER = (
+    'Nr. crt', 'Apel', 'Nr. anunt SICAP', 'Tip procedură', 'Număr contract',
+    'Data semnării contractului', 'Valoare integrală contract', 'Acord cadru',
+    'Criteriu atribuire', 'Lider asociere', 'Terț susținător', 'Subcontractant',
+    'Tip achizitie', 'Stare achiziție', 'Data ultimei transmiteri', 'Nume proiect',
+    'Nume aplicant', 'CUI', 'CUI autoritate contractantă', 'Denumire autoritate contractantă',
+)
+
+# Share of each code type in the real exports (roughly)
+CODE_TYPES = [('DA', 60), ('DAN', 20), ('CN', 10), ('SCN', 5), ('ADV', 5)]
+INVALID_VALUES = [None, "", "N/A", "in curs de publicare", "-"]
+APELURI = [
+    "PNRR/2022/C9/MCID/I8./Dezvoltarea unui program pentru atragerea resurselor umane înalt specializate",
+    "PNRR/2022/C9/MCID/I10./Înființarea și susținerea financiară a unei rețele naționale de centre regionale",
+    "PNRR/2023/C15/MEC/I4./Dotarea laboratoarelor școlare",
+]
+
+
+def _sicap_cell(rng, previous_codes):
+    """One raw value of the SICAP ID column."""
+    roll = rng.random()
+    if roll < 0.04:
+        return rng.choice(INVALID_VALUES)
+    if roll < 0.09 and previous_codes:
+        return rng.choice(previous_codes)  # Another contract of the same procedure
+    id_type = rng.choices([code for code, _ in CODE_TYPES], weights=[weight for _, weight in CODE_TYPES])[0]
+    code = f"{id_type}{rng.randint(1000000, 99999999)}"
+    previous_codes.append(code)
+    if roll < 0.14:
+        return f"{code[:len(id_type)]} {code[len(id_type):]}"  # "DA 38262087"
+    if roll < 0.17:
+        return f"Anunt {code} / lot 1"
+    return code
+
+
+def make_rows(count, seed=0):
+    """Yields 'count' export rows (tuples in EXPORT_HEADER order), the same for the same seed."""
+    rng = random.Random(seed)
+    previous_codes = []
+    for number in range(1, count + 1):
+        authority = rng.randint(1, 300)
+        applicant_cui = str(4000000 + authority)
+        yield (
+            float(number),
+            rng.choice(APELURI),
+            _sicap_cell(rng, previous_codes),
+            'Achiziție directă',
+            f"{rng.randint(1, 20000)}",
+            f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            round(rng.uniform(500, 900000), 2),
+            rng.choice(['Da', 'Nu']),
+            'Preţul cel mai scăzut',
+            'Da', 'Nu', 'Nu',
+            'Publică',
+            'Transmisă',
+            '2025-10-20',
+            f"Proiect de cercetare {rng.randint(1, 2000)}",
+            f"UNIVERSITATEA {authority}",
+            applicant_cui,
+            applicant_cui,
+            f"UNIVERSITATEA {authority}",
+        )
+
+
+def write_export(path, count, seed=0):
+    """Writes a synthetic export workbook with 'count' rows to 'path'."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(EXPORT_HEADER)
+    for row in make_rows(count, seed):
+        sheet.append(row)
+    workbook.save(path)
+    return path
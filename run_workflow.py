@@ -1,51 +1,137 @@
 # run_workflow.py
-from app.cleaning import clean_excel_file, split_valid_codes_by_cui
+import argparse
+import sys
+from app.cleaning import clean_excel_file, split_valid_codes_by_cui, export_reports
 from app.scraping import run_scraper
 from app.pnrr_scraper import run_beneficiary_scraper
-# --- 1. ADD NEW IMPORTS ---
-from app.doc_generator import run_document_generation
-from app.utils.config import VALID_CODES_WITH_CUI_PATH_TEST, VALID_CODES_WITH_CUI_PATH, VALID_CODES_NO_CUI_PATH
+from app.doc_generator import run_document_generation, TEMPLATES
+from app.processing.pdf_handler import run_pdf_generation
+from app.utils.tables import table_path
+from app.workflow import Step, Workflow, EventLog
+from app.database.db_manager import AcquisitionStore
+from app.utils.metrics import metrics
+from app.utils.config import (
+    GENERATE_PDFS,
+    INPUT_FILE_PATH,
+    INVALID_FILE_PATH,
+    VALID_FILE_PATH,
+    VALID_CODES_WITH_CUI_PATH,
+    VALID_CODES_NO_CUI_PATH,
+    INTERMEDIATE_FORMAT,
+    GENERATION_REPORT_PATH,
+    WORKFLOW_STATE_DIR,
+    WORKFLOW_MAX_PARALLEL,
+    WORKFLOW_EVENTS_PATH,
+    METRICS_PATH,
+    ACQUISITION_DB_PATH,
+)
 
-def main_workflow():
+
+def _store_has_pending(*queries):
+    """
+    A Step 'pending' check: True if any of the store's '..._to_...' queries
+    returns something. Those queries only return lookups that are missing or
+    failed for a temporary reason; lookups that finished without a result (a
+    SICAP ID with 0 results, a company without beneficiaries, an acquisition
+    not on PNRR) are done, so they never keep a step out of date.
+    """
+    def pending():
+        if not ACQUISITION_DB_PATH.exists():
+            return False
+        store = AcquisitionStore()
+        try:
+            return any(getattr(store, query)() for query in queries)
+        finally:
+            store.close()
+    return pending
+
+
+def build_workflow(use_celery=False):
+    """
+    The workflow steps, in dependency order:
+
+        clean -> scrape -> split -> beneficiaries -> reports
+                                                 -> generate -> pdfs
+
+    'reports' and 'generate' don't depend on each other and run in parallel.
+    'scrape' and 'beneficiaries' also run again while the store still has
+    lookups that failed for a temporary reason.
+    Changing a template only makes 'generate' (and 'pdfs') out of date.
+    With 'use_celery' the lookups and the rendering are fanned out to the
+    Celery workers (see app/tasks.py).
+    """
+    scrape, beneficiaries, generate = run_scraper, run_beneficiary_scraper, run_document_generation
+    if use_celery:
+        # Imported here so the normal run doesn't need Celery installed
+        from app.tasks import (
+            run_scraper_with_celery,
+            run_beneficiary_scraper_with_celery,
+            run_document_generation_with_celery,
+        )
+        scrape = run_scraper_with_celery
+        beneficiaries = run_beneficiary_scraper_with_celery
+        generate = run_document_generation_with_celery
+
+    steps = [
+        Step("clean", clean_excel_file,
+             inputs=[INPUT_FILE_PATH], outputs=[INVALID_FILE_PATH],
+             description="Cleaning the export"),
+        Step("scrape", scrape, after=["clean"],
+             pending=_store_has_pending('sicap_ids_to_scrape'),
+             description="Scraping SICAP"),
+        Step("split", split_valid_codes_by_cui, after=["scrape"],
+             description="Splitting rows by CUI"),
+        Step("beneficiaries", beneficiaries, after=["split"],
+             pending=_store_has_pending('companies_to_scrape', 'acquisitions_to_search'),
+             description="Scraping beneficiary data (PNRR)"),
+        Step("reports", export_reports, after=["beneficiaries"],
+             outputs=[table_path(path, INTERMEDIATE_FORMAT)
+                      for path in (VALID_FILE_PATH, VALID_CODES_WITH_CUI_PATH, VALID_CODES_NO_CUI_PATH)],
+             description="Exporting reports"),
+        Step("generate", generate, after=["beneficiaries"],
+             inputs=[template_path for _, template_path in TEMPLATES], outputs=[GENERATION_REPORT_PATH],
+             description="Generating documents"),
+        Step("pdfs", run_pdf_generation, after=["generate"], enabled=GENERATE_PDFS,
+             description="PDF conversion, OCR and merge"),
+    ]
+    return Workflow(steps, WORKFLOW_STATE_DIR, max_parallel=WORKFLOW_MAX_PARALLEL,
+                    on_event=EventLog(WORKFLOW_EVENTS_PATH))
+
+
+def main_workflow(only=None, from_step=None, force=False, use_celery=False):
     print("--- Workflow Started ---")
-    
-    # --- STEP 1: CLEANING ---
-    step_1_success = clean_excel_file()
-    if not step_1_success:
-        print("Workflow stopped: Cleaning step failed.")
-        return
-
-    # --- STEP 2: SCRAPING ---
-    step_2_success = run_scraper()
-    if not step_2_success:
-        print("Workflow stopped: Scraping step failed.")
-        return
-
-    # --- STEP 3: SPLIT CUI FILE ---
-    print("\n--- Step 3: Splitting file by CUI ---")
-    step_3_success = split_valid_codes_by_cui()
-    if not step_3_success:
-        print("Workflow stopped: CUI splitting step failed.")
-        return
-
-    # --- STEP 4: SCRAPE BENEFICIARIES ---
-    print("\n--- Step 4: Scraping Beneficiary Data (PNRR) ---")
-    step_4_success = run_beneficiary_scraper()
-    if not step_4_success:
-        print("Workflow stopped: Beneficiary scraping step failed.")
-        return
-
-    # --- 2. UPDATE STEP 5 ---
-    print("\n--- Step 5: Document Generation ---")
-    # We create a list of all files we want to process.
-    files_to_process = [VALID_CODES_WITH_CUI_PATH]
-    
-    step_5_success = run_document_generation(files_to_process)
-    if not step_5_success:
-        print("Workflow stopped: Document generation step failed.")
-        return
-
-    print("\n--- Workflow Finished ---")
+    metrics.start_run(METRICS_PATH)
+    success = build_workflow(use_celery).run(only=only, from_step=from_step, force=force)
+    metrics.print_summary()
+    if success:
+        print("\n--- Workflow Finished ---")
+    return success
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs the acquisition workflow.")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--from", dest="from_step", metavar="STEP",
+                           help="run this step and every step after it")
+    selection.add_argument("--only", nargs="+", metavar="STEP",
+                           help="run only these steps")
+    parser.add_argument("--force", action="store_true",
+                        help="run the selected steps even if they are up to date")
+    parser.add_argument("--celery", action="store_true",
+                        help="fan the lookups and the rendering out to the Celery workers")
+    parser.add_argument("--list", action="store_true",
+                        help="show the steps and whether they are up to date, then exit")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    main_workflow()
\ No newline at end of file
+    args = parse_args()
+    if args.list:
+        workflow = build_workflow()
+        for step in workflow.steps.values():
+            state = "disabled" if not step.enabled else ("up to date" if workflow.is_up_to_date(step) else "to run")
+            after = f" (after {', '.join(step.after)})" if step.after else ""
+            print(f"{step.name:<14} {state:<11} {step.description}{after}")
+    else:
+        success = main_workflow(only=args.only, from_step=args.from_step, force=args.force, use_celery=args.celery)
+        sys.exit(0 if success else 1)